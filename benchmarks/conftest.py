@@ -0,0 +1,14 @@
+import pytest
+
+from ldndc2nc.synthetic import columns, write_ldndc_file
+
+
+@pytest.fixture(scope="session", params=[".txt", ".txt.gz"])
+def ldndc_file(request, tmp_path_factory):
+    fname = (
+        tmp_path_factory.mktemp("data")
+        / f"GLOBAL_000_soilchemistry-daily{request.param}"
+    )
+    datacols = columns("soilchemistry-daily.txt")
+    nrows = write_ldndc_file(fname, range(1, 201), [2000, 2001], datacols)
+    return fname, nrows
@@ -0,0 +1,137 @@
+"""benchmark the conversion stages at several scales of synthetic input
+
+    LDNDC2NC_BENCH_SCALES=small,medium,large pytest benchmarks/test_bench_convert.py
+
+throughput and peak memory (tracemalloc) are reported in extra_info
+"""
+
+import os
+import shutil
+import tracemalloc
+from functools import partial
+from types import SimpleNamespace
+
+import pytest
+import xarray as xr
+
+from ldndc2nc.compression import supported_codecs
+from ldndc2nc.grid import GridIndex, grid_cache
+from ldndc2nc.ldndc2nc import (
+    _read_grid,
+    _write_netcdf,
+    _year_dataset,
+    create_id_mapper,
+    read_ldndc_txt,
+)
+from ldndc2nc.synthetic import generate, variables
+
+pytest.importorskip("pytest_benchmark")
+
+# cells, years, files per file type
+SCALES = {
+    "small": (100, [2000], 1),
+    "medium": (500, [2000, 2001], 2),
+    "large": (2000, [2000, 2001], 4),
+}
+
+# scales to run (large takes a few minutes)
+RUN_SCALES = os.environ.get("LDNDC2NC_BENCH_SCALES", "small,medium").split(",")
+
+ROUNDS = 3
+
+
+def peak_memory(func, *args):
+    """ peak memory (MB) allocated by one call of func """
+    tracemalloc.start()
+    try:
+        func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 2 ** 20
+
+
+def run(benchmark, func, *args):
+    result = benchmark.pedantic(func, args=args, rounds=ROUNDS, iterations=1)
+    benchmark.extra_info["peak_mb"] = peak_memory(func, *args)
+    return result
+
+
+def throughput(benchmark, **amounts):
+    """ store every amount per second (mean time of a round) in extra_info """
+    # no stats if benchmarks are disabled (--benchmark-disable, xdist)
+    if benchmark.stats:
+        for key, amount in amounts.items():
+            benchmark.extra_info[key] = amount / benchmark.stats.stats.mean
+
+
+@pytest.fixture(scope="module", params=RUN_SCALES)
+def scale(request, tmp_path_factory):
+    ncells, years, nfiles = SCALES[request.param]
+    indir = tmp_path_factory.mktemp(request.param)
+    refdata, nrows = generate(indir, ncells, years, nfiles=nfiles, compress=True)
+    varData = variables()
+
+    with xr.open_dataset(refdata) as refnc:
+        cell_ids = refnc["cid"].where(refnc["cid"] > 0).load()
+    _, df = read_ldndc_txt(indir, varData, years)
+    return SimpleNamespace(
+        indir=indir,
+        refdata=refdata,
+        years=years,
+        nrows=sum(nrows.values()),
+        varData=varData,
+        cell_ids=cell_ids,
+        grid=GridIndex.from_cell_ids(cell_ids),
+        df=df,
+        config=SimpleNamespace(
+            global_info={}, variables=[v for vs in varData.values() for v in vs]
+        ),
+    )
+
+
+def test_read_ldndc_txt(benchmark, scale):
+    _, df = run(benchmark, read_ldndc_txt, scale.indir, scale.varData, scale.years)
+    assert len(df) == len(scale.df)
+    throughput(benchmark, rows_per_s=scale.nrows)
+
+
+def test_create_id_mapper(benchmark, scale):
+    mapper = run(benchmark, create_id_mapper, scale.cell_ids)
+    assert len(mapper) == len(scale.grid.ids)
+    throughput(benchmark, cells_per_s=len(mapper))
+
+
+@pytest.mark.parametrize("cached", [False, True])
+def test_read_grid(benchmark, scale, cached):
+    refinfo = (str(scale.refdata), "cid")
+    entry = grid_cache(scale.refdata, "cid")
+    _read_grid(refinfo)
+
+    def read_grid():
+        if not cached:
+            shutil.rmtree(entry, ignore_errors=True)
+        return _read_grid(refinfo)
+
+    grid = run(benchmark, read_grid)
+    assert len(grid.ids) == len(scale.grid.ids)
+    throughput(benchmark, cells_per_s=len(grid.ids))
+
+
+def test_year_reindex(benchmark, scale):
+    yr = scale.years[0]
+    df = scale.df[scale.df.time.dt.year == yr]
+    ds = run(benchmark, _year_dataset, yr, df, scale.grid, scale.config)
+    throughput(benchmark, rows_per_s=len(df), mb_per_s=ds.nbytes / 2 ** 20)
+
+
+@pytest.mark.parametrize("codec", supported_codecs())
+def test_write_netcdf(benchmark, scale, tmp_path, codec):
+    yr = scale.years[0]
+    df = scale.df[scale.df.time.dt.year == yr]
+    ds = _year_dataset(yr, df, scale.grid, scale.config)
+    fname = tmp_path / "outfile.nc"
+    write = partial(_write_netcdf, options={"codec": codec})
+    run(benchmark, write, ds, fname, scale.config)
+    benchmark.extra_info["ratio"] = ds.nbytes / fname.stat().st_size
+    throughput(benchmark, mb_per_s=ds.nbytes / 2 ** 20)
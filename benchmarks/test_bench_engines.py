@@ -0,0 +1,20 @@
+"""benchmark the parse engines: pytest benchmarks --benchmark-group-by=param"""
+
+import pytest
+
+from ldndc2nc.engines import read_table
+from ldndc2nc.synthetic import columns
+
+pytest.importorskip("pytest_benchmark")
+
+
+@pytest.mark.parametrize("engine", ["pandas", "arrow", "mmap"])
+def test_read_table(benchmark, ldndc_file, engine):
+    if engine == "arrow":
+        pytest.importorskip("pyarrow")
+    fname, nrows = ldndc_file
+    df = benchmark(read_table, fname, columns("soilchemistry-daily.txt"), engine=engine)
+    assert len(df) == nrows
+    # no stats if benchmarks are disabled (--benchmark-disable, xdist)
+    if benchmark.stats:
+        benchmark.extra_info["rows_per_s"] = nrows / benchmark.stats.stats.mean
@@ -0,0 +1,39 @@
+"""benchmark the startup of the command line interface
+
+    pytest benchmarks/test_bench_startup.py
+
+every round starts a new interpreter, the import of the conversion module
+(numpy, pandas, xarray, netCDF4) is timed for reference
+"""
+
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+ROUNDS = 5
+
+COMMANDS = {
+    "help": ["-m", "ldndc2nc", "--help"],
+    "batch-help": ["-m", "ldndc2nc", "batch", "--help"],
+    "argument-error": ["-m", "ldndc2nc", "-y", "2000-x", "indir", "outdir"],
+    "chunk-size-error": ["-m", "ldndc2nc", "--chunk-size", "x", "indir", "outdir"],
+    "import-conversion": ["-c", "import ldndc2nc.ldndc2nc"],
+}
+
+
+def run(argv):
+    return subprocess.run(
+        [sys.executable] + argv, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    ).returncode
+
+
+@pytest.mark.parametrize("command", list(COMMANDS))
+def test_startup(benchmark, command):
+    run(COMMANDS[command])  # warm up the file system cache
+    returncode = benchmark.pedantic(
+        run, args=(COMMANDS[command],), rounds=ROUNDS, iterations=1
+    )
+    assert (returncode == 0) == (not command.endswith("error"))
@@ -12,7 +12,7 @@ try:
     __version__ = importlib_metadata.version(__name__)
 except importlib_metadata.PackageNotFoundError:
     # package is not installed
-    pass
+    __version__ = "unknown"
 
 
 # silent exit hook
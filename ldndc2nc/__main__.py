@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 """ldndc2nc.__main__: executed when ldndc2nc directory is called as script."""
 
-from .ldndc2nc import main
+from .cli import main
 
 main()
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""ldndc2nc.aggregate: monthly and annual aggregates of the daily output."""
+
+import copy
+import logging
+from types import SimpleNamespace
+
+log = logging.getLogger(__name__)
+
+# aggregated products and their resample frequency (labelled by period start)
+PRODUCTS = {"monthly": "MS", "annual": "AS"}
+
+# aggregation methods of a variable (conf option aggregate)
+METHODS = ["sum", "mean"]
+DEFAULT_METHOD = "mean"
+
+
+def check_products(products):
+    """ validate names of aggregated products (raises ValueError) """
+    unknown = set(products) - set(PRODUCTS)
+    if unknown:
+        raise ValueError(log.critical(f"Aggregates {sorted(unknown)} not supported"))
+
+
+def aggregate(ds, variables, product):
+    """ aggregate the daily data variables of ds to a product
+
+        Sums of periods without any data stay NaN (i.e. outside the simulated
+        cells). The units of the variables are kept and the aggregation is
+        recorded in the cell_methods attribute.
+
+        :param xr.Dataset ds: daily dataset (one or more full years)
+        :param list variables: variables with their aggregation method
+        :param str product: monthly or annual
+        :return: aggregated dataset
+        :rtype: xr.Dataset
+    """
+    import xarray as xr
+
+    methods = {var.name: var.aggregate or DEFAULT_METHOD for var in variables}
+    units = {var.name: var.unit for var in variables if var.unit}
+
+    data_vars = {}
+    for v in ds.data_vars:
+        method = methods.get(v, DEFAULT_METHOD)
+        resampled = ds[v].resample(time=PRODUCTS[product])
+        if method == "sum":
+            da = resampled.sum(min_count=1, keep_attrs=True)
+        else:
+            da = resampled.mean(keep_attrs=True)
+        if v in units:
+            da.attrs["units"] = units[v]
+        da.attrs["cell_methods"] = f"time: {method}"
+        data_vars[v] = da
+
+    # keep coordinates without time dimension (e.g. lat, lon of land points)
+    coords = {k: c for k, c in ds.coords.items() if "time" not in c.dims}
+    return xr.Dataset(data_vars, coords=coords, attrs=ds.attrs)
+
+
+def product_config(config):
+    """ conf of aggregated products (values are not packed to int dtypes)
+
+        :param config: conf with global info and variables
+        :return: conf with global info and variables
+        :rtype: SimpleNamespace
+    """
+    variables = []
+    for var in config.variables:
+        var = copy.copy(var)
+        if (var.dtype or "").startswith("int"):
+            var.dtype = var.memory_dtype
+            var.scale_factor = var.add_offset = None
+        variables.append(var)
+    return SimpleNamespace(global_info=config.global_info, variables=variables)
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""ldndc2nc.batch: convert the jobs of a manifest with shared conf and refdata."""
+
+import copy
+import csv
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import yaml
+
+from .cli import year_range
+
+log = logging.getLogger(__name__)
+
+# keys of a job in the manifest (indir and outdir are required)
+JOB_KEYS = ["indir", "outdir", "outfile", "years", "limiter"]
+
+# conf and grid shared by the jobs of a worker process
+_shared = {}
+
+
+def read_manifest(fname):
+    """ read the jobs of a YAML (list of jobs or jobs section) or CSV manifest
+
+        Relative directories are relative to the manifest.
+
+        :param Path fname: manifest file (.yml, .yaml or .csv)
+        :return: job per entry (dict of JOB_KEYS)
+        :rtype: list
+    """
+    fname = Path(fname)
+    if fname.suffix.lower() in [".yml", ".yaml"]:
+        with open(fname) as f:
+            jobs = yaml.safe_load(f)
+        if isinstance(jobs, dict):
+            jobs = jobs.get("jobs")
+    elif fname.suffix.lower() == ".csv":
+        with open(fname, newline="") as f:
+            jobs = [
+                {k: v for k, v in row.items() if v not in [None, ""]}
+                for row in csv.DictReader(f)
+            ]
+    else:
+        raise ValueError(log.critical(f"Manifest {fname} is no YAML or CSV file"))
+
+    if not jobs or not all(isinstance(job, dict) for job in jobs):
+        raise ValueError(log.critical(f"No jobs in manifest {fname}"))
+
+    for i, job in enumerate(jobs):
+        unknown = set(job) - set(JOB_KEYS)
+        if unknown:
+            raise ValueError(
+                log.critical(f"Unknown keys of job {i}: {sorted(unknown)}")
+            )
+        missing = [k for k in ["indir", "outdir"] if k not in job]
+        if missing:
+            raise ValueError(log.critical(f"Job {i} lacks {missing}"))
+        for k in ["indir", "outdir"]:
+            job[k] = str(fname.parent / job[k])
+    return jobs
+
+
+def read_jobs(args):
+    """ conversion options of the jobs of the manifest of args
+
+        :return: conversion options per job
+        :rtype: list
+    """
+    jobs = [job_args(job, args) for job in read_manifest(args.manifest)]
+    outputs = [(Path(job.outdir) / job.outfile).resolve() for job in jobs]
+    duplicates = sorted({str(o) for o in outputs if outputs.count(o) > 1})
+    if duplicates:
+        raise ValueError(log.critical(f"Jobs write the same output: {duplicates}"))
+    return jobs
+
+
+def job_args(job, args):
+    """ conversion options of a job (manifest entry overrides shared args)
+
+        :param dict job: job of the manifest
+        :param args: options shared by all jobs
+        :return: options of the job
+    """
+    args = copy.copy(args)
+    args.indir, args.outdir = job["indir"], job["outdir"]
+    args.outfile = str(job.get("outfile", args.outfile))
+    args.years = year_range(job["years"]) if "years" in job else args.years
+    args.limiter = str(job.get("limiter", args.limiter))
+    return args
+
+
+def _init_worker(config, grid):
+    _shared.update(config=config, grid=grid)
+
+
+def _run_job(args):
+    """ convert a job with the shared conf and grid (catches all errors)
+
+        :return: summary of the job
+        :rtype: dict
+    """
+    from .ldndc2nc import _run
+
+    record = {"indir": args.indir, "outfile": str(Path(args.outdir) / args.outfile)}
+    wall = time.perf_counter()
+    try:
+        years = _run(args, _shared["config"], _shared["grid"])
+        record.update(status="ok" if years else "up to date", years=len(years))
+    except (Exception, SystemExit) as e:
+        # errors are logged where raised (messages of log.critical are None,
+        # missing input files exit)
+        error = type(e).__name__
+        if e.args and e.args[0] and not isinstance(e, SystemExit):
+            error += f": {e}"
+        record.update(status="failed", years=0, error=error)
+        log.error(f"Job {args.indir} failed ({error})")
+    record["seconds"] = time.perf_counter() - wall
+    return record
+
+
+def run_jobs(jobs, config, grid, workers=1):
+    """ convert jobs (concurrently by a pool of worker processes)
+
+        The conf and grid index are passed once to every worker.
+
+        :param list jobs: conversion options per job
+        :param config: conf with global info and variables
+        :param GridIndex grid: index of the cell ids
+        :param int workers: number of jobs converted at once
+        :return: summary per job (manifest order)
+        :rtype: list
+    """
+    shared = (config, grid)
+    if workers == 1 or len(jobs) == 1:
+        _init_worker(*shared)
+        return [_run_job(args) for args in jobs]
+
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(jobs)), initializer=_init_worker, initargs=shared
+    ) as executor:
+        return list(executor.map(_run_job, jobs))
+
+
+def format_summary(records):
+    """ table of job summaries """
+    lines = [f"{'status':<12}{'years':>6}{'seconds':>10}  output"]
+    for r in records:
+        lines.append(
+            f"{r['status']:<12}{r['years']:>6}{r['seconds']:>10.1f}  {r['outfile']}"
+        )
+        if "error" in r:
+            lines.append(f"{'':<28}{r['error']}")
+    return "\n".join(lines)
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""ldndc2nc.cache: on-disk cache of parsed LandscapeDNDC txt files."""
+
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+# default size limit of the cache directory (in MB)
+CACHE_SIZE = 4096
+
+
+class ParseCache:
+    """ columnar cache of parsed ldndc txt files with LRU eviction
+
+        Every parsed file is stored as an uncompressed .npz archive holding
+        one array per column. Entries are keyed by the path, size and
+        modification time of the source file and the requested columns. The
+        modification time of an entry marks its last use.
+    """
+
+    def __init__(self, path, max_size=CACHE_SIZE):
+        self.path = Path(path)
+        self.max_size = max_size * 1024 ** 2
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def __repr__(self):
+        return f"<cache: {self.path}>"
+
+    def _entry(self, fname, columns):
+        fname = Path(fname).resolve()
+        stat = fname.stat()
+        key = json.dumps([str(fname), stat.st_size, stat.st_mtime_ns, list(columns)])
+        return self.path / f"{hashlib.sha1(key.encode()).hexdigest()}.npz"
+
+    def load(self, fname, columns):
+        """ return cached data.frame of fname (None if not cached) """
+        import numpy as np
+        import pandas as pd
+
+        entry = self._entry(fname, columns)
+        try:
+            with np.load(entry, allow_pickle=False) as data:
+                names = data["__columns__"]
+                df = pd.DataFrame({name: data[f"c{i}"] for i, name in enumerate(names)})
+            os.utime(entry)
+        except (FileNotFoundError, OSError, KeyError, ValueError):
+            return None
+        log.debug(f"Cache hit for {fname}")
+        return df
+
+    def store(self, fname, columns, df):
+        """ add data.frame of fname to cache and evict least recently used """
+        import numpy as np
+
+        entry = self._entry(fname, columns)
+        arrays = {f"c{i}": df[c].values for i, c in enumerate(df.columns)}
+        arrays["__columns__"] = np.array(df.columns, dtype=str)
+
+        tmp = entry.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, entry)
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for entry in self.path.glob("*.npz"):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+
+        size = sum(e[1] for e in entries)
+        for _, entry_size, entry in sorted(entries, key=lambda e: e[0]):
+            if size <= self.max_size:
+                break
+            try:
+                entry.unlink()
+                log.debug(f"Evicted {entry.name} from cache")
+            except FileNotFoundError:
+                pass
+            size -= entry_size
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""ldndc2nc.chunking: chunk shapes of output variables from a chunking policy."""
+
+import logging
+import operator
+import re
+from functools import reduce
+
+log = logging.getLogger(__name__)
+
+# chunking policies
+#   map:        whole (or large parts of) maps of few time steps
+#   timeseries: all time steps of small spatial tiles
+#   balanced:   all dimensions scaled by the same factor
+POLICIES = ["map", "timeseries", "balanced"]
+
+# default target size of a chunk (bytes)
+CHUNK_SIZE = 2 ** 20
+
+UNITS = {"": 1, "K": 2 ** 10, "M": 2 ** 20, "G": 2 ** 30}
+
+
+def parse_size(size):
+    """ parse a size in bytes (int or str like 512K, 4MB, 1GiB) """
+    if isinstance(size, int):
+        return size
+    match = re.fullmatch(r"\s*(\d+)\s*([KMG]?)(?:i?B)?\s*", str(size), re.IGNORECASE)
+    if not match:
+        raise ValueError(log.critical(f"No valid size: {size}"))
+    return int(match.group(1)) * UNITS[match.group(2).upper()]
+
+
+def _prod(values):
+    return int(reduce(operator.mul, values, 1))
+
+
+def _scale(shape, n):
+    """ scale all dimensions of shape by the same factor to about n elements
+
+        Dimensions that would be scaled below 1 are set to 1 and the factor
+        of the remaining dimensions is increased accordingly.
+    """
+    chunks = list(shape)
+    free = [i for i, size in enumerate(shape) if size > 1]
+    while free:
+        fixed = _prod(chunks[i] for i in range(len(shape)) if i not in free)
+        total = _prod(shape[i] for i in free)
+        factor = (max(n, 1) / fixed / total) ** (1 / len(free))
+        if factor >= 1:
+            break
+        clipped = [i for i in free if shape[i] * factor < 1]
+        if not clipped:
+            for i in free:
+                chunks[i] = max(1, int(shape[i] * factor))
+            break
+        for i in clipped:
+            chunks[i] = 1
+            free.remove(i)
+    return chunks
+
+
+def chunk_shape(dims, shape, itemsize, policy="balanced", chunk_size=CHUNK_SIZE):
+    """ chunk shape of a variable
+
+        :param tuple dims: dimension names (time is treated as time axis)
+        :param tuple shape: shape of the variable
+        :param int itemsize: bytes per value (of the output dtype)
+        :param str policy: chunking policy (map, timeseries or balanced)
+        :param int chunk_size: target size of a chunk (bytes)
+        :return: chunk shape (clipped to shape)
+        :rtype: tuple
+    """
+    if policy not in POLICIES:
+        raise ValueError(log.critical(f"Chunking policy <{policy}> not supported"))
+
+    n = max(1, chunk_size // itemsize)
+    if policy == "balanced" or "time" not in dims:
+        return tuple(_scale(shape, n))
+
+    it = dims.index("time")
+    space = [size for i, size in enumerate(shape) if i != it]
+    if policy == "map":
+        chunks = _scale(space, n)
+        chunks.insert(it, min(shape[it], max(1, n // _prod(chunks))))
+    else:
+        ct = min(shape[it], n)
+        chunks = _scale(space, n // ct)
+        chunks.insert(it, ct)
+    return tuple(chunks)
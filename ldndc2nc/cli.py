@@ -3,13 +3,22 @@
 # cli.py
 # ==================
 
+# Only light modules are imported here, the scientific stack (numpy, pandas,
+# xarray, netCDF4) is imported after the arguments and the conf are checked.
+
 import argparse
 import datetime as dt
 import logging
+import sys
 
-import pkg_resources
-
-version = pkg_resources.require("ldndc2nc")[0].version
+from . import __version__ as version
+from .aggregate import PRODUCTS, check_products
+from .cache import CACHE_SIZE
+from .chunking import POLICIES, parse_size
+from .config_handler import ConfigHandler
+from .merge import parse_shard
+from .options import ENGINES, LAYOUTS, output_options
+from .profiler import HOT_STAGES
 
 log = logging.getLogger(__name__)
 
@@ -36,30 +45,32 @@ class VerbosityAction(argparse.Action):
         setattr(namespace, self.dest, True)
 
 
+def year_range(values):
+    """ parse a year or a range of years (e.g. 2000-2015) """
+    s = str(values).split("-")
+
+    def is_valid_year_range(s):
+        if len(s) > 2:
+            return False
+        for e in s:
+            try:
+                _ = int(e)
+            except ValueError:
+                return False
+        if int(s[-1]) < int(s[0]):
+            return False
+        return True
+
+    if is_valid_year_range(s):
+        return range(int(s[0]), int(s[-1]) + 1)
+    raise ValueError(log.critical(f"No valid range: {values}"))
+
+
 class RangeAction(argparse.Action):
     """ CustomAction for argparse to be able to process value range """
 
     def __call__(self, parser, namespace, values, option_string=None):
-        s = values.split("-")
-
-        def is_valid_year_range(s):
-            if len(s) > 2:
-                return False
-            if len(s) == 1:
-                return True
-            for e in s:
-                try:
-                    _ = int(e)
-                except ValueError:
-                    return False
-            if int(s[1]) < int(s[0]):
-                return False
-            return True
-
-        if is_valid_year_range(s):
-            setattr(namespace, self.dest, range(int(s[0]), int(s[-1]) + 1))
-        else:
-            raise ValueError(log.critical(f"No valid range: {values}"))
+        setattr(namespace, self.dest, year_range(values))
 
 
 class MultiArgsAction(argparse.Action):
@@ -96,27 +107,102 @@ class CustomFormatter(
         return help
 
 
-def cli():
-    """ command line interface """
+def _add_options(parser):
+    """ options of a conversion (shared by ldndc2nc and ldndc2nc batch) """
 
-    DESCR = "ldndc2nc :: LandscapeDNDC output converter (v%s)" % version
+    parser.add_argument(
+        "--aggregate",
+        dest="aggregates",
+        metavar="PRODUCT,...",
+        type=lambda s: s.split(","),
+        help="also write aggregated products (%s) of the daily output "
+        "(overrides the conf file)" % ", ".join(PRODUCTS),
+    )
 
-    GREETING = "\n".join(["-" * 78, DESCR, "-" * 78])
+    parser.add_argument(
+        "--append",
+        dest="append",
+        action="store_true",
+        default=False,
+        help="only convert years missing in existing output (and append them), "
+        "output written with --append or --stream can be extended later, years "
+        "incomplete in the input are skipped, yearly files (-s) are converted "
+        "again if any input file changed after they were written",
+    )
 
-    EPILOG = "Use this tool to create netCDF files based on standard\n"
-    EPILOG += "LandscapeDNDC txt output files\n"
+    parser.add_argument(
+        "--cache", dest="cache", metavar="DIR", help="cache parsed input files in DIR",
+    )
 
-    parser = argparse.ArgumentParser(
-        description=DESCR, epilog=EPILOG, formatter_class=CustomFormatter
+    parser.add_argument(
+        "--cache-size",
+        dest="cache_size",
+        metavar="MB",
+        type=int,
+        default=CACHE_SIZE,
+        help="size limit of the cache (least recently used files are evicted)",
     )
 
-    parser.add_argument("indir", help="location of source ldndc txt files")
-    parser.add_argument("outdir", help="destination of created netCDF files")
+    parser.add_argument(
+        "--chunking",
+        dest="chunking",
+        choices=POLICIES,
+        help="chunking policy of output variables (overrides the conf file)",
+    )
+
+    parser.add_argument(
+        "--chunk-size",
+        dest="chunk_size",
+        metavar="SIZE",
+        help="target size of output chunks, e.g. 4MB (overrides the conf file)",
+    )
 
     parser.add_argument(
         "-c", dest="config", metavar="MYCONF", help="use MYCONF file as config"
     )
 
+    parser.add_argument(
+        "--dask",
+        dest="dask",
+        action="store_true",
+        default=False,
+        help="convert with a lazy, chunked dask graph (one chunk per year)",
+    )
+
+    parser.add_argument(
+        "--engine",
+        dest="engine",
+        choices=ENGINES,
+        default="pandas",
+        help="parse engine for ldndc txt files",
+    )
+
+    parser.add_argument(
+        "--format",
+        dest="format",
+        choices=["netcdf", "zarr"],
+        help="output format (overrides the output format of the conf file)",
+    )
+
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        dest="jobs",
+        metavar="N",
+        type=int,
+        default=1,
+        help="parse input files and write yearly files (-s) or zarr variables "
+        "with N worker processes",
+    )
+
+    parser.add_argument(
+        "--layout",
+        dest="layout",
+        choices=LAYOUTS,
+        help="storage layout of output variables, landpoints: only simulated "
+        "cells (overrides the conf file)",
+    )
+
     parser.add_argument(
         "-l",
         dest="limiter",
@@ -125,6 +211,13 @@ def cli():
         help="limit files by PATTERN",
     )
 
+    parser.add_argument(
+        "--memory-limit",
+        dest="memory_limit",
+        metavar="SIZE",
+        help="memory limit per dask worker, e.g. 4GB (requires dask.distributed)",
+    )
+
     parser.add_argument(
         "-o",
         dest="outfile",
@@ -132,6 +225,22 @@ def cli():
         help="name of the output netCDF file",
     )
 
+    parser.add_argument(
+        "--profile",
+        dest="profile",
+        metavar="FILE",
+        help="write a json report of time, rows and memory per stage to FILE",
+    )
+
+    parser.add_argument(
+        "--profile-stage",
+        dest="profile_stage",
+        metavar="STAGE",
+        choices=HOT_STAGES,
+        help="write cProfile stats of STAGE (%s) to FILE with suffix .prof"
+        % ", ".join(HOT_STAGES),
+    )
+
     parser.add_argument(
         "-r",
         dest="refinfo",
@@ -141,6 +250,14 @@ def cli():
         help="refdata from netCDF file",
     )
 
+    parser.add_argument(
+        "--scheduler",
+        dest="scheduler",
+        choices=["threads", "processes"],
+        default="threads",
+        help="dask scheduler (with --dask, -j sets the number of workers)",
+    )
+
     parser.add_argument(
         "-s",
         dest="split",
@@ -149,6 +266,15 @@ def cli():
         help="split output to yearly netCDF files",
     )
 
+    parser.add_argument(
+        "--shard",
+        dest="shard",
+        metavar="I/N",
+        type=parse_shard,
+        help="convert only files with file number modulo N equal to I "
+        "(0 <= I < N) to a partial output (see ldndc2nc merge)",
+    )
+
     parser.add_argument(
         "-S",
         dest="storeconfig",
@@ -157,6 +283,14 @@ def cli():
         help="make passed config (-c) the new default",
     )
 
+    parser.add_argument(
+        "--stream",
+        dest="stream",
+        action="store_true",
+        default=False,
+        help="read, reindex and write one year at a time",
+    )
+
     parser.add_argument(
         "-v",
         dest="verbose",
@@ -165,6 +299,15 @@ def cli():
         help="increase output verbosity",
     )
 
+    parser.add_argument(
+        "--years-in-flight",
+        dest="years_in_flight",
+        metavar="N",
+        type=int,
+        help="years held in memory for the writer processes of split mode "
+        "(N of -j if not set)",
+    )
+
     parser.add_argument(
         "-y",
         dest="years",
@@ -173,6 +316,67 @@ def cli():
         help="range of years to consider",
     )
 
+
+def _check_args(args):
+    """ validate combinations of conversion options """
+
+    if args.storeconfig and (args.config is None):
+        raise ValueError(
+            log.critical("Option -S requires that you pass a file with -c.")
+        )
+
+    if args.stream and args.cache:
+        log.warning("Option --cache is ignored in streaming mode.")
+
+    if args.dask and (args.stream or args.append):
+        raise ValueError(
+            log.critical("Option --dask cannot be used with --stream or --append.")
+        )
+
+    if args.memory_limit and not args.dask:
+        raise ValueError(log.critical("Option --memory-limit requires --dask."))
+
+    if args.profile_stage and not args.profile:
+        raise ValueError(log.critical("Option --profile-stage requires --profile."))
+
+    if args.jobs < 1:
+        raise ValueError(log.critical("Option -j requires at least one job."))
+
+    if args.shard and args.split:
+        raise ValueError(log.critical("Option --shard cannot be used with -s."))
+
+    if args.years_in_flight is not None and args.years_in_flight < 1:
+        raise ValueError(
+            log.critical("Option --years-in-flight requires at least one year.")
+        )
+
+    # output options of the command line (with the conf: output_options)
+    if args.aggregates:
+        check_products(args.aggregates)
+
+    if args.chunk_size:
+        parse_size(args.chunk_size)
+
+
+def cli():
+    """ command line interface """
+
+    DESCR = "ldndc2nc :: LandscapeDNDC output converter (v%s)" % version
+
+    GREETING = "\n".join(["-" * 78, DESCR, "-" * 78])
+
+    EPILOG = "Use this tool to create netCDF files based on standard\n"
+    EPILOG += "LandscapeDNDC txt output files\n"
+
+    parser = argparse.ArgumentParser(
+        description=DESCR, epilog=EPILOG, formatter_class=CustomFormatter
+    )
+
+    parser.add_argument("indir", help="location of source ldndc txt files")
+    parser.add_argument("outdir", help="destination of created netCDF files")
+
+    _add_options(parser)
+
     print(GREETING)
 
     args = parser.parse_args()
@@ -180,9 +384,295 @@ def cli():
     log.debug("-" * 50)
     log.debug("ldndc2nc called at: %s" % dt.datetime.now())
 
-    if args.storeconfig and (args.config is None):
-        raise ValueError(
-            log.critical("Option -S requires that you pass a file with -c.")
-        )
+    _check_args(args)
+
+    return args
+
+
+def batch_cli(argv=None):
+    """ command line interface of batch conversions (ldndc2nc batch) """
+
+    parser = argparse.ArgumentParser(
+        prog="ldndc2nc batch",
+        description="convert several directories of LandscapeDNDC txt output "
+        "files (jobs of a manifest) with shared conf and refdata",
+        epilog="The manifest (YAML or CSV) lists the jobs with indir, outdir "
+        "and optionally outfile, years and limiter (overriding -o, -y and -l).",
+        formatter_class=CustomFormatter,
+    )
+
+    parser.add_argument("manifest", help="YAML or CSV file of the jobs")
+
+    parser.add_argument(
+        "--json", dest="json", metavar="FILE", help="write the job summary to FILE",
+    )
+
+    parser.add_argument(
+        "-w",
+        "--workers",
+        dest="workers",
+        metavar="N",
+        type=int,
+        default=1,
+        help="number of jobs converted concurrently (worker processes)",
+    )
+
+    _add_options(parser)
+
+    args = parser.parse_args(argv)
+
+    _check_args(args)
+
+    if args.workers < 1:
+        raise ValueError(log.critical("Option -w requires at least one worker."))
+
+    if args.profile:
+        raise ValueError(log.critical("Option --profile is not supported in batch."))
+
+    return args
+
+
+def merge_cli(argv=None):
+    """ command line interface of the merge of partial outputs (ldndc2nc merge) """
+
+    parser = argparse.ArgumentParser(
+        prog="ldndc2nc merge",
+        description="merge the partial outputs of sharded conversions "
+        "(ldndc2nc --shard I/N) into the output file",
+        epilog="Use the conf and output options of the sharded conversions.",
+        formatter_class=CustomFormatter,
+    )
+
+    parser.add_argument("outdir", help="location of the partial outputs")
+
+    parser.add_argument(
+        "--aggregate",
+        dest="aggregates",
+        metavar="PRODUCT,...",
+        type=lambda s: s.split(","),
+        help="also merge aggregated products (%s) (overrides the conf file)"
+        % ", ".join(PRODUCTS),
+    )
+
+    parser.add_argument(
+        "-c", dest="config", metavar="MYCONF", help="use MYCONF file as config"
+    )
+
+    parser.add_argument(
+        "--chunking",
+        dest="chunking",
+        choices=POLICIES,
+        help="chunking policy of output variables (overrides the conf file)",
+    )
+
+    parser.add_argument(
+        "--chunk-size",
+        dest="chunk_size",
+        metavar="SIZE",
+        help="target size of output chunks, e.g. 4MB (overrides the conf file)",
+    )
+
+    parser.add_argument(
+        "--format",
+        dest="format",
+        choices=["netcdf", "zarr"],
+        help="output format (overrides the conf file)",
+    )
+
+    parser.add_argument(
+        "-o",
+        dest="outfile",
+        default="outfile.nc",
+        help="name of the output netCDF file",
+    )
+
+    args = parser.parse_args(argv)
+
+    args.shard = None
+    args.layout = None
+    args.jobs = 1
+
+    return args
+
+
+def codecs_cli(argv=None):
+    """ command line interface of the codec benchmark (ldndc2nc codecs) """
+
+    parser = argparse.ArgumentParser(
+        prog="ldndc2nc codecs",
+        description="benchmark compression codecs of the netCDF output on a "
+        "sample year of LandscapeDNDC txt output files",
+        formatter_class=CustomFormatter,
+    )
+
+    parser.add_argument("indir", help="location of source ldndc txt files")
+
+    parser.add_argument(
+        "-c", dest="config", metavar="MYCONF", help="use MYCONF file as config"
+    )
+
+    parser.add_argument(
+        "--chunking",
+        dest="chunking",
+        choices=POLICIES,
+        help="chunking policy of output variables (overrides the conf file)",
+    )
+
+    parser.add_argument(
+        "--chunk-size",
+        dest="chunk_size",
+        metavar="SIZE",
+        help="target size of output chunks, e.g. 4MB (overrides the conf file)",
+    )
+
+    parser.add_argument(
+        "--codecs",
+        dest="codecs",
+        metavar="CODEC,...",
+        type=lambda s: s.split(","),
+        help="codecs to benchmark (all supported codecs if not set, uncompressed "
+        "output is always included)",
+    )
+
+    parser.add_argument(
+        "--engine",
+        dest="engine",
+        choices=ENGINES,
+        default="pandas",
+        help="parse engine for ldndc txt files",
+    )
+
+    parser.add_argument(
+        "--json", dest="json", metavar="FILE", help="write the results to FILE",
+    )
+
+    parser.add_argument(
+        "-l",
+        dest="limiter",
+        metavar="PATTERN",
+        default="",
+        help="limit files by PATTERN",
+    )
+
+    parser.add_argument(
+        "--layout",
+        dest="layout",
+        choices=LAYOUTS,
+        help="storage layout of output variables, landpoints: only simulated "
+        "cells (overrides the conf file)",
+    )
+
+    parser.add_argument(
+        "--levels",
+        dest="levels",
+        metavar="LEVEL,...",
+        type=lambda s: [int(x) for x in s.split(",")],
+        help="compression levels (a few typical levels per codec if not set)",
+    )
+
+    parser.add_argument(
+        "-r",
+        dest="refinfo",
+        action=MultiArgsAction,
+        const=2,
+        metavar="FILE,VAR",
+        help="refdata from netCDF file",
+    )
+
+    parser.add_argument(
+        "--shuffle",
+        dest="shuffles",
+        choices=["on", "off", "both"],
+        default="both",
+        help="byte shuffle before compression (not applied to zstd)",
+    )
+
+    parser.add_argument(
+        "--tmpdir",
+        dest="tmpdir",
+        metavar="DIR",
+        help="directory of the benchmark files (system temp directory if not set)",
+    )
+
+    parser.add_argument(
+        "-y", dest="year", type=int, default=2000, help="sample year",
+    )
+
+    args = parser.parse_args(argv)
+
+    from .compression import supported_codecs
+
+    args.codecs = args.codecs or supported_codecs()
+    unknown = set(args.codecs) - set(supported_codecs())
+    if unknown:
+        raise ValueError(log.critical(f"Codecs {sorted(unknown)} not supported"))
+    args.codecs = [c for c in args.codecs if c != "none"]
+    args.shuffles = {"on": [True], "off": [False], "both": [True, False]}[args.shuffles]
+    args.format = None
+    args.aggregates = None
 
     return args
+
+
+def _read_config(args):
+    """ conf of option -c (stored as the new default with -S) """
+    config = ConfigHandler(args.config)
+    if getattr(args, "storeconfig", False):
+        config.write()
+    return config
+
+
+def batch_main(argv=None):
+    """ convert the jobs of a manifest (ldndc2nc batch ...)
+
+        :return: exit status (1 if a job failed)
+    """
+    from .batch import read_jobs
+
+    args = batch_cli(argv)
+    jobs = read_jobs(args)
+    config = _read_config(args)
+    # complete (and validate) the output options before starting any job
+    for job in jobs:
+        output_options(job, config)
+
+    from .ldndc2nc import _batch
+
+    return _batch(args, jobs, config)
+
+
+def codecs_main(argv=None):
+    """ benchmark compression codecs on a sample year (ldndc2nc codecs ...) """
+    args = codecs_cli(argv)
+    config = _read_config(args)
+    output_options(args, config)
+
+    from .ldndc2nc import _codecs
+
+    _codecs(args, config)
+
+
+def merge_main(argv=None):
+    """ merge the partial outputs of sharded conversions (ldndc2nc merge ...) """
+    args = merge_cli(argv)
+    config = _read_config(args)
+    output_options(args, config)
+
+    from .ldndc2nc import _merge
+
+    _merge(args, config)
+
+
+def main():
+    """ entry point of ldndc2nc and its subcommands """
+    commands = {"batch": batch_main, "codecs": codecs_main, "merge": merge_main}
+    if sys.argv[1:2] and sys.argv[1] in commands:
+        return commands[sys.argv[1]](sys.argv[2:])
+
+    args = cli()
+    config = _read_config(args)
+    output_options(args, config)
+
+    from .ldndc2nc import _run
+
+    _run(args, config)
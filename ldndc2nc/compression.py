@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""ldndc2nc.compression: compression codecs of output variables and a codec benchmark."""
+
+import logging
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+# codecs of output variables (none: no compression)
+CODECS = ["zlib", "zstd", "blosc-lz4", "none"]
+
+# default compression of output variables
+COMPRESSION = {"codec": "zlib", "level": 5, "shuffle": True}
+
+# valid compression levels per codec
+LEVELS = {"zlib": range(0, 10), "zstd": range(1, 23), "blosc-lz4": range(0, 10)}
+
+# compression levels of the codec benchmark
+BENCHMARK_LEVELS = {"zlib": [1, 5, 9], "zstd": [1, 3, 9], "blosc-lz4": [1, 5, 9]}
+
+# netCDF4 flags of optional HDF5 filters
+_SUPPORT = {"zstd": "__has_zstandard_support__", "blosc-lz4": "__has_blosc_support__"}
+
+
+def supported_codecs():
+    """ codecs supported by the netCDF/HDF5 stack """
+    import netCDF4
+
+    return [c for c in CODECS if c not in _SUPPORT or getattr(netCDF4, _SUPPORT[c])]
+
+
+def check_compression(codec="zlib", level=None, shuffle=True):
+    """ validate compression options (raises ValueError) """
+    if codec not in CODECS:
+        raise ValueError(log.critical(f"Codec <{codec}> not supported"))
+    if codec in _SUPPORT and codec not in supported_codecs():
+        raise ValueError(log.critical(f"Codec <{codec}> not supported by netCDF4"))
+    if level is not None and codec != "none" and level not in LEVELS[codec]:
+        levels = LEVELS[codec]
+        raise ValueError(
+            log.critical(
+                f"Level {level} of codec <{codec}> not in {levels[0]}-{levels[-1]}"
+            )
+        )
+    if not isinstance(shuffle, bool):
+        raise ValueError(log.critical("Option shuffle must be true or false"))
+
+
+def variable_compression(var, codec, level, shuffle):
+    """ compression options of a variable (variable options override) """
+    if var is None:
+        return (codec, level, shuffle)
+    if var.level is not None:
+        level = var.level
+    elif var.codec not in (None, codec):
+        level = None
+    return (
+        var.codec or codec,
+        level,
+        shuffle if var.shuffle is None else var.shuffle,
+    )
+
+
+def netcdf_compression(codec="zlib", level=None, shuffle=True):
+    """ netCDF encoding (createVariable keywords) of a codec
+
+        :param str codec: codec (zlib, zstd, blosc-lz4 or none)
+        :param int level: (optional) compression level
+        :param bool shuffle: shuffle bytes before compression
+        :return: encoding
+        :rtype: dict
+    """
+    level = COMPRESSION["level"] if level is None else level
+    if codec == "none":
+        return {"zlib": False, "shuffle": False}
+    if codec == "zlib":
+        return {"zlib": True, "complevel": level, "shuffle": shuffle}
+    if codec == "zstd":
+        # netCDF4 applies no shuffle filter with zstd (zarr output neither)
+        return {"compression": "zstd", "complevel": level, "shuffle": False}
+    # blosc shuffles bytes itself
+    return {
+        "compression": "blosc_lz4",
+        "complevel": level,
+        "shuffle": False,
+        "blosc_shuffle": int(shuffle),
+    }
+
+
+def zarr_compression(encoding, itemsize):
+    """ zarr compressor and filters of a netCDF encoding
+
+        The compression keys are removed from encoding.
+
+        :param dict encoding: netCDF encoding of a variable
+        :param int itemsize: bytes per value (of the output dtype)
+        :return: compressor (None: no compression) and filters
+        :rtype: tuple
+    """
+    import numcodecs
+
+    level = encoding.pop("complevel", COMPRESSION["level"])
+    shuffle = encoding.pop("shuffle", False)
+    blosc_shuffle = encoding.pop("blosc_shuffle", 0)
+    codec = encoding.pop("compression", "zlib" if encoding.pop("zlib", False) else None)
+
+    filters = [numcodecs.Shuffle(elementsize=itemsize)] if shuffle else []
+    if codec == "zlib":
+        return (numcodecs.Zlib(level=level), filters)
+    if codec == "zstd":
+        return (numcodecs.Zstd(level=level), filters)
+    if codec == "blosc_lz4":
+        return (numcodecs.Blosc(cname="lz4", clevel=level, shuffle=blosc_shuffle), [])
+    return (None, filters)
+
+
+def _nbytes(ds, encodings):
+    """ uncompressed size of the data variables (output dtype) """
+    import numpy as np
+
+    return sum(
+        ds[v].size * np.dtype(encodings[v].get("dtype", ds[v].dtype)).itemsize
+        for v in ds.data_vars
+    )
+
+
+def _read_all(fname):
+    import netCDF4
+
+    with netCDF4.Dataset(fname) as nc:
+        for v in nc.variables.values():
+            v[:]
+
+
+def benchmark(ds, config, runs, options=None, tmpdir=None):
+    """ write (and read) a dataset with several codecs
+
+        :param xr.Dataset ds: dataset to write (e.g. a sample year)
+        :param config: conf with global info and variables
+        :param list runs: (codec, level, shuffle) tuples
+        :param dict options: (optional) chunking options of get_datavar_encodings
+        :param Path tmpdir: (optional) directory of the written files
+        :return: record per run with size (MB), ratio and write/read speed (MB/s)
+        :rtype: list
+    """
+    from .ldndc2nc import _write_netcdf, get_datavar_encodings
+
+    options = options or {}
+    nbytes = _nbytes(ds, get_datavar_encodings(ds, config.variables, **options))
+    workdir = Path(tempfile.mkdtemp(dir=tmpdir))
+
+    records = []
+    try:
+        # warm up (imports, caches) before the first measured write
+        _write_netcdf(ds, workdir / "warmup.nc", config, options=options)
+        _read_all(workdir / "warmup.nc")
+
+        for codec, level, shuffle in runs:
+            fname = workdir / f"{codec}_{level}_{shuffle}.nc"
+            compression = {"codec": codec, "level": level, "shuffle": shuffle}
+
+            wall = time.perf_counter()
+            _write_netcdf(ds, fname, config, options={**options, **compression})
+            write = time.perf_counter() - wall
+
+            wall = time.perf_counter()
+            _read_all(fname)
+            read = time.perf_counter() - wall
+
+            size = fname.stat().st_size
+            records.append(
+                {
+                    **compression,
+                    "size_mb": size / 2 ** 20,
+                    "ratio": nbytes / size,
+                    "write_mb_s": nbytes / 2 ** 20 / write,
+                    "read_mb_s": nbytes / 2 ** 20 / read,
+                }
+            )
+            fname.unlink()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return records
+
+
+def format_records(records):
+    """ table of benchmark records """
+    lines = [
+        f"{'codec':<10}{'level':>6}{'shuffle':>9}{'size MB':>10}{'ratio':>8}"
+        f"{'write MB/s':>12}{'read MB/s':>11}"
+    ]
+    for r in records:
+        level = "-" if r["codec"] == "none" else r["level"]
+        lines.append(
+            f"{r['codec']:<10}{level:>6}{str(r['shuffle']).lower():>9}"
+            f"{r['size_mb']:>10.2f}{r['ratio']:>8.2f}"
+            f"{r['write_mb_s']:>12.1f}{r['read_mb_s']:>11.1f}"
+        )
+    return "\n".join(lines)
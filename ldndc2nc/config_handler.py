@@ -58,7 +58,7 @@ def get_section(self, section):
     section_data = None
 
     def is_valid_section(s):
-        valid_sections = ["info", "project", "variables", "refdata"]
+        valid_sections = ["info", "project", "variables", "refdata", "output"]
         return s in valid_sections
 
     if is_valid_section(section.lower()):
@@ -90,7 +90,7 @@ class ConfigHandler:
     def _decode(cfg):
         if "variables" in cfg:
             for file, variables in cfg["variables"].items():
-                cfg["variables"][file] = [v.text_full for v in variables]
+                cfg["variables"][file] = [v.config for v in variables]
         return cfg
 
     @staticmethod
@@ -98,7 +98,8 @@ class ConfigHandler:
         if "variables" in cfg:
             for file, variables in cfg["variables"].items():
                 cfg["variables"][file] = [
-                    Variable(v) if isinstance(v, str) else v for v in variables
+                    v if isinstance(v, Variable) else Variable.from_config(v)
+                    for v in variables
                 ]
         return cfg
 
@@ -113,7 +114,10 @@ class ConfigHandler:
         vars = []
         if "variables" in self.cfg:
             for file, variables in self.cfg["variables"].items():
-                vars += [Variable(v) if isinstance(v, str) else v for v in variables]
+                vars += [
+                    v if isinstance(v, Variable) else Variable.from_config(v)
+                    for v in variables
+                ]
         return vars
 
     @property
@@ -0,0 +1,539 @@
+# -*- coding: utf-8 -*-
+"""ldndc2nc.engines: parse engines for LandscapeDNDC txt output files."""
+
+import collections
+import gzip
+import io
+import logging
+import mmap
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import as_strided
+
+from . import profiler
+
+log = logging.getLogger(__name__)
+
+# base columns that are parsed if they are present in the header
+HEADERCOLS = ["datetime", "id"]
+
+# size of the blocks (in bytes) parsed at once by the arrow engine when
+# reading chunk-wise and by the mmap engine
+BLOCKSIZE = 1 << 24
+
+# suffix of the seek index of gzip compressed files (next to the file)
+GZINDEX = ".gzindex"
+
+# bytes of the mmap engine
+TAB, NEWLINE, MINUS, DOT, ZERO, NINE = b"\t\n-.09"
+
+# numbers with up to 15 digits are exact as int64 and float64, so that the
+# division by a power of ten (exact up to 1e22) is correctly rounded
+MAX_DIGITS = 15
+POWERS = 10.0 ** np.arange(MAX_DIGITS + 1)
+
+# digits of dates (YYYY-MM-DD) at the start of datetime fields
+DATE_DIGITS = [0, 1, 2, 3, 5, 6, 8, 9]
+
+# pandas >= 1.3 replaced error_bad_lines with on_bad_lines
+if tuple(int(x) for x in pd.__version__.split(".")[:2]) >= (1, 3):
+    BAD_LINES = {"on_bad_lines": "warn"}
+else:
+    BAD_LINES = {"error_bad_lines": False}
+
+
+def _is_compressed(fname):
+    return str(fname).endswith(".gz")
+
+
+def _gzindex(fname):
+    """ path of the seek index of a gzip compressed file """
+    return Path(f"{fname}{GZINDEX}")
+
+
+def _write_gzindex(f, fname):
+    """ write the seek index of an open rapidgzip file (atomic rename) """
+    index = _gzindex(fname)
+    tmp = index.with_name(f"{index.name}.{os.getpid()}")
+    try:
+        with open(tmp, "wb") as fi:
+            f.export_index(fi)
+        os.replace(tmp, index)
+    except OSError as e:
+        log.debug(f"No seek index written for {fname}: {e}")
+        if tmp.exists():
+            tmp.unlink()
+
+
+def gzip_threads(processes=1):
+    """ decompression threads per file if processes decompress at once """
+    return max(1, (os.cpu_count() or 1) // processes)
+
+
+@contextmanager
+def open_gzip(fname, parallelization=None):
+    """ open a gzip compressed file for reading (binary)
+
+        With rapidgzip installed, the file is decompressed by parallel threads
+        (also single-member gzip files). The seek index is written next to
+        the file after the first complete read (suffix .gzindex) and used by
+        later reads. Without rapidgzip, gzip decompresses the file.
+
+        :param Path fname: gzip compressed file
+        :param int parallelization: (optional) threads (default: all cores)
+        :return: file object
+    """
+    try:
+        import rapidgzip
+    except ImportError:
+        with gzip.open(fname, "rb") as f:
+            yield f
+        return
+
+    index = _gzindex(fname)
+    fresh = index.exists() and index.stat().st_mtime >= Path(fname).stat().st_mtime
+    parallelization = parallelization or os.cpu_count() or 1
+    with rapidgzip.open(str(fname), parallelization=parallelization) as f:
+        if fresh:
+            with open(index, "rb") as fi:
+                f.import_index(fi)
+        yield f
+        if not fresh:
+            _write_gzindex(f, fname)
+
+
+class _TimedReader(io.RawIOBase):
+    """ file object that sums up the time spent in reads of f """
+
+    def __init__(self, f):
+        self.f = f
+        self.wall = self.cpu = 0.0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            return self.f.readinto(b)
+        finally:
+            self.wall += time.perf_counter() - wall
+            self.cpu += time.process_time() - cpu
+
+
+@contextmanager
+def _source(fname, threads=None):
+    """ input of the parsers (file object of compressed files, else path)
+
+        With an active profiler, the time spent decompressing is recorded
+        as stage decompress (part of the parse stage).
+    """
+    if not _is_compressed(fname):
+        yield str(fname)
+        return
+
+    with open_gzip(fname, parallelization=threads) as f:
+        if profiler.active() is None:
+            yield f
+            return
+
+        timed = _TimedReader(f)
+        try:
+            yield io.BufferedReader(timed)
+        finally:
+            profiler.add("decompress", timed.wall, timed.cpu, file=Path(fname).name)
+
+
+def _header_cols(fname):
+    """ find the base columns present in the header of a ldndc txt file
+
+        :param Path fname: ldndc txt file (plain or gzip compressed)
+        :return: base columns (datetime and id) in header
+        :rtype: list
+    """
+    # conditional open (either regular or gzip based on suffix)
+    opener = gzip.open if _is_compressed(fname) else open
+
+    with opener(fname, "rt") as f:
+        header = f.readline()
+    return [b for b in HEADERCOLS if b in header]
+
+
+def last_day(fname, block_size=1 << 16):
+    """ day of the last complete row of a ldndc txt file
+
+        Plain files are read from the end (blocks of growing size until a
+        complete line is found), compressed files completely. An incomplete
+        last line (file still written) is ignored.
+
+        :param Path fname: ldndc txt file (plain or gzip compressed)
+        :param int block_size: bytes read from the end of plain files
+        :return: day (None if the file has no rows or no datetime column)
+        :rtype: np.datetime64
+    """
+    if _is_compressed(fname):
+        with open_gzip(fname) as f:
+            lines = list(collections.deque(f, maxlen=3))
+    else:
+        with open(fname, "rb") as f:
+            size = f.seek(0, 2)
+            while True:
+                start = max(size - block_size, 0)
+                f.seek(start)
+                lines = f.read().splitlines(keepends=True)
+                # the first line of a block might be cut
+                lines = lines[1:] if start > 0 else lines
+                if start == 0 or any(line.endswith(b"\n") for line in lines):
+                    break
+                block_size *= 2
+
+    lines = [line for line in lines if line.endswith(b"\n") and line.strip()]
+    opener = gzip.open if _is_compressed(fname) else open
+    with opener(fname, "rb") as f:
+        header = f.readline()
+    fields = header.decode().rstrip("\r\n").split("\t")
+    if not lines or lines[-1] == header or "datetime" not in fields:
+        return None
+    value = lines[-1].split(b"\t")[fields.index("datetime")]
+    return np.datetime64(value[:10].decode(), "D")
+
+
+def _pandas_options(fname, datacols, dtypes):
+    return dict(
+        usecols=_header_cols(fname) + datacols,
+        dtype={c: dtypes.get(c, "float64") for c in datacols},
+        **BAD_LINES,
+    )
+
+
+def _arrow_options(datacols, dtypes, block_size=None):
+    """ csv options for the arrow engine
+
+        All base columns are requested and the ones missing in the file come
+        back without values, so the header does not need to be read upfront.
+        Column types are fixed as arrow infers them from the first block only.
+    """
+    try:
+        import pyarrow as pa
+        from pyarrow import csv
+    except ImportError:
+        raise ImportError(log.critical("Engine <arrow> requires pyarrow"))
+
+    def skip_invalid_row(row):
+        log.warning(f"Skipping line {row.number}: {row.text}")
+        return "skip"
+
+    column_types = {"datetime": pa.timestamp("s"), "id": pa.int64()}
+    column_types.update(
+        {c: pa.type_for_alias(dtypes.get(c, "float64")) for c in datacols}
+    )
+
+    read_options = csv.ReadOptions(use_threads=True)
+    if block_size:
+        read_options.block_size = block_size
+
+    return dict(
+        read_options=read_options,
+        parse_options=csv.ParseOptions(
+            delimiter="\t", invalid_row_handler=skip_invalid_row
+        ),
+        convert_options=csv.ConvertOptions(
+            column_types=column_types,
+            include_columns=HEADERCOLS + datacols,
+            include_missing_columns=True,
+        ),
+    )
+
+
+def _arrow_to_pandas(table, datacols):
+    """ convert arrow table, drop base columns missing in the file """
+    import pyarrow as pa
+
+    def missing(c):
+        return len(table) > 0 and table.column(c).null_count == len(table)
+
+    for c in datacols:
+        if missing(c):
+            raise ValueError(log.critical(f"Column <{c}> missing or empty"))
+    table = table.drop([c for c in HEADERCOLS if missing(c)])
+
+    # truncate timestamps to days (like the pandas path does)
+    if "datetime" in table.column_names:
+        idx = table.column_names.index("datetime")
+        days = table.column(idx).cast(pa.date32())
+        table = table.set_column(idx, "datetime", days)
+    return table.to_pandas(date_as_object=False)
+
+
+def _field_chars(block, starts, ends, width=None):
+    """ characters of fields as (width, rows) array (zero padded)
+
+        The fields are copied from windows of width bytes on the block (one
+        copy per row), fields near the end of the block one by one.
+    """
+    lengths = ends - starts
+    if width is None:
+        width = max(int(lengths.max()), 1) if len(lengths) else 1
+    nwin = max(len(block) - width + 1, 0)
+    windows = as_strided(block, shape=(nwin, width), strides=(1, 1), writeable=False)
+    n = int(np.searchsorted(starts, nwin))
+
+    rows = np.empty((len(starts), width), dtype=np.uint8)
+    rows[:n] = windows[starts[:n]]
+    for i in range(n, len(starts)):
+        field = block[starts[i] : starts[i] + width]
+        rows[i, : len(field)] = field
+        rows[i, len(field) :] = 0
+
+    chars = np.ascontiguousarray(rows.T)
+    for j, row in enumerate(chars):
+        np.multiply(row, lengths > j, out=row)
+    return (chars, lengths)
+
+
+def _decimal(chars):
+    """ vectorized parse of decimal numbers (optional minus sign and dot)
+
+        :return: mantissa, number of decimals, sign and mask of fields that
+                 are not plain decimal numbers
+        :rtype: tuple
+    """
+    digits = chars - ZERO
+    digit = digits < 10
+    dot = chars == DOT
+    minus = chars[0] == MINUS
+    other = ~(digit | dot | (chars == 0))
+    other[0] &= ~minus
+
+    ndigits = digit.sum(axis=0, dtype=np.uint8)
+    invalid = other.any(axis=0) | (dot.sum(axis=0, dtype=np.uint8) > 1)
+    invalid |= (ndigits == 0) | (ndigits > MAX_DIGITS)
+
+    # Horner scheme over the characters (non-digits leave the mantissa as is)
+    mantissa = np.zeros(chars.shape[1], dtype=np.int64)
+    decimals = np.zeros(chars.shape[1], dtype=np.uint8)
+    seen = np.zeros(chars.shape[1], dtype=bool)
+    digits[~digit] = 0
+    scales = np.where(digit, np.uint8(10), np.uint8(1))
+    for d, scale, is_digit, is_dot in zip(digits, scales, digit, dot):
+        mantissa *= scale
+        mantissa += d
+        seen |= is_dot
+        decimals += is_digit & seen
+    return (mantissa, decimals, minus, invalid)
+
+
+def _parse_floats(chars, lengths, dtype):
+    mantissa, decimals, minus, invalid = _decimal(chars)
+    values = mantissa / POWERS[np.minimum(decimals, MAX_DIGITS)]
+    np.negative(values, out=values, where=minus)
+    if invalid.any():
+        # exponents, nan, inf, ... (empty fields are missing values)
+        rows = np.ascontiguousarray(chars[:, invalid].T)
+        strings = rows.view(f"S{rows.shape[1]}").ravel()
+        values[invalid] = np.where(
+            lengths[invalid] > 0, np.char.strip(strings), b"nan"
+        ).astype(np.float64)
+    return values.astype(dtype, copy=False)
+
+
+def _parse_ints(chars, lengths):
+    mantissa, decimals, minus, invalid = _decimal(chars)
+    if (invalid | (decimals > 0)).any():
+        raise ValueError("No valid integers")
+    return np.where(minus, -mantissa, mantissa)
+
+
+def _parse_dates(chars, lengths):
+    """ dates of datetime fields (truncated to days like the arrow engine) """
+    digits = (chars[DATE_DIGITS] - ZERO) < 10
+    if not (digits.all() and (chars[[4, 7]] == MINUS).all()):
+        raise ValueError("No valid dates")
+    dates = np.ascontiguousarray(chars.T).view(f"S{len(chars)}").ravel()
+    return dates.astype("datetime64[D]").astype("datetime64[ns]")
+
+
+def _pandas_block(block, header, columns, dtypes):
+    """ parse a block with pandas (skipping bad lines) """
+    text = ("\t".join(header) + "\n").encode() + block.tobytes()
+    df = pd.read_table(
+        io.BytesIO(text),
+        usecols=columns,
+        dtype={c: dtypes.get(c, "float64") for c in columns if c not in HEADERCOLS},
+        **BAD_LINES,
+    )
+    if "datetime" in df.columns:
+        df["datetime"] = pd.to_datetime(df.datetime).dt.floor("D")
+    return df
+
+
+def _mmap_block(block, header, columns, dtypes, crlf=False):
+    """ parse a block of complete lines of a ldndc txt file
+
+        Field boundaries are found with one vectorized scan for tabs and
+        newlines. Blocks with lines of the wrong number of fields or with
+        values that are not plain numbers (ids) or dates are parsed by pandas.
+
+        :return: data.frame of columns (file order)
+        :rtype: pd.DataFrame
+    """
+    ncols = len(header)
+    seps = np.flatnonzero((block == TAB) | (block == NEWLINE))
+    nrows = len(seps) // ncols
+    if len(seps) != nrows * ncols or (block[seps[ncols - 1 :: ncols]] != NEWLINE).any():
+        return _pandas_block(block, header, columns, dtypes)
+
+    def bounds(i):
+        """ start and end positions of the fields of column i """
+        ends = seps[i::ncols]
+        starts = np.empty_like(ends)
+        starts[0] = seps[i - 1] + 1 if i else 0
+        starts[1:] = seps[i - 1 + ncols :: ncols][: nrows - 1] + 1
+        if crlf and i == ncols - 1:
+            ends = ends - 1
+        return (starts, ends)
+
+    def parse(c):
+        starts, ends = bounds(header.index(c))
+        if c == "datetime":
+            return _parse_dates(*_field_chars(block, starts, ends, 10))
+        chars, lengths = _field_chars(block, starts, ends)
+        if c == "id":
+            return _parse_ints(chars, lengths)
+        return _parse_floats(chars, lengths, dtypes.get(c, "float64"))
+
+    # numpy releases the GIL, so that columns are parsed in parallel
+    try:
+        with ThreadPoolExecutor(min(len(columns), os.cpu_count() or 1)) as executor:
+            data = dict(zip(columns, executor.map(parse, columns)))
+    except ValueError:
+        return _pandas_block(block, header, columns, dtypes)
+    return pd.DataFrame(data, columns=columns)
+
+
+def _iter_mmap(fname, datacols, dtypes, block_size=BLOCKSIZE):
+    """ parse a plain ldndc txt file block-wise from a memory map
+
+        :param Path fname: ldndc txt file (not compressed)
+        :param list datacols: data columns to read
+        :param dict dtypes: float dtypes of datacols
+        :param int block_size: bytes parsed at once (extended to a full line)
+        :return: data.frames with base columns and datacols
+        :rtype: iterator
+    """
+    with open(fname, "rb") as f:
+        line = f.readline()
+        size = f.seek(0, 2)
+        if size == len(line):
+            # header only (no memory map of empty data)
+            header = line.decode().rstrip("\r\n").split("\t")
+            columns = [c for c in header if c in HEADERCOLS or c in datacols]
+            yield pd.read_table(
+                io.BytesIO(line),
+                usecols=columns,
+                dtype={c: dtypes.get(c, "float64") for c in datacols},
+            )
+            return
+
+        header = line.decode().rstrip("\r\n").split("\t")
+        missing = [c for c in datacols if c not in header]
+        if missing:
+            raise ValueError(log.critical(f"Column <{missing[0]}> missing or empty"))
+        columns = [c for c in header if c in HEADERCOLS or c in datacols]
+        crlf = line.endswith(b"\r\n")
+
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = np.frombuffer(mm, dtype=np.uint8)
+        try:
+            start = len(line)
+            while start < size:
+                end = mm.find(b"\n", min(start + block_size, size) - 1) + 1
+                end = end or size
+                block = buf[start:end]
+                if block[-1] != NEWLINE:
+                    block = np.append(block, np.uint8(NEWLINE))
+                df = _mmap_block(block, header, columns, dtypes, crlf)
+                del block
+                yield df
+                start = end
+        finally:
+            del buf
+            try:
+                mm.close()
+            except BufferError:
+                # views of an exception traceback, unmapped when collected
+                pass
+
+
+def read_table(fname, datacols, dtypes=None, engine="pandas", threads=None):
+    """ parse ldndc txt file
+
+        The arrow and mmap engines convert floats with correct rounding,
+        values with more than 15 significant digits might differ from the
+        pandas engine in the last bit. The mmap engine parses uncompressed
+        files only (compressed files are parsed by pandas). Compressed files
+        are decompressed by open_gzip.
+
+        :param Path fname: ldndc txt file (plain or gzip compressed)
+        :param list datacols: data columns to read
+        :param dict dtypes: (optional) float dtypes of datacols (default: float64)
+        :param str engine: parse engine (pandas, arrow or mmap)
+        :param int threads: (optional) decompression threads (default: all cores)
+        :return: data.frame with base columns and datacols
+        :rtype: pd.DataFrame
+    """
+    dtypes = dtypes or {}
+    if engine == "arrow":
+        from pyarrow import csv
+
+        with _source(fname, threads) as source:
+            table = csv.read_csv(source, **_arrow_options(datacols, dtypes))
+        return _arrow_to_pandas(table, datacols)
+    if engine == "mmap" and not _is_compressed(fname):
+        return pd.concat(_iter_mmap(fname, datacols, dtypes), ignore_index=True)
+    with _source(fname, threads) as source:
+        return pd.read_table(source, **_pandas_options(fname, datacols, dtypes))
+
+
+def iter_table(fname, datacols, chunksize, dtypes=None, engine="pandas", threads=None):
+    """ parse ldndc txt file chunk-wise
+
+        :param Path fname: ldndc txt file (plain or gzip compressed)
+        :param list datacols: data columns to read
+        :param int chunksize: number of rows parsed at once (pandas engine)
+        :param dict dtypes: (optional) float dtypes of datacols (default: float64)
+        :param str engine: parse engine (pandas, arrow or mmap)
+        :param int threads: (optional) decompression threads (default: all cores)
+        :return: data.frames with base columns and datacols
+        :rtype: iterator
+    """
+    dtypes = dtypes or {}
+    if engine == "arrow":
+        import pyarrow as pa
+        from pyarrow import csv
+
+        options = _arrow_options(datacols, dtypes, BLOCKSIZE)
+        with _source(fname, threads) as source:
+            reader = csv.open_csv(source, **options)
+            try:
+                for batch in reader:
+                    table = pa.Table.from_batches([batch])
+                    yield _arrow_to_pandas(table, datacols)
+            finally:
+                reader.close()
+    elif engine == "mmap" and not _is_compressed(fname):
+        yield from _iter_mmap(fname, datacols, dtypes)
+    else:
+        options = _pandas_options(fname, datacols, dtypes)
+        with _source(fname, threads) as source:
+            reader = pd.read_table(source, chunksize=chunksize, **options)
+            try:
+                yield from reader
+            finally:
+                reader.close()
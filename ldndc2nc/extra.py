@@ -7,7 +7,6 @@ import shutil
 from pathlib import Path
 
 import yaml
-from pkg_resources import Requirement, resource_filename
 
 log = logging.getLogger(__name__)
 
@@ -22,9 +21,7 @@ def _copy_default_config():
 
     # TODO somewhat redundand, merge with set_config code
 
-    fname = resource_filename(
-        Requirement.parse("ldndc2nc"), "ldndc2nc/data/ldndc2nc.conf"
-    )
+    fname = Path(__file__).parent / "data" / "ldndc2nc.conf"
     shutil.copyfile(fname, Path.home() / "ldndc2nc.conf")
 
 
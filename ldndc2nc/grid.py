@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""ldndc2nc.grid: map LandscapeDNDC cell ids to the reference grid."""
+
+import hashlib
+import logging
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import xarray as xr
+
+log = logging.getLogger(__name__)
+
+# suffix of the directory of cached grid indices next to the refdata file
+GRIDCACHE = ".gridindex"
+
+# arrays of a (cached) grid index
+ARRAYS = ["ids", "ilat", "ilon", "lats", "lons", "mask", "points", "ipoint"]
+
+
+def _digest(fname):
+    """ sha1 hex digest of the content of a file """
+    sha1 = hashlib.sha1()
+    with open(fname, "rb") as f:
+        for block in iter(lambda: f.read(2 ** 20), b""):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def grid_cache(reffile, refvar):
+    """ cache entry of the grid index of a refdata file and variable
+
+        Entries are keyed by the content of the refdata file.
+
+        :param Path reffile: refdata netCDF file
+        :param str refvar: variable of cell ids
+        :return: entry (directory)
+        :rtype: Path
+    """
+    reffile = Path(reffile)
+    cache = reffile.with_name(reffile.name + GRIDCACHE)
+    return cache / f"{refvar}-{_digest(reffile)}"
+
+
+class GridIndex:
+    """ sorted cell ids and their integer (lat, lon) positions in the grid
+
+        The land mask marks the grid cells with a cell id (simulated cells).
+    """
+
+    def __init__(self, ids, ilat, ilon, lats, lons):
+        self.ids = ids
+        self.ilat = ilat
+        self.ilon = ilon
+        self.lats = lats
+        self.lons = lons
+        self.mask = np.zeros(self.shape, dtype=bool)
+        self.mask[ilat, ilon] = True
+
+        # land points: flat (lat, lon) indices of the simulated cells (sorted)
+        flat = np.ravel_multi_index((ilat, ilon), self.shape)
+        self.points = np.flatnonzero(self.mask)
+        self.ipoint = np.searchsorted(self.points, flat)
+
+    @classmethod
+    def from_cell_ids(cls, cell_ids: xr.DataArray):
+        """ build index from a (lat, lon) array of cell ids (NaN: no cell) """
+        values = cell_ids.transpose("lat", "lon").values
+        ilat, ilon = np.nonzero(~np.isnan(values))
+        ids = values[ilat, ilon].astype("int64")
+
+        order = np.argsort(ids, kind="stable")
+        ids, ilat, ilon = ids[order], ilat[order], ilon[order]
+        if len(ids) > 1 and (np.diff(ids) == 0).any():
+            log.warning("Cell ids are not unique in refdata, using first match")
+        return cls(ids, ilat, ilon, cell_ids.lat.values, cell_ids.lon.values)
+
+    @classmethod
+    def load(cls, entry):
+        """ memory-mapped grid index of a cache entry (None if not cached) """
+        grid = cls.__new__(cls)
+        try:
+            for name in ARRAYS:
+                setattr(grid, name, np.load(entry / f"{name}.npy", mmap_mode="r"))
+        except (FileNotFoundError, OSError, ValueError):
+            return None
+        log.debug(f"Grid index from cache {entry}")
+        return grid
+
+    def save(self, entry):
+        """ store grid index in a cache entry (replacing older entries of
+            the variable)
+        """
+        tmp = entry.with_name(f".{entry.name}.{os.getpid()}.tmp")
+        tmp.mkdir(parents=True, exist_ok=True)
+        for name in ARRAYS:
+            np.save(tmp / f"{name}.npy", np.asarray(getattr(self, name)))
+        try:
+            os.replace(tmp, entry)
+        except OSError:
+            # written by a concurrent run
+            shutil.rmtree(tmp, ignore_errors=True)
+
+        refvar = entry.name.rsplit("-", 1)[0]
+        for old in entry.parent.glob(f"{refvar}-*"):
+            if old != entry and old.name.rsplit("-", 1)[0] == refvar:
+                shutil.rmtree(old, ignore_errors=True)
+
+    @property
+    def shape(self):
+        return (len(self.lats), len(self.lons))
+
+    def _index(self, ids):
+        """ positions of cell ids in the sorted ids """
+        ids = np.asarray(ids)
+        pos = np.searchsorted(self.ids, ids).clip(max=len(self.ids) - 1)
+        unknown = self.ids[pos] != ids
+        if unknown.any():
+            raise KeyError(
+                log.critical(f"Cell ids not in refdata: {sorted(set(ids[unknown]))}")
+            )
+        return pos
+
+    def locate(self, ids):
+        """ return integer (lat, lon) positions of cell ids
+
+            :param np.ndarray ids: cell ids
+            :return: lat and lon indices
+            :rtype: tuple
+        """
+        pos = self._index(ids)
+        return (self.ilat[pos], self.ilon[pos])
+
+    def _fill(self, df, days, shape, fill):
+        """ (time, ...) arrays of the data.frame columns, initialized with fill
+
+            The days may have gaps (e.g. full years without data between).
+
+            :return: arrays per variable, time index and rows of df in days
+            :rtype: tuple
+        """
+        day = np.timedelta64(1, "D")
+        itime = (df.time.values - days.values[0]) // day
+        span = (days.values[-1] - days.values[0]) // day + 1
+        if span != len(days):
+            # position of every day of the span in days (-1: not in days)
+            lookup = np.full(span, -1, dtype=np.int64)
+            lookup[(days.values - days.values[0]) // day] = np.arange(len(days))
+            itime = np.where(
+                (itime >= 0) & (itime < span), lookup[np.clip(itime, 0, span - 1)], -1
+            )
+        inside = (itime >= 0) & (itime < len(days))
+        if not inside.all():
+            df, itime = df[inside], itime[inside]
+
+        arrays = {}
+        for v in df.columns.drop(["id", "time"]):
+            values = df[v].values
+            dtype = values.dtype if values.dtype.kind == "f" else np.float64
+            arrays[v] = (np.full((len(days),) + shape, fill, dtype=dtype), values)
+        return (arrays, itime, df)
+
+    def scatter(self, df, days, gapfill=False):
+        """ scatter data.frame columns into (time, lat, lon) arrays
+
+            :param pd.DataFrame df: data with id, time and variable columns
+            :param pd.DatetimeIndex days: time axis of the output
+            :param bool gapfill: days without data are zero (not NaN) in the
+                                 simulated cells of the land mask
+            :return: dataset with full lat lon extent
+            :rtype: xr.Dataset
+        """
+        arrays, itime, df = self._fill(df, days, self.shape, np.nan)
+        ilat, ilon = self.locate(df.id.values)
+
+        data_vars = {}
+        for v, (out, values) in arrays.items():
+            if gapfill:
+                out[:, self.mask] = 0
+            out[itime, ilat, ilon] = values
+            data_vars[v] = (("time", "lat", "lon"), out)
+
+        return xr.Dataset(
+            data_vars, coords={"time": days, "lat": self.lats, "lon": self.lons}
+        )
+
+    def gather(self, df, days, gapfill=False):
+        """ gather data.frame columns into (time, landpoint) arrays
+
+            The land points are the simulated cells, stored with a landpoint
+            index of the (lat, lon) grid (CF compression by gathering).
+
+            :param pd.DataFrame df: data with id, time and variable columns
+            :param pd.DatetimeIndex days: time axis of the output
+            :param bool gapfill: days without data are zero (not NaN)
+            :return: dataset of the land points
+            :rtype: xr.Dataset
+        """
+        fill = 0 if gapfill else np.nan
+        arrays, itime, df = self._fill(df, days, (len(self.points),), fill)
+        ipoint = self.ipoint[self._index(df.id.values)]
+
+        data_vars = {}
+        for v, (out, values) in arrays.items():
+            out[itime, ipoint] = values
+            data_vars[v] = (("time", "landpoint"), out)
+
+        return xr.Dataset(data_vars, coords={"time": days, **self.landpoint_coords()})
+
+    def landpoint_coords(self):
+        """ lat, lon and (compressed) landpoint coordinates """
+        landpoint = xr.Variable(
+            "landpoint", self.points.astype("int32"), {"compress": "lat lon"}
+        )
+        return {"lat": self.lats, "lon": self.lons, "landpoint": landpoint}
+
+
+def expand_landpoints(ds):
+    """ expand data variables gathered on land points to the (lat, lon) grid
+
+        :param xr.Dataset ds: dataset with a landpoint (compress) coordinate
+        :return: dataset with (..., lat, lon) data variables
+        :rtype: xr.Dataset
+    """
+    dims = ds.landpoint.attrs["compress"].split()
+    shape = tuple(ds.sizes[d] for d in dims)
+    index = np.unravel_index(ds.landpoint.values, shape)
+
+    data_vars = {}
+    for v in ds.data_vars:
+        da = ds[v]
+        if "landpoint" not in da.dims:
+            data_vars[v] = da
+            continue
+        da = da.transpose(..., "landpoint")
+        dtype = da.dtype if da.dtype.kind == "f" else np.float64
+        out = np.full(da.shape[:-1] + shape, np.nan, dtype=dtype)
+        out[(Ellipsis,) + index] = da.values
+        data_vars[v] = xr.Variable(da.dims[:-1] + tuple(dims), out, da.attrs)
+
+    return xr.Dataset(
+        data_vars, coords=ds.drop_vars("landpoint").coords, attrs=ds.attrs
+    )
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""ldndc2nc.lazy: convert ldndc txt files with a lazy, chunked dask graph."""
+
+import logging
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+import dask
+import dask.array as da
+import pandas as pd
+import xarray as xr
+
+from .aggregate import product_config
+from .engines import gzip_threads
+from .ldndc2nc import (
+    _aggregates,
+    _collect_tasks,
+    _combine_ldndc_frames,
+    _encoding_options,
+    _iter_ldndc_file_years,
+    _outfile,
+    _product_outfile,
+    _split_outfile,
+    _write_netcdf,
+    add_units,
+)
+
+log = logging.getLogger(__name__)
+
+# dask schedulers that can be selected
+SCHEDULERS = ["threads", "processes"]
+
+
+def _split_ldndc_file(
+    fname, datacols, years, dtypes, tmpdir, engine="pandas", threads=None
+):
+    """ parse a single ldndc txt file once and store its rows year by year
+
+        Only one year of the file is held in memory (see
+        _iter_ldndc_file_years), every year is pickled to tmpdir.
+
+        :return: pickle file per year
+        :rtype: dict
+    """
+    parts = {}
+    reader = _iter_ldndc_file_years(
+        fname, datacols, years, dtypes, engine=engine, threads=threads
+    )
+    for yr, df in reader:
+        parts[yr] = Path(tmpdir) / f"{fname.name}.{yr}.pkl"
+        df.to_pickle(parts[yr])
+    return parts
+
+
+def _load_year(varData, files, yr):
+    """ combine the rows of year yr of the files split by _split_ldndc_file
+
+        :param dict files: list of pickle files per year per ldndc file type
+    """
+    frames = {
+        task_type: [pd.read_pickle(parts[yr]) for parts in parts_type]
+        for task_type, parts_type in files.items()
+    }
+    return _combine_ldndc_frames(varData, frames)
+
+
+def read_ldndc_txt_lazy(
+    inpath,
+    varData,
+    years,
+    tmpdir,
+    limiter="",
+    engine="pandas",
+    shard=None,
+    threads=None,
+):
+    """ build delayed reads of all ldndc txt files
+
+        Every file is parsed once (chunk-wise) by a delayed task that stores
+        its rows year by year in tmpdir. The data.frame of a year loads (and
+        combines) the rows of that year only, so that a year of the graph holds
+        no other parsed data in memory.
+
+        :param Path tmpdir: directory of the parsed years (size of the data)
+        :param int threads: (optional) decompression threads per file (default:
+            all cores)
+        :return: variable names and delayed data.frame per year
+        :rtype: tuple
+    """
+    varnames, tasks, task_types = _collect_tasks(
+        inpath, varData, years, limiter=limiter, shard=shard
+    )
+    split_file = dask.delayed(_split_ldndc_file, pure=True)
+
+    files = {}
+    for task_type, (fname, datacols, _, dtypes) in zip(task_types, tasks):
+        files.setdefault(task_type, []).append(
+            split_file(
+                fname,
+                datacols,
+                years,
+                dtypes,
+                str(tmpdir),
+                engine=engine,
+                threads=threads,
+            )
+        )
+
+    yearly = {
+        yr: dask.delayed(_load_year, pure=True)(varData, files, yr) for yr in years
+    }
+    return (varnames, yearly)
+
+
+def lazy_year_dataset(yr, df, grid, config, layout="grid"):
+    """ dask-backed dataset of one year (one chunk per variable)
+
+        :param int yr: year
+        :param Delayed df: delayed data.frame of year
+        :param GridIndex grid: reference grid
+        :param str layout: grid or landpoints (simulated cells only)
+        :return: dataset with full year and full lat lon extent
+        :rtype: xr.Dataset
+    """
+    days = pd.date_range(start=f"1/1/{yr}", end=f"12/31/{yr}")
+    if layout == "landpoints":
+        ds_year = dask.delayed(grid.gather, pure=True)(df, days, gapfill=True)
+        dims, shape = ("time", "landpoint"), (len(days), len(grid.points))
+        coords = {"time": days, **grid.landpoint_coords()}
+    else:
+        ds_year = dask.delayed(grid.scatter, pure=True)(df, days, gapfill=True)
+        dims, shape = ("time", "lat", "lon"), (len(days),) + grid.shape
+        coords = {"time": days, "lat": grid.lats, "lon": grid.lons}
+
+    data_vars = {}
+    for var in config.variables:
+        data = da.from_delayed(
+            ds_year[var.name].data, shape=shape, dtype=var.memory_dtype
+        )
+        data_vars[var.name] = (dims, data)
+
+    ds = xr.Dataset(data_vars, coords=coords)
+    return add_units(ds, config)
+
+
+@contextmanager
+def scheduler(name="threads", workers=1, memory_limit=None):
+    """ configure the local dask scheduler used by dask.compute
+
+        Worker processes and memory limits require dask.distributed (netCDF
+        writes need its locks), its workers spill data to disk and pause once
+        they reach the limit. The graph has to be built within this context,
+        so that xarray picks a suitable write lock.
+    """
+    if memory_limit or name == "processes":
+        from dask.distributed import Client, LocalCluster
+
+        with LocalCluster(
+            n_workers=workers,
+            threads_per_worker=1,
+            processes=name == "processes",
+            memory_limit=memory_limit,
+        ) as cluster, Client(cluster):
+            yield
+    else:
+        with dask.config.set(scheduler=name, num_workers=workers):
+            yield
+
+
+def _write_delayed(ds, fname, config, args):
+    """ delayed write of dataset in the output format """
+    if args.format == "zarr":
+        from .zarr_writer import write_zarr_delayed
+
+        return write_zarr_delayed(
+            ds,
+            fname,
+            config,
+            consolidated=args.consolidated,
+            options=_encoding_options(args),
+        )
+    return _write_netcdf(
+        ds, fname, config, compute=False, options=_encoding_options(args),
+    )
+
+
+def convert_lazy(args, config, grid, years):
+    """ convert years with a lazy dask graph and compute it """
+    with scheduler(
+        args.scheduler, args.jobs, args.memory_limit
+    ), tempfile.TemporaryDirectory(prefix="ldndc2nc-") as tmpdir:
+        _, yearly = read_ldndc_txt_lazy(
+            args.indir,
+            config.section("variables"),
+            years,
+            tmpdir,
+            limiter=args.limiter,
+            engine=args.engine,
+            shard=args.shard,
+            # -j workers share the cores for decompression
+            threads=gzip_threads(args.jobs),
+        )
+        datasets = [
+            lazy_year_dataset(yr, yearly[yr], grid, config, args.layout) for yr in years
+        ]
+
+        if args.split:
+            outputs = [
+                (_split_outfile(args, yr), ds) for yr, ds in zip(years, datasets)
+            ]
+        else:
+            outputs = [(_outfile(args), xr.concat(datasets, dim="time"))]
+
+        writes = []
+        for fname, ds in outputs:
+            writes.append(_write_delayed(ds, fname, config, args))
+            for product, agg in _aggregates(ds, config, args).items():
+                writes.append(
+                    _write_delayed(
+                        agg,
+                        _product_outfile(fname, product),
+                        product_config(config),
+                        args,
+                    )
+                )
+
+        dask.compute(*writes)
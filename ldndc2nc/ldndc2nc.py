@@ -2,22 +2,44 @@
 #
 # ldndc2nc.py
 # ==================
-"""ldndc2nc.ldndc2nc: provides entry point main()."""
+"""ldndc2nc.ldndc2nc: convert ldndc txt files (run by ldndc2nc.cli.main)."""
 
 import calendar
+import copy
 import datetime as dt
-import gzip
+import json
 import logging
 import re
 import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import closing
+from functools import partial
 from pathlib import Path
 
+import netCDF4
 import numpy as np
 import pandas as pd
 import xarray as xr
 
-from .cli import cli
-from .config_handler import ConfigHandler
+from . import profiler
+from .aggregate import aggregate, product_config
+from .batch import format_summary, run_jobs
+from .cache import ParseCache
+from .chunking import CHUNK_SIZE, chunk_shape
+from .cli import main  # noqa: F401 (entry point of earlier installs)
+from .compression import (
+    BENCHMARK_LEVELS,
+    COMPRESSION,
+    benchmark,
+    check_compression,
+    format_records,
+    netcdf_compression,
+    variable_compression,
+)
+from .engines import gzip_threads, iter_table, last_day, read_table
+from .grid import GridIndex, grid_cache
+from .merge import find_partials, in_shard, merge_partials, shard_outfile
+from .options import FORMATS
 
 log = logging.getLogger(__name__)
 
@@ -28,6 +50,12 @@ defaultAttrsDA = {"_FillValue": NODATA, "missing_value": NODATA}
 # standard columns
 basecols = ["id"]
 
+# number of rows parsed at once when streaming ldndc txt files
+CHUNKSIZE = 100000
+
+# encoding keys of data variables that xarray cannot pass to netCDF4
+NETCDF4_KEYS = ["compression", "blosc_shuffle"]
+
 
 # catch CTRL+C and abort gracefully without stack trace
 def handle_exception(exc_type, exc_value, exc_traceback):
@@ -64,21 +92,6 @@ def _daterange(start_date, end_date):
         yield start_date + dt.timedelta(n)
 
 
-def _gapfill_df(df, dates, ids):
-    """ gap-fill data.frame """
-    basecoldata = [(0, d.year, d.timetuple().tm_yday) for d in dates]
-    df_ref_all = []
-    for id in ids:
-        df_ref = pd.DataFrame(basecoldata, columns=basecols)
-        df_ref.id = id
-        df_ref_all.append(df_ref)
-    df_template = pd.concat(df_ref_all, axis=0)
-    df = pd.merge(df_template, df, how="left", on=basecols)
-    df = df.fillna(0.0)
-    df.reset_index()
-    return df
-
-
 def _ndays(yr):
     """ return the number of days in year """
     ndays = 365
@@ -96,13 +109,10 @@ def _all_items_identical(x):
 
 
 def create_id_mapper(cell_ids: xr.DataArray):
-    dm = {}
-    for ila, la in enumerate(cell_ids.lat.values):
-        for ilo, lo in enumerate(cell_ids.lon.values):
-            the_id = cell_ids.loc[{"lat": la, "lon": lo}].values
-            if not np.isnan(the_id):
-                dm[int(the_id)] = (la, lo)
-    return dm
+    """ map cell ids to their (lat, lon) coordinates """
+    grid = GridIndex.from_cell_ids(cell_ids)
+    lats, lons = grid.lats[grid.ilat].tolist(), grid.lons[grid.ilon].tolist()
+    return dict(zip(grid.ids.tolist(), zip(lats, lons)))
 
 
 def _extract_fileno(fname):
@@ -128,13 +138,15 @@ def _extract_fileno(fname):
     return fileno
 
 
-def _select_files(inpath, ldndc_file_type, limiter=""):
+def _select_files(inpath, ldndc_file_type, limiter="", shard=None):
     """ find all ldndc outfiles of given type from inpath (limit using limiter)
 
         :param str inpath: path where files are located
         :param str ldndc_file_type: LandscapeDNDC txt filename pattern
                    (i.e. soilchemistry-daily.txt)
         :param str limiter: (optional) limit selection using this expression
+        :param tuple shard: (optional) limit selection to file numbers of
+                   shard (i, N)
         :return: list of matching LandscapeDNDC txt files in indir
         :rtype: list
     """
@@ -145,6 +157,9 @@ def _select_files(inpath, ldndc_file_type, limiter=""):
     if limiter != "":
         infiles = [x for x in infiles if limiter in x.name]
 
+    if shard is not None:
+        infiles = [x for x in infiles if in_shard(_extract_fileno(x), shard)]
+
     infiles.sort()
 
     if len(infiles) == 0:
@@ -152,6 +167,8 @@ def _select_files(inpath, ldndc_file_type, limiter=""):
         msg += "Input dir:    %s\n" % inpath
         if limiter != "":
             msg += "\nFilter used:  %s" % limiter
+        if shard is not None:
+            msg += "\nShard used:   %d/%d" % shard
         log.critical(msg)
         exit(1)
 
@@ -183,55 +200,226 @@ def _limit_df_years(years, df, yearcol="year"):
     return df
 
 
-def read_ldndc_txt(inpath, varData, years, limiter=""):
-    """ parse ldndc txt output files and return dataframe """
+def _parse_time(df):
+    """ replace datetime column with daily time column """
+    if "datetime" in df.columns:
+        df["time"] = df.datetime.astype("datetime64[D]")
+        df = df.drop("datetime", axis=1)
+    return df
 
-    ldndc_file_types = varData.keys()
 
-    varnames = []  # (updated) column names
-    Dids = {}  # file ids
+def _empty_frame(datacols, dtypes=None):
+    """ data.frame without rows (columns of a parsed ldndc txt file) """
+    return (
+        pd.DataFrame(
+            {"id": pd.Series(dtype="int64"), "time": pd.Series(dtype="datetime64[ns]")}
+        )
+        .reindex(columns=["id", "time"] + datacols)
+        .astype(dtypes or {})
+    )
 
-    df_all = []
 
-    for ldndc_file_type in ldndc_file_types:
+def _read_ldndc_file(
+    fname, datacols, years, dtypes=None, cache=None, engine="pandas", threads=None
+):
+    """ parse a single ldndc txt file
+
+        :param Path fname: ldndc txt file (plain or gzip compressed)
+        :param list datacols: data columns to read
+        :param list years: years to keep
+        :param dict dtypes: (optional) float dtypes of datacols
+        :param ParseCache cache: (optional) cache of parsed files
+        :param str engine: parse engine (pandas or arrow)
+        :param int threads: (optional) decompression threads (default: all cores)
+        :return: cell ids found in file and data limited to years
+        :rtype: tuple
+    """
+    with profiler.stage("parse", file=fname.name) as record:
+        if cache:
+            # cache entries hold all years of a file
+            columns = [(c, (dtypes or {}).get(c, "float64")) for c in datacols]
+            df = cache.load(fname, columns)
+            if df is None:
+                df = read_table(fname, datacols, dtypes, engine=engine, threads=threads)
+                df = _parse_time(df)
+                cache.store(fname, columns, df)
+        else:
+            # drop rows outside of years while parsing, stop after the last
+            # year (files are written in chronological order)
+            chunks = []
+            reader = iter_table(
+                fname, datacols, CHUNKSIZE, dtypes, engine=engine, threads=threads
+            )
+            with closing(reader):
+                for chunk in reader:
+                    if chunk.empty:
+                        continue
+                    chunk = _parse_time(chunk)
+                    chunk_years = chunk.time.dt.year
+                    selected = chunk_years.isin(years)
+                    chunks.append(chunk if selected.all() else chunk[selected])
+                    if chunk_years.iat[-1] > max(years):
+                        break
+            if chunks:
+                df = pd.concat(chunks, axis=0)
+            else:
+                # header only
+                df = _empty_frame(datacols, dtypes)
+        record["rows"] = len(df)
+
+    with profiler.stage("sort", file=fname.name) as record:
+        df = _limit_df_years(years, df)
+        ids = sorted(list(set(df["id"])))
+        df = df.sort_values(by=["id", "time"])
+        record["rows"] = len(df)
+    return (ids, df)
+
+
+def _iter_ldndc_file_years(
+    fname,
+    datacols,
+    years,
+    dtypes=None,
+    chunksize=CHUNKSIZE,
+    engine="pandas",
+    threads=None,
+):
+    """ parse a single ldndc txt file chunk-wise and yield it year by year
+
+        LandscapeDNDC writes its output in chronological order, so only the
+        rows of the current year (plus one chunk) are held in memory. Reading
+        stops once the last requested year is complete.
+
+        :param Path fname: ldndc txt file (plain or gzip compressed)
+        :param list datacols: data columns to read
+        :param list years: years to yield
+        :param dict dtypes: (optional) float dtypes of datacols
+        :param int chunksize: number of rows parsed at once
+        :param str engine: parse engine (pandas or arrow)
+        :param int threads: (optional) decompression threads (default: all cores)
+        :return: (year, data) for every requested year (data might be empty)
+        :rtype: iterator
+    """
+    years = sorted(years)
+    reader = iter_table(
+        fname, datacols, chunksize, dtypes, engine=engine, threads=threads
+    )
+    pending = []
+    empty = _empty_frame(datacols, dtypes)
+    last_year = None  # year of the last row parsed so far
+    try:
+        for yr in years:
+            # read until the data is past the current year
+            while last_year is None or last_year <= yr:
+                try:
+                    chunk = _parse_time(next(reader))
+                except StopIteration:
+                    break
+                if chunk.empty:
+                    # header only (e.g. simulation still running)
+                    continue
+                last_year = chunk.time.dt.year.iat[-1]
+                empty = chunk.iloc[:0]
+                chunk = chunk[chunk.time.dt.year.isin(years)]
+                if len(chunk) > 0:
+                    pending.append(chunk)
+
+            df = pd.concat(pending, axis=0) if pending else empty
+            data_years = df.time.dt.year
+            if (data_years < yr).any():
+                log.warning(f"Skipping rows out of chronological order in {fname}")
+            pending = [df[data_years > yr]] if (data_years > yr).any() else []
+            yield (yr, df[data_years == yr].sort_values(by=["id", "time"]))
+    finally:
+        reader.close()
+
+
+def _read_ldndc_files(tasks, jobs=1, cache=None, engine="pandas", labels=None):
+    """ parse (fname, datacols, years, dtypes) tasks, optionally in workers
+
+        :param list tasks: arguments for _read_ldndc_file
+        :param int jobs: number of worker processes (1: serial)
+        :param ParseCache cache: (optional) cache of parsed files
+        :param str engine: parse engine (pandas or arrow)
+        :param list labels: (optional) profiler labels of tasks
+        :return: results of _read_ldndc_file in task order
+        :rtype: list
+    """
+    labels = labels or [{}] * len(tasks)
+    if jobs > 1 and len(tasks) > 1:
+        # workers share the cores for decompression
+        workers = min(jobs, len(tasks))
+        read_file = partial(
+            _read_ldndc_file, cache=cache, engine=engine, threads=gzip_threads(workers)
+        )
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            active = profiler.active()
+            if active is None:
+                return list(executor.map(read_file, *zip(*tasks)))
+
+            # workers record stages with a profiler of their own
+            remote = partial(profiler.remote, active.hot_stage)
+            results = []
+            for result, records, stats in executor.map(
+                remote, labels, [read_file] * len(tasks), *zip(*tasks)
+            ):
+                active.merge(records, stats)
+                results.append(result)
+            return results
+
+    read_file = partial(_read_ldndc_file, cache=cache, engine=engine)
+    results = []
+    for task, task_labels in zip(tasks, labels):
+        with profiler.labels(**task_labels):
+            results.append(read_file(*task))
+    return results
+
+
+def _collect_tasks(inpath, varData, years, limiter="", shard=None):
+    """ find the files of all ldndc file types and the columns to parse
+
+        :return: variable names, (fname, datacols, years, dtypes) tasks and
+                 file types
+        :rtype: tuple
+    """
+    varnames = []  # (updated) column names
+    tasks, task_types = [], []
 
-        dfs = []
-        datacols = []
+    for ldndc_file_type in varData.keys():
+        dtypes = {}
 
-        infiles = _select_files(inpath, ldndc_file_type, limiter=limiter)
+        infiles = _select_files(inpath, ldndc_file_type, limiter=limiter, shard=shard)
 
         # special treatment for tuple entries in varData
         for var in varData[ldndc_file_type]:
             varnames.append(var.name)
-            datacols.extend(var.sources)
-
-        # iterate over all files of one ldndc file type
-        for fcnt, fname in enumerate(infiles):
-            fno = _extract_fileno(fname)
-            basecols_extended = []
-
-            # conditional open (either regular or gzip based on suffix)
-            opener = gzip.open if str(fname).endswith(".gz") else open
-
-            with opener(fname, "rt") as f:
-                header = f.readline()
-                if "datetime" in header:
-                    basecols_extended.append("datetime")
-                for b in basecols:
-                    if b in header:
-                        basecols_extended.append(b)
-
-            df = pd.read_table(
-                fname, error_bad_lines=False, usecols=basecols_extended + datacols
-            )
-            if "datetime" in df.columns:
-                df["time"] = df.datetime.astype("datetime64[D]")
-                df = df.drop("datetime", axis=1)
-            Dids.setdefault(fno, sorted(list(set(df["id"]))))
 
-            df = _limit_df_years(years, df)
-            df = df.sort_values(by=["id", "time"])
-            dfs.append(df)
+            # sources shared by several variables use the wider dtype
+            for source in var.sources:
+                if dtypes.get(source) != "float64":
+                    dtypes[source] = var.memory_dtype
+        datacols = list(dtypes)
+
+        for fname in infiles:
+            tasks.append((fname, datacols, years, dtypes))
+            task_types.append(ldndc_file_type)
+
+    return (varnames, tasks, task_types)
+
+
+def _combine_ldndc_frames(varData, frames):
+    """ merge the per-file data.frames of all ldndc file types
+
+        :param dict varData: variables per ldndc file type
+        :param dict frames: list of per-file data.frames per ldndc file type
+        :return: data.frame with id, time and variable columns
+        :rtype: pd.DataFrame
+    """
+    df_all = []
+
+    for ldndc_file_type in varData.keys():
+
+        dfs = frames.get(ldndc_file_type, [])
 
         # we don't have any dataframes, return
         # TODO: the control flow here should be more obvious
@@ -247,7 +435,7 @@ def read_ldndc_txt(inpath, varData, years, limiter=""):
 
         # sum columns if this was requested in the conf file
         for var in varData[ldndc_file_type]:
-            df[var.name] = df[var.sources].sum(axis=1)
+            df[var.name] = df[var.sources].sum(axis=1).astype(var.memory_dtype)
             if var.name not in cols_to_keep:
                 cols_to_keep.append(var.name)
             else:
@@ -272,112 +460,730 @@ def read_ldndc_txt(inpath, varData, years, limiter=""):
 
     df = pd.concat(df_all, axis=1).fillna(0.0)
     df = df.reset_index()
+    return df
+
+
+def read_ldndc_txt(
+    inpath, varData, years, limiter="", jobs=1, cache=None, engine="pandas", shard=None,
+):
+    """ parse ldndc txt output files and return dataframe """
+
+    varnames, tasks, task_types = _collect_tasks(
+        inpath, varData, years, limiter=limiter, shard=shard
+    )
 
+    Dids = {}  # file ids
+    frames = {}
+
+    # parse files of all ldndc file types (possibly concurrently)
+    labels = [{"file_type": task_type} for task_type in task_types]
+    results = _read_ldndc_files(
+        tasks, jobs=jobs, cache=cache, engine=engine, labels=labels
+    )
+
+    for (fname, *_), task_type, (ids, df) in zip(tasks, task_types, results):
+        Dids.setdefault(_extract_fileno(fname), ids)
+        frames.setdefault(task_type, []).append(df)
+
+    with profiler.stage("combine") as record:
+        df = _combine_ldndc_frames(varData, frames)
+        record["rows"] = len(df)
     return (varnames, df)
 
 
-def main():
-    # parse args
-    args = cli()
+def iter_ldndc_years(inpath, varData, years, limiter="", engine="pandas", shard=None):
+    """ parse ldndc txt output files and yield dataframes year by year
 
-    config = ConfigHandler(args.config)
+        Like read_ldndc_txt, but only one year of data is held in memory.
+        Years without any data are skipped.
+    """
 
-    if args.storeconfig:
-        config.write()
+    varnames, tasks, task_types = _collect_tasks(
+        inpath, varData, years, limiter=limiter, shard=shard
+    )
+    readers = [_iter_ldndc_file_years(*task, engine=engine) for task in tasks]
+    yearly = zip(*readers)
+
+    found = False
+    for yr in years:
+        # readers yield every requested year
+        with profiler.stage("parse", year=yr) as record:
+            parts = next(yearly)
+            record["rows"] = sum(len(df) for _, df in parts)
+
+        if all(len(df) == 0 for _, df in parts):
+            log.warning("Year %d not in data" % yr)
+            continue
+        found = True
 
-    # read or build refdata array
-    def use_cli_refdata():
-        return args.refinfo is not None
+        # keep empty frames so that all variables are present in every year
+        frames = {}
+        for task_type, (_, df) in zip(task_types, parts):
+            frames.setdefault(task_type, []).append(df)
 
-    if use_cli_refdata():
-        reffile, refvar = args.refinfo
-        reffile = Path(reffile)
-        if reffile.is_file():
-            with (xr.open_dataset(reffile)) as refnc:
-                if refvar not in refnc.data_vars:
-                    raise ValueError(log.critical(f"Var <{refvar}> not in {reffile}"))
-                cell_ids = refnc[refvar].where(refnc[refvar] > 0)
-                lats, lons = refnc.lat.values, refnc.lon.values
+        with profiler.stage("combine", year=yr) as record:
+            df = _combine_ldndc_frames(varData, frames)
+            record["rows"] = len(df)
+        yield (yr, varnames, df)
+
+    if not found:
+        if len(years) == 1:
+            log.critical("Year %d not in data" % years[0])
         else:
-            raise FileNotFoundError(
-                log.critical(f"Specified reffile {reffile} not found")
+            log.critical("Year range %d-%d not in data" % (years[0], years[-1]))
+        exit(1)
+
+
+def _fill_value(dtype):
+    """ fill value of integer dtype (NODATA if it can be represented) """
+    info = np.iinfo(dtype)
+    return NODATA if info.min <= NODATA <= info.max else info.min
+
+
+def get_datavar_encodings(
+    ds,
+    variables=None,
+    chunking="balanced",
+    chunk_size=CHUNK_SIZE,
+    codec=COMPRESSION["codec"],
+    level=COMPRESSION["level"],
+    shuffle=COMPRESSION["shuffle"],
+):
+    """ netCDF encodings of all data variables
+
+        :param xr.Dataset ds: dataset to write
+        :param list variables: (optional) variables with output dtype, packing
+                               and compression
+        :param str chunking: chunking policy (map, timeseries or balanced)
+        :param int chunk_size: target size of a chunk (bytes)
+        :param str codec: codec (zlib, zstd, blosc-lz4 or none)
+        :param int level: compression level
+        :param bool shuffle: shuffle bytes before compression
+        :return: encoding per data variable
+        :rtype: dict
+    """
+    variables = {var.name: var for var in variables or []}
+
+    ENCODINGS = {}
+    for v in ds.data_vars:
+        var = variables.get(v)
+        new_encoding = netcdf_compression(
+            *variable_compression(var, codec, level, shuffle)
+        )
+
+        if var and var.dtype:
+            new_encoding["dtype"] = var.dtype
+            if var.dtype.startswith("int"):
+                new_encoding["_FillValue"] = _fill_value(var.dtype)
+            if var.scale_factor is not None:
+                new_encoding["scale_factor"] = var.scale_factor
+            if var.add_offset is not None:
+                new_encoding["add_offset"] = var.add_offset
+
+        itemsize = np.dtype(new_encoding.get("dtype", ds[v].dtype)).itemsize
+        new_encoding["chunksizes"] = chunk_shape(
+            ds[v].dims, ds[v].shape, itemsize, policy=chunking, chunk_size=chunk_size
+        )
+        ENCODINGS[v] = new_encoding
+    return ENCODINGS
+
+
+def _days(years):
+    """ days of full years (sorted years, possibly with gaps) """
+    days = pd.date_range(start=f"1/1/{years[0]}", end=f"12/31/{years[-1]}")
+    if len(years) <= years[-1] - years[0]:
+        days = days[days.year.isin(years)]
+    return days
+
+
+def _year_dataset(yr, df, grid, config, layout="grid"):
+    """ create dataset with full year and full lat lon extent of data
+
+        With layout landpoints, only the simulated cells are stored.
+    """
+    return _years_dataset([yr], df, grid, config, layout)
+
+
+def _years_dataset(years, df, grid, config, layout="grid"):
+    """ create dataset with full years and full lat lon extent of data
+
+        The (time, ...) array of every variable is allocated once for all
+        years and the rows of df are written into it.
+    """
+
+    # make sure we have full years and full lat lon extent of data, days
+    # without data (i.e. from yearly report files) are zero in simulated cells
+    days = _days(years)
+    if layout == "landpoints":
+        ds = grid.gather(df, days, gapfill=True)
+    else:
+        ds = grid.scatter(df, days, gapfill=True)
+
+    return add_units(ds, config)
+
+
+def add_units(ds, config):
+    """ set units attribute of data variables from the conf file """
+    for v in ds.data_vars:
+        units = next((var.unit for var in config.variables if var.name == v), None)
+        if units:
+            ds[v].attrs["units"] = units
+    return ds
+
+
+def _create_netcdf4_variables(ds, fname, encodings):
+    """ create variables with codecs that xarray does not pass to netCDF4 """
+    with netCDF4.Dataset(fname, "a") as nc:
+        for v, encoding in encodings.items():
+            dtype = np.dtype(encoding.get("dtype", ds[v].dtype))
+            fill_value = encoding.get(
+                "_FillValue", np.nan if dtype.kind == "f" else None
+            )
+            nc.createVariable(
+                v,
+                dtype,
+                ds[v].dims,
+                fill_value=fill_value,
+                chunksizes=encoding["chunksizes"],
+                **{
+                    k: encoding[k]
+                    for k in ["complevel", "shuffle"] + NETCDF4_KEYS
+                    if k in encoding
+                },
             )
+
+
+def _write_netcdf(ds, fname, config, unlimited=False, compute=True, options=None):
+    """ write dataset (optionally with an unlimited time dimension)
+
+        Variables with codecs other than zlib are created with netCDF4 first
+        (after the coordinates), xarray then writes their data.
+
+        :param dict options: (optional) options of get_datavar_encodings
+    """
+    ds.attrs = config.global_info
+    encodings = get_datavar_encodings(ds, config.variables, **(options or {}))
+    unlimited_dims = ["time"] if unlimited else None
+
+    created = {v: e for v, e in encodings.items() if "compression" in e}
+    if created:
+        ds.drop_vars(list(ds.data_vars)).to_netcdf(
+            fname, format="NETCDF4_CLASSIC", unlimited_dims=unlimited_dims
+        )
+        _create_netcdf4_variables(ds, fname, created)
+        for encoding in created.values():
+            for k in ["complevel", "shuffle"] + NETCDF4_KEYS:
+                encoding.pop(k, None)
+
+    return ds.to_netcdf(
+        fname,
+        mode="a" if created else "w",
+        format="NETCDF4_CLASSIC",
+        encoding=encodings,
+        unlimited_dims=unlimited_dims,
+        compute=compute,
+    )
+
+
+def _append_netcdf(ds, fname):
+    """ append dataset along the unlimited time dimension of an existing file """
+    with netCDF4.Dataset(fname, "a") as nc:
+        missing = set(ds.data_vars).difference(nc.variables)
+        if missing:
+            raise ValueError(log.critical(f"Vars {sorted(missing)} not in {fname}"))
+
+        time = nc["time"]
+        start, end = len(time), len(time) + len(ds.time)
+        time[start:end] = netCDF4.date2num(
+            ds.indexes["time"].to_pydatetime(), time.units, time.calendar
+        )
+        for v in ds.data_vars:
+            values = ds[v].transpose(*nc[v].dimensions).values
+            nc[v][start:end, ...] = np.ma.masked_invalid(values)
+
+
+def _netcdf_years(fname):
+    """ years in the (appendable) time axis of an existing netCDF file """
+    with netCDF4.Dataset(fname) as nc:
+        if not nc.dimensions["time"].isunlimited():
+            log.critical(
+                f"Cannot append to {fname} (time dimension is fixed, "
+                "write it with --append or --stream)"
+            )
+            exit(1)
+        time = nc["time"]
+        dates = netCDF4.num2date(time[:], time.units, time.calendar)
+    return sorted(set(d.year for d in dates))
+
+
+def _outfile(args):
+    fname = (Path(args.outdir) / args.outfile).with_suffix(FORMATS[args.format])
+    if args.shard is not None:
+        fname = shard_outfile(fname, args.shard)
+    return fname
+
+
+def _split_outfile(args, yr):
+    return Path(args.outdir) / f"{args.outfile[:-3]}_{yr}{FORMATS[args.format]}"
+
+
+def _encoding_options(args):
+    """ options of get_datavar_encodings from args """
+    return {
+        "chunking": args.chunking,
+        "chunk_size": args.chunk_size,
+        "codec": args.codec,
+        "level": args.level,
+        "shuffle": args.shuffle,
+    }
+
+
+def _write_output(ds, fname, config, args, unlimited=False):
+    """ write dataset in the output format (netCDF: optionally unlimited time) """
+    if args.format == "zarr":
+        from .zarr_writer import write_zarr
+
+        write_zarr(
+            ds,
+            fname,
+            config,
+            jobs=args.jobs,
+            consolidated=args.consolidated,
+            options=_encoding_options(args),
+        )
     else:
-        raise ValueError(log.critical("You need to specify a reffile"))
+        _write_netcdf(
+            ds, fname, config, unlimited=unlimited, options=_encoding_options(args)
+        )
+
+
+def _append_output(ds, fname, args):
+    """ append dataset along the time dimension of existing output """
+    if args.format == "zarr":
+        from .zarr_writer import append_zarr
+
+        append_zarr(ds, fname, jobs=args.jobs, consolidated=args.consolidated)
+    else:
+        _append_netcdf(ds, fname)
+
+
+def _output_years(fname, args):
+    """ years in the time axis of existing output """
+    if args.format == "zarr":
+        from .zarr_writer import zarr_years
+
+        return zarr_years(fname)
+    return _netcdf_years(fname)
+
+
+def _input_end(args, config):
+    """ last day with data in all daily input files (None: no daily files)
+
+        LandscapeDNDC writes its files in chronological order, so the days up
+        to the end of the file that is furthest behind are complete.
+    """
+    ends = [
+        last_day(fname)
+        for ldndc_file_type in config.section("variables")
+        if "daily" in ldndc_file_type
+        for fname in _select_files(
+            args.indir, ldndc_file_type, args.limiter, args.shard
+        )
+    ]
+    if not ends:
+        return None
+    # files without rows: no complete days
+    return min(np.datetime64("0001-01-01") if end is None else end for end in ends)
+
+
+def _select_years(args, config):
+    """ years to convert (in append mode only the ones missing in the output)
+
+        In append mode, years that are incomplete in the input (i.e. the last
+        year of a running simulation) are not converted, a later run converts
+        them once they are complete.
+
+        :return: years
+        :rtype: list
+    """
+    years = list(args.years)
+    if not args.append:
+        return years
+
+    end = _input_end(args, config)
+    if end is not None:
+        incomplete = [yr for yr in years if np.datetime64(f"{yr}-12-31") > end]
+        if incomplete:
+            log.info(f"Skipping years {incomplete} incomplete in the input ({end})")
+        years = [yr for yr in years if yr not in incomplete]
+
+    if args.split:
+        # yearly files are up to date if written after the last input change
+        newest = max(
+            fname.stat().st_mtime
+            for ldndc_file_type in config.section("variables")
+            for fname in _select_files(
+                args.indir, ldndc_file_type, args.limiter, args.shard
+            )
+        )
+
+        def is_current(yr):
+            fname = _split_outfile(args, yr)
+            return fname.exists() and fname.stat().st_mtime >= newest
+
+        current = [yr for yr in years if is_current(yr)]
+        if current:
+            log.info(f"Skipping up-to-date yearly files: {current}")
+        return [yr for yr in years if yr not in current]
+
+    outfile = _outfile(args)
+    if not outfile.exists():
+        return years
+
+    existing = _output_years(outfile, args)
+    gaps = [yr for yr in years if yr < existing[-1] and yr not in existing]
+    if gaps:
+        log.warning(f"Years {gaps} are older than the last year in {outfile}")
+    return [yr for yr in years if yr > existing[-1]]
+
+
+def _product_outfile(fname, product):
+    """ file of an aggregated product next to the (daily) output file """
+    return fname.with_name(f"{fname.stem}_{product}{fname.suffix}")
+
+
+def _aggregates(ds, config, args):
+    """ aggregated products of a dataset
+
+        :return: aggregated dataset per product
+        :rtype: dict
+    """
+    products = {}
+    for product in args.aggregates:
+        with profiler.stage("aggregate", product=product):
+            products[product] = aggregate(ds, config.variables, product)
+    return products
+
+
+def _write_products(products, fname, config, args, unlimited=False):
+    """ write (or append) aggregated products next to the output file fname
+
+        Products of an output with an unlimited time dimension get one too.
+    """
+    product_conf = product_config(config)
+    for product, ds in products.items():
+        outfile = _product_outfile(fname, product)
+        if args.append and not args.split and outfile.exists():
+            with profiler.stage("append", product=product):
+                _append_output(ds, outfile, args)
+        else:
+            with profiler.stage("write", product=product):
+                _write_output(ds, outfile, product_conf, args, unlimited=unlimited)
+
+
+def _write_year(yr, ds, fname, config, args):
+    with profiler.stage("write", year=yr):
+        _write_output(ds, fname, config, args)
+    _write_products(_aggregates(ds, config, args), fname, config, args)
+
+
+class _YearWriter:
+    """ write yearly files (split mode), optionally by a pool of processes
+
+        At most max_pending years are submitted but not yet written, every
+        one of them holds a copy of its dataset. The files are identical to
+        the ones written serially.
+    """
+
+    def __init__(self, config, args, jobs=1, max_pending=None):
+        self.config = config
+        self.args = args
+        self.max_pending = max_pending or jobs
+        self.pending = set()
+        self.executor = None
+        if jobs > 1:
+            self.executor = ProcessPoolExecutor(max_workers=jobs)
+            # workers write zarr variables serially
+            self.args = copy.copy(args)
+            self.args.jobs = 1
+
+    def _collect(self, futures):
+        active = profiler.active()
+        for future in futures:
+            self.pending.remove(future)
+            result = future.result()
+            if active:
+                active.merge(*result[1:])
+
+    def write(self, yr, ds):
+        fname = _split_outfile(self.args, yr)
+        if self.executor is None:
+            _write_year(yr, ds, fname, self.config, self.args)
+            return
+
+        while len(self.pending) >= self.max_pending:
+            done, _ = wait(self.pending, return_when=FIRST_COMPLETED)
+            self._collect(done)
+
+        task = (_write_year, yr, ds, fname, self.config, self.args)
+        active = profiler.active()
+        if active:
+            task = (profiler.remote, active.hot_stage, {}) + task
+        self.pending.add(self.executor.submit(*task))
+
+    def close(self):
+        if self.executor is not None:
+            self._collect(list(self.pending))
+            self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        elif self.executor is not None:
+            for future in self.pending:
+                future.cancel()
+            self.executor.shutdown()
+
+
+def _convert_stream(args, config, grid, years):
+    """ read, reindex and write one year at a time """
+    outfile = _outfile(args)
+    append = args.append and outfile.exists()
+
+    yearly = iter_ldndc_years(
+        args.indir,
+        config.section("variables"),
+        years,
+        limiter=args.limiter,
+        engine=args.engine,
+        shard=args.shard,
+    )
+    products = {product: [] for product in args.aggregates}
+    with _split_writer(args, config) as writer:
+        for cnt, (yr, _, df) in enumerate(yearly):
+            with profiler.stage("reindex", year=yr) as record:
+                ds = _year_dataset(yr, df, grid, config, args.layout)
+                record["rows"] = len(df)
+            del df
+
+            if args.split:
+                writer.write(yr, ds)
+                continue
+
+            if cnt == 0 and not append:
+                with profiler.stage("write", year=yr):
+                    _write_output(ds, outfile, config, args, unlimited=True)
+            else:
+                with profiler.stage("append", year=yr):
+                    _append_output(ds, outfile, args)
+
+            # aggregates are small, keep them until all years are read
+            for product, agg in _aggregates(ds, config, args).items():
+                products[product].append(agg)
+
+    if products and not args.split:
+        products = {p: xr.concat(aggs, dim="time") for p, aggs in products.items()}
+        _write_products(products, outfile, config, args, unlimited=True)
+
+
+def _split_writer(args, config):
+    """ writer of yearly files (a pool of -j processes in split mode) """
+    jobs = args.jobs if args.split else 1
+    return _YearWriter(config, args, jobs=jobs, max_pending=args.years_in_flight)
+
+
+def _convert(args, config, years, grid=None):
+    """ convert years of ldndc txt files to netCDF (grid: index of refdata) """
+    if grid is None:
+        with profiler.stage("grid") as record:
+            grid = _read_grid(args.refinfo)
+            record["rows"] = len(grid.ids)
+
+    if args.dask:
+        from .lazy import convert_lazy
+
+        with profiler.stage("dask"):
+            convert_lazy(args, config, grid, years)
+        return
+
+    if args.stream:
+        _convert_stream(args, config, grid, years)
+        return
 
     # read source output from ldndc
     log.debug(config.variables)
     varinfos, df = read_ldndc_txt(
-        args.indir, config.section("variables"), args.years, limiter=args.limiter
+        args.indir,
+        config.section("variables"),
+        years,
+        limiter=args.limiter,
+        jobs=args.jobs,
+        cache=ParseCache(args.cache, args.cache_size) if args.cache else None,
+        engine=args.engine,
+        shard=args.shard,
     )
 
-    id_mapper = create_id_mapper(cell_ids)
-    df["lat"], df["lon"] = zip(*df.id.map(id_mapper))
-    df = df.set_index(["time", "lat", "lon"])
+    if args.split:
+        with _split_writer(args, config) as writer:
+            for yr, yr_group in df.groupby(df.time.dt.year):
+                with profiler.stage("reindex", year=yr) as record:
+                    ds = _year_dataset(yr, yr_group, grid, config, args.layout)
+                    record["rows"] = len(yr_group)
+                writer.write(yr, ds)
+        return
 
-    df = df.drop("id", axis=1)
-    df.sort_index(inplace=True)
+    # output arrays of all years with data (no yearly datasets to concat)
+    with profiler.stage("reindex") as record:
+        years = sorted(int(yr) for yr in df.time.dt.year.unique())
+        ds = _years_dataset(years, df, grid, config, args.layout)
+        record["rows"] = len(df)
+    del df
+
+    # only appendable output (--append) has an unlimited time dimension
+    outfile = _outfile(args)
+    with ds:
+        if args.append and outfile.exists():
+            with profiler.stage("append"):
+                _append_output(ds, outfile, args)
+        else:
+            with profiler.stage("write"):
+                _write_output(ds, outfile, config, args, unlimited=args.append)
+        _write_products(
+            _aggregates(ds, config, args), outfile, config, args, args.append
+        )
 
-    # iterate over cellids and variables
-    ENCODING = {
-        "complevel": 5,
-        "zlib": True,
-        "chunksizes": (10, 20, 40),
-        "shuffle": True,
-    }
 
-    def get_datavar_encodings(ds):
-        ENCODINGS = {}
-        for v in ds.data_vars:
-            new_chunksizes = []
-            for chk_data, chk_default in zip(ds[v].shape, ENCODING["chunksizes"]):
-                if chk_data < chk_default:
-                    new_chunksizes.append(chk_data)
-                else:
-                    new_chunksizes.append(chk_default)
-            new_encoding = ENCODING.copy()
-            new_encoding.update({"chunksizes": tuple(new_chunksizes)})
-
-            ENCODINGS[v] = new_encoding
-        return ENCODINGS
-
-    ds_all = []
-    for yr, yr_group in df.groupby(df.index.get_level_values("time").year):
-        with xr.Dataset() as ds:
-            ds = ds.from_dataframe(yr_group)
-
-            # make sure we have a full year and full lat lon extent of data
-            days = pd.date_range(start=f"1/1/{yr}", end=f"12/31/{yr}")
-            ds = ds.reindex({"time": days, "lat": lats, "lon": lons})
-
-            # TODO: fix NaN values in reindexed time steps (i.e. from yearly files)
-            #       ideally they should be zero (but only the locations with actual sims)
-
-            ENCODINGS = get_datavar_encodings(ds)
-            for v in ds.data_vars:
-                units = next(
-                    (var.unit for var in config.variables if var.name == v), None
-                )
-                if units:
-                    ds[v].attrs["units"] = units
+def _refinfo(refinfo):
+    """ refdata file and variable of option -r (the file must exist) """
+    if refinfo is None:
+        raise ValueError(log.critical("You need to specify a reffile"))
 
-            if args.split:
-                outfilename = f"{args.outfile[:-3]}_{yr}.nc"
-                ds.attrs = config.global_info
-                ds.to_netcdf(
-                    Path(args.outdir) / outfilename,
-                    format="NETCDF4_CLASSIC",
-                    encoding=ENCODINGS,
-                )
-            else:
-                ds_all.append(ds)
-
-    if not args.split:
-        with xr.concat(ds_all, dim="time") as ds:
-            ENCODINGS = get_datavar_encodings(ds)
-            ds.attrs = config.global_info
-            ds.to_netcdf(
-                Path(args.outdir) / args.outfile,
-                format="NETCDF4_CLASSIC",
-                encoding=ENCODINGS,
-            )
+    reffile, refvar = refinfo
+    reffile = Path(reffile)
+    if not reffile.is_file():
+        raise FileNotFoundError(log.critical(f"Specified reffile {reffile} not found"))
+    return (reffile, refvar)
+
+
+def _read_refdata(refinfo):
+    """ cell ids (lat, lon) of the refdata file and variable of option -r """
+    reffile, refvar = _refinfo(refinfo)
+    with (xr.open_dataset(reffile)) as refnc:
+        if refvar not in refnc.data_vars:
+            raise ValueError(log.critical(f"Var <{refvar}> not in {reffile}"))
+        return refnc[refvar].where(refnc[refvar] > 0).load()
+
+
+def _read_grid(refinfo):
+    """ grid index of the refdata of option -r
+
+        The index is cached next to the refdata file (keyed by its content
+        and the variable) and memory-mapped by later runs.
+    """
+    reffile, refvar = _refinfo(refinfo)
+    entry = grid_cache(reffile, refvar)
+    grid = GridIndex.load(entry)
+    if grid is None:
+        grid = GridIndex.from_cell_ids(_read_refdata(refinfo))
+        try:
+            grid.save(entry)
+        except OSError as e:
+            log.warning(f"Cannot cache grid index of {reffile} ({e})")
+    return grid
+
+
+def _run(args, config, grid=None):
+    """ convert the years of args (in append mode the ones missing in the output,
+        output options of args completed by output_options)
+
+        :return: converted years
+        :rtype: list
+    """
+    years = _select_years(args, config)
+    if len(years) == 0:
+        log.info("Output is up to date, nothing to convert")
+        return years
+
+    if args.profile:
+        profiler.enable(hot_stage=args.profile_stage)
+    try:
+        _convert(args, config, years, grid=grid)
+    finally:
+        if args.profile:
+            profiler.disable().write(args.profile)
+    return years
+
+
+def _batch(args, jobs, config):
+    """ convert the jobs of a manifest (the grid index is loaded once)
+
+        :return: exit status (1 if a job failed)
+    """
+    grid = _read_grid(args.refinfo)
+    records = run_jobs(jobs, config, grid, workers=args.workers)
+
+    print(format_summary(records))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(records, f, indent=2)
+    return 1 if any(r["status"] == "failed" for r in records) else None
+
+
+def _merge(args, config):
+    """ merge the partial outputs of sharded conversions
+
+        Aggregated products are merged if all shards wrote them (output
+        options of args completed by output_options).
+    """
+    outfile = _outfile(args)
+    merge_partials(find_partials(outfile), outfile, config, args)
+
+    product_conf = product_config(config)
+    for product in args.aggregates:
+        fname = _product_outfile(outfile, product)
+        partials = [_product_outfile(p, product) for p in find_partials(outfile)]
+        missing = [str(p) for p in partials if not p.exists()]
+        if missing:
+            log.warning(f"Skipping {product} aggregates (missing in {missing})")
+            continue
+        merge_partials(partials, fname, product_conf, args)
+
+
+def _codecs(args, config):
+    """ benchmark compression codecs on a sample year (output options of args
+        completed by output_options)
+    """
+    grid = _read_grid(args.refinfo)
+
+    yr, _, df = next(
+        iter_ldndc_years(
+            args.indir,
+            config.section("variables"),
+            [args.year],
+            limiter=args.limiter,
+            engine=args.engine,
+        )
+    )
+    ds = _year_dataset(yr, df, grid, config, args.layout)
+
+    # netCDF4 applies no shuffle with zstd (one run per level)
+    runs = [
+        (codec, level, shuffle and codec != "zstd")
+        for codec in args.codecs
+        for level in (args.levels or BENCHMARK_LEVELS[codec])
+        for shuffle in args.shuffles
+    ]
+    runs = list(dict.fromkeys(runs))
+    runs += [("none", None, False)]
+    for run in runs:
+        check_compression(*run)
+    options = {"chunking": args.chunking, "chunk_size": args.chunk_size}
+    records = benchmark(ds, config, runs, options=options, tmpdir=args.tmpdir)
+
+    print(format_records(records))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(records, f, indent=2)
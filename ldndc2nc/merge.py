@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""ldndc2nc.merge: partial outputs of sharded conversions and their merge."""
+
+import logging
+import re
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+
+def parse_shard(value):
+    """ parse a shard i/N (0 <= i < N) """
+    try:
+        i, n = (int(x) for x in str(value).split("/"))
+    except ValueError:
+        raise ValueError(log.critical(f"No valid shard: {value}"))
+    if not 0 <= i < n:
+        raise ValueError(log.critical(f"No valid shard: {value} (0 <= i < N)"))
+    return (i, n)
+
+
+def in_shard(fileno, shard):
+    """ file number belongs to shard (i, N), i.e. fileno modulo N is i """
+    i, n = shard
+    return fileno % n == i
+
+
+def shard_outfile(fname, shard):
+    """ partial output of a shard next to the (merged) output file fname """
+    i, n = shard
+    return fname.with_name(f"{fname.stem}_shard{i}of{n}{fname.suffix}")
+
+
+def find_partials(fname):
+    """ partial outputs of all shards of the output file fname
+
+        :param Path fname: (merged) output file
+        :return: partial output per shard (shard order)
+        :rtype: list
+    """
+    pattern = re.compile(
+        re.escape(fname.stem) + r"_shard(\d+)of(\d+)" + re.escape(fname.suffix) + "$"
+    )
+    shards = {}
+    for partial in fname.parent.glob(f"{fname.stem}_shard*of*{fname.suffix}"):
+        match = pattern.match(partial.name)
+        if match:
+            shards[tuple(int(x) for x in match.groups())] = partial
+
+    if not shards:
+        raise FileNotFoundError(log.critical(f"No partial outputs of {fname}"))
+    counts = sorted({n for _, n in shards})
+    if len(counts) > 1:
+        raise ValueError(log.critical(f"Partial outputs of {counts} shards: {fname}"))
+    missing = [i for i in range(counts[0]) if (i, counts[0]) not in shards]
+    if missing:
+        raise FileNotFoundError(
+            log.critical(f"Partial outputs of shards {missing} missing: {fname}")
+        )
+    return [shards[(i, counts[0])] for i in range(counts[0])]
+
+
+def open_partial(fname):
+    """ open a partial output lazily (netCDF or zarr store) """
+    import xarray as xr
+
+    if Path(fname).suffix == ".zarr":
+        return xr.open_zarr(fname, chunks=None)
+    return xr.open_dataset(fname)
+
+
+def _check_partials(parts, fnames):
+    """ partial outputs have the same variables and grid (raises ValueError) """
+    first = parts[0]
+    for ds, fname in zip(parts[1:], fnames[1:]):
+        if set(ds.data_vars) != set(first.data_vars):
+            raise ValueError(log.critical(f"Vars of {fname} and {fnames[0]} differ"))
+        for c in first.coords:
+            if c != "time" and not (c in ds.coords and ds[c].equals(first[c])):
+                raise ValueError(
+                    log.critical(f"Coords <{c}> of {fname} and {fnames[0]} differ")
+                )
+
+
+def merge_year(parts, yr):
+    """ merge the partial outputs of a year
+
+        Every shard fills the simulated cells of the other shards with zeros
+        and cells outside the grid with NaN, so the merged values are the
+        sums of the partial values (NaN only where all partials are NaN).
+        Only one year of two partials is held in memory at a time.
+
+        :param list parts: partial outputs (opened lazily)
+        :param int yr: year
+        :return: merged dataset (None if no partial has data of yr)
+        :rtype: xr.Dataset
+    """
+    import xarray as xr
+
+    merged = None
+    for ds in parts:
+        block = ds.isel(time=(ds.time.dt.year == yr).values)
+        if block.sizes["time"] == 0:
+            continue
+        block = block.load()
+        if merged is not None:
+            block = xr.concat([merged, block], dim="shard", join="exact").sum(
+                "shard", min_count=1, keep_attrs=True
+            )
+        merged = block
+    return merged
+
+
+def merge_partials(fnames, outfile, config, args):
+    """ merge partial outputs year by year into outfile
+
+        :param list fnames: partial outputs
+        :param Path outfile: merged output file
+        :param config: conf with global info and variables
+        :param args: output options
+        :return: merged years
+        :rtype: list
+    """
+    from .ldndc2nc import _append_output, _write_output
+
+    parts = [open_partial(fname) for fname in fnames]
+    try:
+        _check_partials(parts, fnames)
+        years = sorted(
+            set(int(yr) for ds in parts for yr in ds.time.dt.year.values.tolist())
+        )
+        for cnt, yr in enumerate(years):
+            ds = merge_year(parts, yr)
+            for v in ds.variables.values():
+                v.encoding = {}
+            if cnt == 0:
+                _write_output(ds, outfile, config, args, unlimited=True)
+            else:
+                _append_output(ds, outfile, args)
+            log.info(f"Merged year {yr} of {len(fnames)} partial outputs")
+    finally:
+        for ds in parts:
+            ds.close()
+    return years
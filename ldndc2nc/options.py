@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""ldndc2nc.options: choices and validation of options (without numpy imports)."""
+
+import logging
+
+from .aggregate import check_products
+from .chunking import CHUNK_SIZE, chunk_shape, parse_size
+from .compression import COMPRESSION, check_compression, variable_compression
+
+log = logging.getLogger(__name__)
+
+# available parse engines (ldndc2nc.engines)
+ENGINES = ["pandas", "arrow", "mmap"]
+
+# storage layouts of output variables (ldndc2nc.grid)
+#   grid:       (time, lat, lon) arrays of the full reference grid
+#   landpoints: (time, landpoint) arrays of the simulated cells only
+LAYOUTS = ["grid", "landpoints"]
+
+# output formats and the suffix of their files
+FORMATS = {"netcdf": ".nc", "zarr": ".zarr"}
+
+# options of the output section of the conf file
+OUTPUT_OPTIONS = [
+    "format",
+    "consolidated",
+    "layout",
+    "aggregates",
+    "chunking",
+    "chunk_size",
+    "codec",
+    "level",
+    "shuffle",
+]
+
+
+def output_options(args, config):
+    """ complete output options of args with the output section of the conf """
+    output = config.section("output") or {}
+    unknown = set(output) - set(OUTPUT_OPTIONS)
+    if unknown:
+        raise ValueError(log.critical(f"Unknown output options: {sorted(unknown)}"))
+
+    args.format = args.format or output.get("format", "netcdf")
+    if args.format not in FORMATS:
+        raise ValueError(log.critical(f"Output format <{args.format}> not supported"))
+    args.consolidated = output.get("consolidated", True)
+
+    args.aggregates = args.aggregates or output.get("aggregates", [])
+    check_products(args.aggregates)
+
+    args.layout = args.layout or output.get("layout", "grid")
+    if args.layout not in LAYOUTS:
+        raise ValueError(log.critical(f"Output layout <{args.layout}> not supported"))
+
+    args.chunking = args.chunking or output.get("chunking", "balanced")
+    args.chunk_size = parse_size(
+        args.chunk_size or output.get("chunk_size", CHUNK_SIZE)
+    )
+    # validate the policy before reading any data
+    chunk_shape(("time",), (1,), 1, policy=args.chunking)
+
+    args.codec = output.get("codec", COMPRESSION["codec"])
+    args.level = output.get("level", COMPRESSION["level"])
+    args.shuffle = output.get("shuffle", COMPRESSION["shuffle"])
+    check_compression(args.codec, args.level, args.shuffle)
+    for var in config.variables:
+        check_compression(
+            *variable_compression(var, args.codec, args.level, args.shuffle)
+        )
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""ldndc2nc.profiler: wall time, cpu time, rows and peak memory per stage."""
+
+import cProfile
+import json
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+# stages of a conversion
+STAGES = [
+    "grid",
+    "parse",
+    "decompress",
+    "sort",
+    "combine",
+    "reindex",
+    "aggregate",
+    "write",
+    "append",
+    "dask",
+]
+
+# stages that can be profiled with cProfile (decompress sums up many reads)
+HOT_STAGES = [s for s in STAGES if s != "decompress"]
+
+# interval of the rss sampler (seconds)
+INTERVAL = 0.005
+
+# active profiler (None: profiling disabled)
+_profiler = None
+
+
+def _rss():
+    """ current resident set size (bytes, 0 if unknown) """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        pass
+
+    # no procfs: fall back to the peak of the process so far (not on Windows)
+    try:
+        import resource
+    except ImportError:
+        return 0
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+class _Profile:
+    """ holder of cProfile stats that pstats.Stats can load """
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+class Profiler:
+    """ record stages of a conversion (and optionally cProfile one of them)
+
+        Every stage record holds the stage name, its labels (e.g. file_type,
+        file, year), wall and cpu time (s), the rows processed and the peak
+        rss (MB) while the stage was active.
+    """
+
+    def __init__(self, hot_stage=None):
+        self.hot_stage = hot_stage
+        self.records = []
+        self.stats = pstats.Stats() if hot_stage else None
+        self._labels = {}
+        self._active = []
+        self._sampler = None
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.wait(INTERVAL):
+            rss = _rss()
+            for record in list(self._active):
+                record["peak_rss_mb"] = max(record["peak_rss_mb"], rss / 2 ** 20)
+
+    def start(self):
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        if self._sampler:
+            self._stop.set()
+            self._sampler.join()
+            self._sampler = None
+
+    @contextmanager
+    def labels(self, **labels):
+        """ add labels to all stages recorded in this context """
+        previous = self._labels
+        self._labels = {**previous, **labels}
+        try:
+            yield
+        finally:
+            self._labels = previous
+
+    @contextmanager
+    def stage(self, name, **labels):
+        """ record a stage, set record["rows"] to the rows processed """
+        record = {"stage": name, **self._labels, **labels, "rows": None}
+        record["peak_rss_mb"] = _rss() / 2 ** 20
+        self._active.append(record)
+
+        profile = cProfile.Profile() if name == self.hot_stage else None
+        wall, cpu = time.perf_counter(), time.process_time()
+        if profile:
+            profile.enable()
+        try:
+            yield record
+        finally:
+            if profile:
+                profile.disable()
+                profile.create_stats()
+                self.stats.add(_Profile(profile.stats))
+            record["wall"] = time.perf_counter() - wall
+            record["cpu"] = time.process_time() - cpu
+            self._active.remove(record)
+            record["peak_rss_mb"] = max(record["peak_rss_mb"], _rss() / 2 ** 20)
+            self.records.append(record)
+
+    def add(self, name, wall, cpu, **labels):
+        """ record a stage timed by the caller (e.g. summed over many calls) """
+        record = {"stage": name, **self._labels, **labels, "rows": None}
+        record.update(wall=wall, cpu=cpu, peak_rss_mb=_rss() / 2 ** 20)
+        self.records.append(record)
+
+    def merge(self, records, stats=None):
+        """ add records (and cProfile stats) of a worker process """
+        self.records.extend(records)
+        if stats and self.stats is not None:
+            self.stats.add(_Profile(stats))
+
+    def summary(self, by=None):
+        """ totals of wall time, cpu time and rows and the peak rss per stage
+
+            :param str by: (optional) label to group the stages by first
+            :return: totals per stage (per label value)
+            :rtype: dict
+        """
+        summary = {}
+        for record in self.records:
+            if by is None:
+                totals = summary
+            elif record.get(by) is not None:
+                totals = summary.setdefault(str(record[by]), {})
+            else:
+                continue
+            total = totals.setdefault(
+                record["stage"],
+                {"count": 0, "wall": 0.0, "cpu": 0.0, "rows": 0, "peak_rss_mb": 0.0},
+            )
+            total["count"] += 1
+            total["wall"] += record["wall"]
+            total["cpu"] += record["cpu"]
+            total["rows"] += record["rows"] or 0
+            total["peak_rss_mb"] = max(total["peak_rss_mb"], record["peak_rss_mb"])
+        return summary
+
+    def report(self):
+        return {
+            "stages": self.summary(),
+            "file_types": self.summary("file_type"),
+            "years": self.summary("year"),
+            "records": self.records,
+        }
+
+    def write(self, fname):
+        """ write json report (and cProfile stats of the hot stage as .prof) """
+        with open(fname, "w") as f:
+            json.dump(self.report(), f, indent=2)
+        log.info(f"Profile written to {fname}")
+
+        if self.stats is not None:
+            if self.stats.stats:
+                prof = os.path.splitext(fname)[0] + ".prof"
+                self.stats.dump_stats(prof)
+                log.info(f"cProfile stats of stage {self.hot_stage} written to {prof}")
+            else:
+                log.warning(f"Stage {self.hot_stage} was not profiled")
+
+
+def enable(hot_stage=None):
+    """ activate a new profiler """
+    global _profiler
+    _profiler = Profiler(hot_stage=hot_stage)
+    _profiler.start()
+    return _profiler
+
+
+def disable():
+    """ deactivate the profiler and return it """
+    global _profiler
+    profiler, _profiler = _profiler, None
+    if profiler:
+        profiler.stop()
+    return profiler
+
+
+def active():
+    return _profiler
+
+
+@contextmanager
+def stage(name, **labels):
+    """ record a stage with the active profiler (no-op if disabled) """
+    if _profiler is None:
+        yield {}
+    else:
+        with _profiler.stage(name, **labels) as record:
+            yield record
+
+
+def add(name, wall, cpu, **labels):
+    """ record a stage timed by the caller (no-op if disabled) """
+    if _profiler is not None:
+        _profiler.add(name, wall, cpu, **labels)
+
+
+@contextmanager
+def labels(**labels):
+    """ label stages of the active profiler (no-op if disabled) """
+    if _profiler is None:
+        yield
+    else:
+        with _profiler.labels(**labels):
+            yield
+
+
+def remote(hot_stage, labels, func, *args):
+    """ call func in a worker process with a profiler of its own
+
+        :return: result of func, records and cProfile stats of the worker
+        :rtype: tuple
+    """
+    profiler = enable(hot_stage)
+    try:
+        with profiler.labels(**labels):
+            result = func(*args)
+    finally:
+        disable()
+    stats = profiler.stats.stats if profiler.stats is not None else None
+    return (result, profiler.records, stats)
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""ldndc2nc.synthetic: generate synthetic LandscapeDNDC output and refdata.
+
+    usage: python -m ldndc2nc.synthetic [-n CELLS] [-f FILES] [-y YEARS] [-z] outdir
+"""
+
+import argparse
+import gzip
+import logging
+import math
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+import yaml
+
+from .variable import Variable
+
+log = logging.getLogger(__name__)
+
+# variables of the generated files (subset of the default conf file)
+VARIABLES = {
+    "soilchemistry-daily.txt": [
+        "dC_co2_emis[kgCha-1]=dC_co2_emis_auto[kgCha-1]+dC_co2_emis_hetero[kgCha-1]",
+        "dN_n2o_emis[kgNha-1]",
+        "dN_no_emis[kgNha-1]",
+        "dN_n2_emis[kgNha-1]",
+        "dC_ch4_emis[kgCha-1]",
+        "dN_no3_leach[kgNha-1]",
+        "C_soil_min[kgCha-1]",
+        "N_soil_min[kgNha-1]",
+    ],
+    "watercycle-daily.txt": ["percol[mm]"],
+    "report-fertilize.txt": ["dN_fertilizer[kgNha-1]"],
+}
+
+# grid resolution of the refdata (degrees)
+RESOLUTION = 0.5
+
+# days between two events in (non-daily) report files
+REPORT_INTERVAL = 30
+
+
+def variables(varData=None):
+    """ variables of the generated files as used by read_ldndc_txt
+
+        :param dict varData: (optional) variable lines per file type
+        :return: Variable objects per file type
+        :rtype: dict
+    """
+    varData = varData or VARIABLES
+    return {k: [Variable.from_config(v) for v in vs] for k, vs in varData.items()}
+
+
+def columns(ftype, varData=None):
+    """ data columns of the generated files of a file type
+
+        :param str ftype: file type (e.g. soilchemistry-daily.txt)
+        :param dict varData: (optional) variable lines per file type
+        :return: source columns of the variables (in order)
+        :rtype: list
+    """
+    vs = variables(varData)[ftype]
+    return list(dict.fromkeys(s for v in vs for s in v.sources))
+
+
+def write_refdata(fname, ncells, var="cid", seed=0):
+    """ write a refdata netCDF file with ncells ids scattered on a grid
+
+        About half of the grid cells are simulated (a land mask), the cell
+        ids 1..ncells are assigned in random order.
+
+        :param Path fname: netCDF file to create
+        :param int ncells: number of simulated cells
+        :param str var: name of the cell id variable
+        :return: cell ids (lat, lon)
+        :rtype: xr.DataArray
+    """
+    rng = np.random.default_rng(seed)
+    nlon = math.ceil(math.sqrt(2 * ncells))
+    nlat = math.ceil(2 * ncells / nlon)
+
+    cid = np.full(nlat * nlon, np.nan)
+    cid[rng.choice(nlat * nlon, ncells, replace=False)] = np.arange(1, ncells + 1)
+    lats = 90 - RESOLUTION * (np.arange(nlat) + 0.5)
+    lons = -180 + RESOLUTION * (np.arange(nlon) + 0.5)
+
+    cell_ids = xr.DataArray(
+        cid.reshape(nlat, nlon),
+        dims=("lat", "lon"),
+        coords={"lat": lats, "lon": lons},
+        name=var,
+    )
+    cell_ids.to_dataset().to_netcdf(fname)
+    return cell_ids
+
+
+def write_ldndc_file(fname, ids, years, columns, seed=0, interval=1):
+    """ write a synthetic ldndc txt file (days x cells rows)
+
+        :param Path fname: txt file to create (compressed if it ends with .gz)
+        :param list ids: cell ids in the file
+        :param list years: simulated years
+        :param list columns: data columns
+        :param int interval: days between two rows of a cell
+        :return: number of data rows
+        :rtype: int
+    """
+    rng = np.random.default_rng(seed)
+    days = pd.date_range(start=f"1/1/{years[0]}", end=f"12/31/{years[-1]}")
+    days = days[::interval]
+    df = pd.DataFrame(
+        {
+            "datetime": np.repeat(days.strftime("%Y-%m-%d %H:%M:%S"), len(ids)),
+            "id": np.tile(ids, len(days)),
+            "area[m2]": 10000.0,
+        }
+    )
+    for c in columns:
+        df[c] = rng.random(len(df)).round(4)
+    opener = gzip.open if fname.suffix == ".gz" else open
+    with opener(fname, "wt") as f:
+        df.to_csv(f, sep="\t", index=False)
+    return len(df)
+
+
+def generate(outdir, ncells, years, nfiles=1, compress=False, varData=None, seed=0):
+    """ generate refdata, conf and ldndc txt files of all file types in outdir
+
+        The cells are split into nfiles blocks (GLOBAL_000, GLOBAL_001, ...)
+        like the output of a parallel LandscapeDNDC run.
+
+        :param Path outdir: destination directory
+        :param int ncells: number of simulated cells
+        :param list years: simulated years
+        :param int nfiles: number of files per file type
+        :param bool compress: write gzip compressed files
+        :param dict varData: (optional) variable lines per file type
+        :return: refdata file and number of data rows per file type
+        :rtype: tuple
+    """
+    outdir = Path(outdir)
+    outdir.mkdir(parents=True, exist_ok=True)
+
+    refdata = outdir / "refdata.nc"
+    write_refdata(refdata, ncells, seed=seed)
+
+    cfg = {"info": {"author": "ldndc2nc.synthetic"}, "variables": varData or VARIABLES}
+    with open(outdir / "ldndc2nc.conf", "w") as f:
+        f.write(yaml.dump(cfg, default_flow_style=False))
+
+    nrows = {}
+    suffix = ".gz" if compress else ""
+    for ftype in variables(varData):
+        datacols = columns(ftype, varData)
+        interval = 1 if "daily" in ftype else REPORT_INTERVAL
+        nrows[ftype] = 0
+        for fno, ids in enumerate(np.array_split(np.arange(1, ncells + 1), nfiles)):
+            fname = outdir / f"GLOBAL_{fno:03d}_{ftype}{suffix}"
+            nrows[ftype] += write_ldndc_file(
+                fname, ids, years, datacols, seed=seed + fno, interval=interval
+            )
+    return (refdata, nrows)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="generate synthetic LandscapeDNDC output and refdata"
+    )
+    parser.add_argument("outdir", help="destination of generated files")
+    parser.add_argument("-n", dest="ncells", type=int, default=100, help="cells")
+    parser.add_argument("-f", dest="nfiles", type=int, default=1, help="files")
+    parser.add_argument("-y", dest="years", default="2000-2001", help="years")
+    parser.add_argument("-z", dest="compress", action="store_true", help="gzip")
+    args = parser.parse_args()
+
+    first, _, last = args.years.partition("-")
+    years = list(range(int(first), int(last or first) + 1))
+    refdata, nrows = generate(
+        args.outdir, args.ncells, years, nfiles=args.nfiles, compress=args.compress
+    )
+    print(f"conf: {Path(args.outdir) / 'ldndc2nc.conf'}")
+    print(f"refdata: {refdata},cid")
+    for ftype, n in nrows.items():
+        print(f"{ftype}: {n} rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import gzip
+
+import pytest
+
+from ldndc2nc.variable import Variable
+
+COLUMNS = [
+    "datetime",
+    "id",
+    "area[m2]",
+    "dC_co2_emis_auto[kgCha-1]",
+    "dC_co2_emis_hetero[kgCha-1]",
+    "dN_n2o_emis[kgNha-1]",
+]
+
+
+def _write_ldndc_file(fname, ids, years):
+    """ write a small synthetic ldndc daily txt file """
+    lines = ["\t".join(COLUMNS)]
+    for year in years:
+        for day in range(1, 32):
+            for id in ids:
+                values = [id * 0.5, id + day / 100.0, day / 10.0, id / 1000.0]
+                lines.append(
+                    "\t".join(
+                        [f"{year}-01-{day:02d} 00:00:00", str(id)]
+                        + [str(v) for v in values]
+                    )
+                )
+    text = "\n".join(lines) + "\n"
+    if fname.suffix == ".gz":
+        with gzip.open(fname, "wt") as f:
+            f.write(text)
+    else:
+        fname.write_text(text)
+
+
+@pytest.fixture
+def ldndc_dir(tmp_path):
+    """ directory with three soilchemistry-daily files (one compressed) """
+    years = [2000, 2001, 2002]
+    _write_ldndc_file(tmp_path / "GLOBAL_000_soilchemistry-daily.txt", [3, 1], years)
+    _write_ldndc_file(tmp_path / "GLOBAL_001_soilchemistry-daily.txt", [2, 5], years)
+    _write_ldndc_file(tmp_path / "GLOBAL_002_soilchemistry-daily.txt.gz", [4], years)
+    return tmp_path
+
+
+@pytest.fixture
+def var_data():
+    return {
+        "soilchemistry-daily.txt": [
+            Variable(
+                "dC_co2_emis[kgCha-1]=dC_co2_emis_auto[kgCha-1]+dC_co2_emis_hetero[kgCha-1]"
+            ),
+            Variable("dN_n2o_emis[kgNha-1]"),
+        ]
+    }
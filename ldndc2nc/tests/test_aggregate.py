@@ -0,0 +1,69 @@
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from ldndc2nc.aggregate import aggregate, check_products, product_config
+from ldndc2nc.ldndc2nc import _product_outfile
+from ldndc2nc.variable import Variable
+
+from .test_netcdf import year_dataset
+
+variables = [
+    Variable.from_config({"dN_n2o_emis[kgNha-1]": {"aggregate": "sum"}}),
+    Variable.from_config("C_soil_min[kgCha-1]"),
+]
+
+
+@pytest.fixture
+def ds():
+    ds = year_dataset(2000)
+    ds["C_soil_min"] = ds.dN_n2o_emis * 2
+    return ds
+
+
+@pytest.mark.parametrize(
+    "product, steps, days", [("monthly", 12, 31), ("annual", 1, 366)]
+)
+def test_aggregate(ds, product, steps, days):
+    agg = aggregate(ds, variables, product)
+
+    assert agg.sizes == {"time": steps, "lat": 3, "lon": 4}
+    assert agg.time.values[0] == np.datetime64("2000-01-01")
+    first = ds.isel(time=slice(0, days))
+    np.testing.assert_allclose(
+        agg.dN_n2o_emis[0], first.dN_n2o_emis.sum("time", min_count=1)
+    )
+    np.testing.assert_allclose(agg.C_soil_min[0], first.C_soil_min.mean("time"))
+
+    # cells without data are not summed to zero
+    assert np.isnan(agg.dN_n2o_emis.values[:, 0, 0]).all()
+    assert agg.dN_n2o_emis.attrs == {"units": "kgNha-1", "cell_methods": "time: sum"}
+    assert agg.C_soil_min.attrs["cell_methods"] == "time: mean"
+
+
+def test_product_config():
+    config = SimpleNamespace(
+        global_info={},
+        variables=[
+            Variable.from_config(
+                {"dN_n2o_emis[kgNha-1]": {"dtype": "int16", "scale_factor": 0.01}}
+            )
+        ],
+    )
+    var = product_config(config).variables[0]
+    assert (var.dtype, var.scale_factor) == ("float32", None)
+    assert config.variables[0].dtype == "int16"
+
+
+def test_check_products():
+    check_products(["monthly", "annual"])
+    with pytest.raises(ValueError):
+        check_products(["daily"])
+
+
+def test_product_outfile():
+    assert _product_outfile(Path("out/outfile_2000.nc"), "monthly") == Path(
+        "out/outfile_2000_monthly.nc"
+    )
@@ -0,0 +1,89 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+import xarray as xr
+
+from ldndc2nc.batch import job_args, read_manifest
+from ldndc2nc.cli import batch_main
+from ldndc2nc.synthetic import generate
+
+
+def test_read_manifest_yaml(tmp_path):
+    fname = tmp_path / "jobs.yml"
+    fname.write_text(
+        "jobs:\n"
+        "  - {indir: a, outdir: out, outfile: a.nc, years: 2000-2001}\n"
+        "  - {indir: /data/b, outdir: out, limiter: GLOBAL_001}\n"
+    )
+    jobs = read_manifest(fname)
+    assert jobs == [
+        {
+            "indir": str(tmp_path / "a"),
+            "outdir": str(tmp_path / "out"),
+            "outfile": "a.nc",
+            "years": "2000-2001",
+        },
+        {"indir": "/data/b", "outdir": str(tmp_path / "out"), "limiter": "GLOBAL_001"},
+    ]
+
+
+def test_read_manifest_csv(tmp_path):
+    fname = tmp_path / "jobs.csv"
+    fname.write_text("indir,outdir,years,limiter\na,out,2005,\nb,out,,GLOBAL\n")
+    jobs = read_manifest(fname)
+    assert [job.get("years") for job in jobs] == ["2005", None]
+    assert [job.get("limiter") for job in jobs] == [None, "GLOBAL"]
+
+
+@pytest.mark.parametrize(
+    "text", ["jobs: []\n", "- {indir: a}\n", "- {indir: a, outdir: b, year: 2000}\n"]
+)
+def test_read_manifest_invalid(tmp_path, text):
+    fname = tmp_path / "jobs.yml"
+    fname.write_text(text)
+    with pytest.raises(ValueError):
+        read_manifest(fname)
+
+
+def test_job_args():
+    args = SimpleNamespace(outfile="outfile.nc", years=range(2000, 2016), limiter="")
+    job = {"indir": "a", "outdir": "out", "years": 2005, "limiter": "GLOBAL_001"}
+    job_args_ = job_args(job, args)
+    assert (job_args_.indir, job_args_.outdir) == ("a", "out")
+    assert job_args_.outfile == "outfile.nc"
+    assert job_args_.years == range(2005, 2006)
+    assert job_args_.limiter == "GLOBAL_001"
+    assert args.years == range(2000, 2016)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_batch_main(tmp_path, workers):
+    refdata, _ = generate(tmp_path / "a", 10, [2000, 2001], nfiles=2)
+    generate(tmp_path / "b", 10, [2000, 2001], nfiles=2, seed=1)
+    (tmp_path / "out").mkdir()
+    manifest = tmp_path / "jobs.yml"
+    manifest.write_text(
+        "- {indir: a, outdir: out, outfile: a.nc}\n"
+        "- {indir: b, outdir: out, outfile: b.nc, years: 2001}\n"
+        "- {indir: missing, outdir: out, outfile: c.nc}\n"
+    )
+    summary = tmp_path / "summary.json"
+
+    argv = [str(manifest), "-c", str(tmp_path / "a" / "ldndc2nc.conf")]
+    argv += ["-r", f"{refdata},cid", "-y", "2000-2001", "-w", str(workers)]
+    assert batch_main(argv + ["--json", str(summary)]) == 1
+
+    records = json.loads(summary.read_text())
+    assert [r["status"] for r in records] == ["ok", "ok", "failed"]
+    assert [r["years"] for r in records] == [2, 1, 0]
+    for fname, years in [("a.nc", [2000, 2001]), ("b.nc", [2001])]:
+        with xr.open_dataset(tmp_path / "out" / fname) as ds:
+            assert sorted(set(ds.time.dt.year.values)) == years
+
+
+def test_batch_main_duplicate_output(tmp_path):
+    manifest = tmp_path / "jobs.yml"
+    manifest.write_text("- {indir: a, outdir: out}\n- {indir: b, outdir: out}\n")
+    with pytest.raises(ValueError):
+        batch_main([str(manifest), "-r", "refdata.nc,cid"])
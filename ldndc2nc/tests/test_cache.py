@@ -0,0 +1,59 @@
+import os
+
+import pandas as pd
+import pytest
+
+from ldndc2nc.cache import ParseCache
+from ldndc2nc.ldndc2nc import read_ldndc_txt
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame(
+        {
+            "id": [1, 2],
+            "time": pd.to_datetime(["2000-01-01", "2000-01-02"]),
+            "dN_n2o_emis[kgNha-1]": [0.5, 1.5],
+        }
+    )
+
+
+def test_cache_roundtrip(tmp_path, df):
+    fname = tmp_path / "GLOBAL_000_soilchemistry-daily.txt"
+    fname.write_text("data")
+    cache = ParseCache(tmp_path / "cache")
+
+    assert cache.load(fname, ["dN_n2o_emis[kgNha-1]"]) is None
+    cache.store(fname, ["dN_n2o_emis[kgNha-1]"], df)
+    pd.testing.assert_frame_equal(cache.load(fname, ["dN_n2o_emis[kgNha-1]"]), df)
+
+    # different columns or a modified file are cache misses
+    assert cache.load(fname, ["dN_no_emis[kgNha-1]"]) is None
+    os.utime(fname, ns=(0, 0))
+    assert cache.load(fname, ["dN_n2o_emis[kgNha-1]"]) is None
+
+
+def test_cache_eviction(tmp_path, df):
+    cache = ParseCache(tmp_path / "cache")
+    fnames = [tmp_path / f"GLOBAL_00{i}_soilchemistry-daily.txt" for i in range(3)]
+    for i, fname in enumerate(fnames):
+        fname.write_text("data")
+        cache.store(fname, ["a"], df)
+        os.utime(cache._entry(fname, ["a"]), (i, i))
+
+    # allow two entries, the least recently used one is evicted
+    cache.max_size = 2 * cache._entry(fnames[0], ["a"]).stat().st_size
+    cache.load(fnames[0], ["a"])
+    cache._evict()
+    assert cache.load(fnames[0], ["a"]) is not None
+    assert cache.load(fnames[1], ["a"]) is None
+    assert cache.load(fnames[2], ["a"]) is not None
+
+
+def test_read_ldndc_txt_cached(ldndc_dir, var_data, tmp_path):
+    cache = ParseCache(tmp_path / "cache")
+    expected = read_ldndc_txt(ldndc_dir, var_data, range(2000, 2002))
+    for _ in range(2):
+        result = read_ldndc_txt(ldndc_dir, var_data, range(2000, 2002), cache=cache)
+        pd.testing.assert_frame_equal(result[1], expected[1])
+    assert len(list((tmp_path / "cache").glob("*.npz"))) == 3
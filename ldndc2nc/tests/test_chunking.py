@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from ldndc2nc.chunking import chunk_shape, parse_size
+
+DIMS = ("time", "lat", "lon")
+SHAPE = (365, 360, 720)
+
+
+@pytest.mark.parametrize("policy", ["map", "timeseries", "balanced"])
+@pytest.mark.parametrize("chunk_size", [2 ** 16, 2 ** 20, 2 ** 24])
+def test_chunk_shape_size(policy, chunk_size):
+    chunks = chunk_shape(DIMS, SHAPE, 8, policy=policy, chunk_size=chunk_size)
+    assert all(1 <= c <= s for c, s in zip(chunks, SHAPE))
+    assert chunk_size / 2 < np.prod(chunks) * 8 <= chunk_size
+
+
+def test_chunk_shape_policies():
+    assert chunk_shape(DIMS, SHAPE, 8, policy="map") == (1, 256, 512)
+    assert chunk_shape(DIMS, SHAPE, 8, policy="timeseries") == (365, 13, 26)
+    assert chunk_shape(DIMS, SHAPE, 8, policy="balanced") == (40, 40, 80)
+    # small variables are a single chunk
+    assert chunk_shape(DIMS, (365, 3, 4), 8, policy="map") == (365, 3, 4)
+
+
+def test_chunk_shape_itemsize():
+    assert chunk_shape(DIMS, SHAPE, 2, policy="map") == (2, 360, 720)
+
+
+def test_chunk_shape_invalid_policy():
+    with pytest.raises(ValueError):
+        chunk_shape(DIMS, SHAPE, 8, policy="cube")
+
+
+@pytest.mark.parametrize(
+    "size, expected",
+    [
+        (4096, 4096),
+        ("4096", 4096),
+        ("512K", 2 ** 19),
+        ("4MB", 2 ** 22),
+        ("1GiB", 2 ** 30),
+    ],
+)
+def test_parse_size(size, expected):
+    assert parse_size(size) == expected
+
+
+def test_parse_size_invalid():
+    with pytest.raises(ValueError):
+        parse_size("4 potatoes")
@@ -0,0 +1,72 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import ldndc2nc
+
+HEAVY = ["numpy", "pandas", "xarray", "netCDF4", "dask"]
+
+
+def run_cli(argv):
+    """ run the command line interface for argv in a new interpreter
+
+        :return: top level modules imported and the exception raised (name)
+        :rtype: tuple
+    """
+    code = (
+        "import sys\n"
+        "from ldndc2nc.cli import main\n"
+        "error = None\n"
+        "try:\n"
+        f"    sys.argv = ['ldndc2nc'] + {argv!r}\n"
+        "    main()\n"
+        "except (SystemExit, Exception) as e:\n"
+        "    error = type(e).__name__\n"
+        "print(error, ' '.join(sorted({m.split('.')[0] for m in sys.modules})))\n"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code], stdout=subprocess.PIPE, check=True
+    ).stdout
+    # last line (after the help texts)
+    error, *modules = out.decode().splitlines()[-1].split()
+    return (set(modules), error)
+
+
+@pytest.mark.parametrize(
+    "argv",
+    [
+        ["--help"],
+        ["batch", "--help"],
+        ["codecs", "--help"],
+        ["merge", "--help"],
+        ["-c", "missing.conf", "-y", "2000", "indir", "outdir"],
+        ["-y", "2000-x", "indir", "outdir"],
+    ],
+)
+def test_startup_without_heavy_imports(argv):
+    modules, error = run_cli(argv)
+    assert error != "None"
+    assert not modules & set(HEAVY)
+
+
+@pytest.mark.parametrize(
+    "options, output",
+    [
+        (["--aggregate", "weekly"], ""),
+        (["--chunk-size", "4 parsecs"], ""),
+        ([], "output:\n    codec: lzma\n"),
+        ([], "output:\n    formats: zarr\n"),
+    ],
+)
+def test_output_options_without_heavy_imports(tmp_path, options, output):
+    conf = tmp_path / "my.conf"
+    default = Path(ldndc2nc.__file__).parent / "data" / "ldndc2nc.conf"
+    conf.write_text(default.read_text() + output)
+
+    # conversion (indir outdir) and merge (outdir)
+    for argv in [[str(tmp_path), str(tmp_path)], ["merge", str(tmp_path)]]:
+        modules, error = run_cli(argv + ["-c", str(conf)] + options)
+        assert error == "ValueError"
+        assert not modules & set(HEAVY)
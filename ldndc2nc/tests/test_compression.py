@@ -0,0 +1,100 @@
+import json
+from types import SimpleNamespace
+
+import netCDF4
+import pytest
+import xarray as xr
+
+from ldndc2nc.cli import codecs_main
+from ldndc2nc.compression import (
+    benchmark,
+    check_compression,
+    netcdf_compression,
+    supported_codecs,
+)
+from ldndc2nc.ldndc2nc import _write_netcdf, get_datavar_encodings
+from ldndc2nc.synthetic import generate
+from ldndc2nc.variable import Variable
+
+from .test_netcdf import year_dataset
+
+config = SimpleNamespace(global_info={"author": "test"}, variables=[])
+
+# filter flags of netCDF4 per codec
+FILTERS = {"zlib": "zlib", "zstd": "zstd", "blosc-lz4": "blosc"}
+
+
+@pytest.mark.parametrize("codec", supported_codecs())
+@pytest.mark.parametrize("unlimited", [False, True])
+def test_write_netcdf_codec(tmp_path, codec, unlimited):
+    ds = year_dataset(2000)
+    fname = tmp_path / "out.nc"
+    _write_netcdf(ds, fname, config, unlimited=unlimited, options={"codec": codec})
+
+    with xr.open_dataset(fname) as stored:
+        xr.testing.assert_identical(stored, ds.assign_attrs(author="test"))
+    with netCDF4.Dataset(fname) as nc:
+        filters = nc["dN_n2o_emis"].filters()
+        assert nc.dimensions["time"].isunlimited() == unlimited
+    for c, flag in FILTERS.items():
+        assert bool(filters[flag]) == (c == codec)
+
+
+def test_variable_codec(tmp_path):
+    variables = [
+        Variable.from_config({"dN_n2o_emis[kgNha-1]": {"codec": "none"}}),
+        Variable.from_config(
+            {"dC_co2_emis[kgCha-1]": {"dtype": "int16", "scale_factor": 0.001}}
+        ),
+    ]
+    ds = year_dataset(2000)
+    ds["dC_co2_emis"] = ds.dN_n2o_emis * 2
+    encodings = get_datavar_encodings(ds, variables, codec="zlib", level=1)
+    assert encodings["dN_n2o_emis"]["zlib"] is False
+    assert encodings["dC_co2_emis"]["complevel"] == 1
+
+
+def test_netcdf_compression_blosc_shuffle():
+    encoding = netcdf_compression("blosc-lz4", 5, shuffle=True)
+    assert encoding["blosc_shuffle"] == 1
+    assert encoding["shuffle"] is False
+
+
+@pytest.mark.skipif("zstd" not in supported_codecs(), reason="no zstd support")
+def test_zstd_without_shuffle(tmp_path):
+    assert netcdf_compression("zstd", 3, shuffle=True)["shuffle"] is False
+
+    fname = tmp_path / "out.nc"
+    options = {"codec": "zstd", "shuffle": True}
+    _write_netcdf(year_dataset(2000), fname, config, options=options)
+    with netCDF4.Dataset(fname) as nc:
+        assert nc["dN_n2o_emis"].filters()["shuffle"] is False
+
+    # one benchmark run per level
+    refdata, _ = generate(tmp_path / "in", 12, [2000])
+    argv = [str(tmp_path / "in"), "-c", str(tmp_path / "in" / "ldndc2nc.conf")]
+    argv += ["-r", f"{refdata},cid", "--codecs", "zstd", "--levels", "1,3"]
+    codecs_main(argv + ["--json", str(tmp_path / "codecs.json")])
+    records = json.loads((tmp_path / "codecs.json").read_text())
+    runs = [(r["codec"], r["level"], r["shuffle"]) for r in records]
+    assert runs == [("zstd", 1, False), ("zstd", 3, False), ("none", None, False)]
+
+
+@pytest.mark.parametrize(
+    "codec, level, shuffle",
+    [("lzma", None, True), ("zlib", 10, True), ("zstd", 0, True), ("zlib", 5, 1)],
+)
+def test_check_compression_invalid(codec, level, shuffle):
+    with pytest.raises(ValueError):
+        check_compression(codec, level, shuffle)
+
+
+def test_benchmark(tmp_path):
+    ds = year_dataset(2000)
+    runs = [("zlib", 1, True), ("none", None, False)]
+    records = benchmark(ds, config, runs, tmpdir=tmp_path)
+
+    assert [(r["codec"], r["level"]) for r in records] == [("zlib", 1), ("none", None)]
+    assert records[0]["ratio"] > records[1]["ratio"]
+    assert all(r["write_mb_s"] > 0 and r["read_mb_s"] > 0 for r in records)
+    assert list(tmp_path.iterdir()) == []
@@ -1,8 +1,8 @@
 from pathlib import Path
 
-import pkg_resources
 import pytest
 
+import ldndc2nc
 from ldndc2nc.config_handler import ConfigHandler, find_config
 
 
@@ -19,7 +19,7 @@ def mock_env_ldndc2nc_missing(monkeypatch):
 @pytest.fixture
 def fs_with_config_file(fs):
     fs.add_real_file(
-        pkg_resources.resource_filename("ldndc2nc", "data/ldndc2nc.conf"),
+        str(Path(ldndc2nc.__file__).parent / "data" / "ldndc2nc.conf"),
         target_path=Path.home(),
     )
     yield fs
@@ -0,0 +1,220 @@
+import gzip
+import importlib.util
+import os
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ldndc2nc.engines import (
+    GZINDEX,
+    _iter_mmap,
+    gzip_threads,
+    iter_table,
+    last_day,
+    open_gzip,
+    read_table,
+)
+from ldndc2nc.ldndc2nc import iter_ldndc_years, read_ldndc_txt
+
+requires_arrow = pytest.mark.skipif(
+    importlib.util.find_spec("pyarrow") is None, reason="requires pyarrow"
+)
+ARROW = pytest.param("arrow", marks=requires_arrow)
+
+datacols = ["dC_co2_emis_auto[kgCha-1]", "dN_n2o_emis[kgNha-1]"]
+
+
+@pytest.mark.parametrize(
+    "fname",
+    ["GLOBAL_000_soilchemistry-daily.txt", "GLOBAL_002_soilchemistry-daily.txt.gz"],
+)
+@requires_arrow
+def test_read_table_arrow(ldndc_dir, fname):
+    df_pandas = read_table(ldndc_dir / fname, datacols)
+    df_arrow = read_table(ldndc_dir / fname, datacols, engine="arrow")
+    df_pandas["datetime"] = df_pandas.datetime.astype("datetime64[D]")
+    pd.testing.assert_frame_equal(df_arrow[df_pandas.columns], df_pandas)
+
+
+@requires_arrow
+def test_read_table_arrow_missing_column(ldndc_dir):
+    with pytest.raises(ValueError):
+        read_table(
+            ldndc_dir / "GLOBAL_000_soilchemistry-daily.txt",
+            ["dN_no_emis[kgNha-1]"],
+            engine="arrow",
+        )
+
+
+@pytest.mark.parametrize(
+    "fname",
+    ["GLOBAL_000_soilchemistry-daily.txt", "GLOBAL_002_soilchemistry-daily.txt.gz"],
+)
+def test_read_table_mmap(ldndc_dir, fname):
+    df_pandas = read_table(ldndc_dir / fname, datacols)
+    df_mmap = read_table(ldndc_dir / fname, datacols, engine="mmap")
+    df_pandas["datetime"] = df_pandas.datetime.astype("datetime64[D]")
+    df_mmap["datetime"] = df_mmap.datetime.astype("datetime64[D]")
+    pd.testing.assert_frame_equal(df_mmap, df_pandas)
+
+
+def test_read_table_mmap_float32(ldndc_dir):
+    fname = ldndc_dir / "GLOBAL_000_soilchemistry-daily.txt"
+    dtypes = {datacols[0]: "float32"}
+    df = read_table(fname, datacols, dtypes, engine="mmap")
+    assert df[datacols[0]].dtype == "float32"
+    pd.testing.assert_series_equal(
+        df[datacols[0]], read_table(fname, datacols, dtypes)[datacols[0]]
+    )
+
+
+def test_read_table_mmap_missing_column(ldndc_dir):
+    with pytest.raises(ValueError):
+        read_table(
+            ldndc_dir / "GLOBAL_000_soilchemistry-daily.txt",
+            ["dN_no_emis[kgNha-1]"],
+            engine="mmap",
+        )
+
+
+def test_read_table_mmap_irregular(tmp_path):
+    lines = [
+        "datetime\tid\ta\tb",
+        "2000-01-01 00:00:00\t1\t1.5\t-2",
+        "2000-01-02 00:00:00\t1\t1e-3\t",
+        "2000-01-03 00:00:00\t1\t.25\tnan",
+        "2000-01-04 00:00:00\t1\t7\t8\t9",
+        "2000-01-05 00:00:00\t2\t-0.125\t3",
+    ]
+    fname = tmp_path / "irregular.txt"
+    fname.write_text("\n".join(lines))
+    blocks = list(_iter_mmap(fname, ["a", "b"], {}, block_size=40))
+    assert len(blocks) > 1
+
+    df = pd.concat(blocks, ignore_index=True)
+    expected = read_table(fname, ["a", "b"])
+    expected["datetime"] = pd.to_datetime(expected.datetime).dt.floor("D")
+    pd.testing.assert_frame_equal(df, expected)
+    assert df.a.tolist() == [1.5, 1e-3, 0.25, 7, -0.125]
+
+
+def test_open_gzip_without_rapidgzip(ldndc_dir, monkeypatch):
+    monkeypatch.setitem(sys.modules, "rapidgzip", None)
+    fname = ldndc_dir / "GLOBAL_002_soilchemistry-daily.txt.gz"
+    with open_gzip(fname) as f:
+        data = f.read()
+    with gzip.open(fname, "rb") as f:
+        assert data == f.read()
+    assert not (ldndc_dir / f"{fname.name}{GZINDEX}").exists()
+
+
+class GzipStub(gzip.GzipFile):
+    """ rapidgzip file of the stub module (gzip with a fake seek index) """
+
+    imported = []
+    threads = []
+
+    def __init__(self, fname, parallelization):
+        super().__init__(fname, "rb")
+        self.threads.append(parallelization)
+
+    def export_index(self, f):
+        f.write(b"index")
+
+    def import_index(self, f):
+        self.imported.append(f.read())
+
+
+def test_open_gzip_index(ldndc_dir, monkeypatch):
+    stub = SimpleNamespace(open=GzipStub)
+    monkeypatch.setitem(sys.modules, "rapidgzip", stub)
+    monkeypatch.setattr(GzipStub, "imported", [])
+    fname = ldndc_dir / "GLOBAL_002_soilchemistry-daily.txt.gz"
+    index = ldndc_dir / f"{fname.name}{GZINDEX}"
+    with gzip.open(fname, "rb") as f:
+        expected = f.read()
+
+    # index written after the first read, used by the next one
+    for imported in [[], [b"index"]]:
+        with open_gzip(fname) as f:
+            assert f.read() == expected
+        assert index.read_bytes() == b"index"
+        assert GzipStub.imported == imported
+
+    # index older than the file is not used (and replaced)
+    index.write_bytes(b"stale")
+    os.utime(index, (0, 0))
+    with open_gzip(fname) as f:
+        assert f.read() == expected
+    assert GzipStub.imported == [b"index"]
+    assert index.read_bytes() == b"index"
+
+
+@pytest.mark.parametrize("engine", ["pandas", ARROW])
+def test_read_table_threads(ldndc_dir, monkeypatch, engine):
+    monkeypatch.setitem(sys.modules, "rapidgzip", SimpleNamespace(open=GzipStub))
+    monkeypatch.setattr(GzipStub, "threads", [])
+    monkeypatch.setattr(os, "cpu_count", lambda: 8)
+    assert [gzip_threads(n) for n in [1, 3, 16]] == [8, 2, 1]
+
+    fname = ldndc_dir / "GLOBAL_002_soilchemistry-daily.txt.gz"
+    read_table(fname, datacols, engine=engine)
+    read_table(fname, datacols, engine=engine, threads=gzip_threads(4))
+    list(iter_table(fname, datacols, 10, engine=engine, threads=1))
+    assert GzipStub.threads == [8, 2, 1]
+
+
+@pytest.mark.parametrize("engine", ["pandas", ARROW])
+def test_read_table_gzindex(ldndc_dir, engine):
+    pytest.importorskip("rapidgzip")
+    fname = ldndc_dir / "GLOBAL_002_soilchemistry-daily.txt.gz"
+    index = ldndc_dir / f"{fname.name}{GZINDEX}"
+    df = read_table(fname, datacols, engine=engine)
+    assert index.exists()
+    pd.testing.assert_frame_equal(read_table(fname, datacols, engine=engine), df)
+
+
+@pytest.mark.parametrize("engine", ["pandas", ARROW, "mmap"])
+def test_iter_table(ldndc_dir, engine):
+    fname = ldndc_dir / "GLOBAL_000_soilchemistry-daily.txt"
+    df = pd.concat(iter_table(fname, datacols, 10, engine=engine))
+    pd.testing.assert_frame_equal(
+        df.reset_index(drop=True), read_table(fname, datacols, engine=engine)
+    )
+
+
+@requires_arrow
+def test_read_ldndc_txt_arrow_identical(ldndc_dir, var_data):
+    years = range(2000, 2003)
+    _, expected = read_ldndc_txt(ldndc_dir, var_data, years)
+    _, df = read_ldndc_txt(ldndc_dir, var_data, years, engine="arrow")
+    pd.testing.assert_frame_equal(df, expected)
+    for yr, _, df_yr in iter_ldndc_years(ldndc_dir, var_data, years, engine="arrow"):
+        pd.testing.assert_frame_equal(
+            df_yr, expected[expected.time.dt.year == yr].reset_index(drop=True)
+        )
+
+
+@pytest.mark.parametrize("suffix", [".txt", ".txt.gz"])
+@pytest.mark.parametrize("block_size", [8, 1 << 16])
+def test_last_day(tmp_path, suffix, block_size):
+    header = "datetime\tid\ta\n"
+    rows = "2000-01-01 00:00:00\t1\t2\n2000-12-31 00:00:00\t1\t3\n"
+    for text, expected in [
+        (header + rows, "2000-12-31"),
+        # incomplete last line of a running simulation
+        (header + rows + "2001-01-01 00:0", "2000-12-31"),
+        (header, None),
+        (header + "2000-01", None),
+    ]:
+        fname = tmp_path / f"GLOBAL_000_soilchemistry-daily{suffix}"
+        if suffix == ".txt.gz":
+            with gzip.open(fname, "wt") as f:
+                f.write(text)
+        else:
+            fname.write_text(text)
+        day = last_day(fname, block_size=block_size)
+        assert day == (None if expected is None else np.datetime64(expected))
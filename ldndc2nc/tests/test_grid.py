@@ -0,0 +1,131 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from ldndc2nc.grid import GridIndex, expand_landpoints, grid_cache
+from ldndc2nc.ldndc2nc import _read_grid, create_id_mapper
+
+
+@pytest.fixture
+def cell_ids():
+    ids = np.array([[np.nan, 3, 1], [2, np.nan, np.nan]])
+    return xr.DataArray(
+        ids, dims=("lat", "lon"), coords={"lat": [1.5, 0.5], "lon": [10, 11, 12]}
+    )
+
+
+def test_grid_index(cell_ids):
+    grid = GridIndex.from_cell_ids(cell_ids)
+    assert grid.shape == (2, 3)
+    assert list(grid.ids) == [1, 2, 3]
+    ilat, ilon = grid.locate(np.array([3, 1, 1, 2]))
+    assert list(ilat) == [0, 0, 0, 1]
+    assert list(ilon) == [1, 2, 2, 0]
+
+
+@pytest.mark.parametrize("ids", [[4], [0], [1, 5]])
+def test_grid_index_unknown_ids(cell_ids, ids):
+    with pytest.raises(KeyError):
+        GridIndex.from_cell_ids(cell_ids).locate(np.array(ids))
+
+
+def test_create_id_mapper(cell_ids):
+    assert create_id_mapper(cell_ids) == {
+        1: (1.5, 12),
+        2: (0.5, 10),
+        3: (1.5, 11),
+    }
+
+
+def test_scatter_matches_reindex(cell_ids):
+    days = pd.date_range(start="1/1/2000", end="1/10/2000")
+    df = pd.DataFrame(
+        {
+            "id": [1, 2, 3, 1, 3],
+            "time": days[[0, 0, 0, 5, 9]],
+            "dN_n2o_emis": [0.1, 0.2, 0.3, 0.4, 0.5],
+        }
+    )
+    ds = GridIndex.from_cell_ids(cell_ids).scatter(df, days)
+
+    mapper = create_id_mapper(cell_ids)
+    df["lat"], df["lon"] = zip(*df.id.map(mapper))
+    expected = xr.Dataset.from_dataframe(
+        df.drop("id", axis=1).set_index(["time", "lat", "lon"])
+    ).reindex({"time": days, "lat": cell_ids.lat, "lon": cell_ids.lon})
+    xr.testing.assert_identical(ds, expected)
+
+
+def test_scatter_gapfill(cell_ids):
+    days = pd.date_range(start="1/1/2000", end="1/10/2000")
+    df = pd.DataFrame(
+        {"id": [1, 3], "time": days[[0, 5]], "dN_fertilizer": [10.0, np.nan]}
+    )
+    grid = GridIndex.from_cell_ids(cell_ids)
+    assert grid.mask.tolist() == [[False, True, True], [True, False, False]]
+
+    values = grid.scatter(df, days, gapfill=True).dN_fertilizer.values
+    assert values[0, 0, 2] == 10.0
+    assert np.isnan(values[5, 0, 1])
+    # missing days of simulated cells are zero, other cells keep NaN
+    assert (values[:, grid.mask] == 0).sum() == 10 * 3 - 2
+    assert np.isnan(values[:, ~grid.mask]).all()
+
+
+@pytest.mark.parametrize("gapfill", [False, True])
+def test_gather_expands_to_scatter(cell_ids, gapfill):
+    days = pd.date_range(start="1/1/2000", end="1/10/2000")
+    df = pd.DataFrame(
+        {
+            "id": [1, 2, 3, 1, 3],
+            "time": days[[0, 0, 0, 5, 9]],
+            "dN_n2o_emis": [0.1, 0.2, 0.3, 0.4, 0.5],
+        }
+    )
+    grid = GridIndex.from_cell_ids(cell_ids)
+    ds = grid.gather(df, days, gapfill=gapfill)
+
+    assert ds.dN_n2o_emis.dims == ("time", "landpoint")
+    assert ds.landpoint.values.tolist() == [1, 2, 3]
+    assert ds.landpoint.attrs["compress"] == "lat lon"
+    xr.testing.assert_identical(
+        expand_landpoints(ds), grid.scatter(df, days, gapfill=gapfill)
+    )
+
+
+def test_scatter_days_with_gaps(cell_ids):
+    span = pd.date_range(start="1/1/2000", end="1/10/2000")
+    days = span[[0, 1, 2, 7, 8, 9]]
+    df = pd.DataFrame(
+        {
+            "id": [1, 2, 3, 1, 3],
+            "time": span[[0, 2, 5, 7, 9]],
+            "dN_n2o_emis": [0.1, 0.2, 0.3, 0.4, 0.5],
+        }
+    )
+    grid = GridIndex.from_cell_ids(cell_ids)
+    xr.testing.assert_identical(
+        grid.scatter(df, days), grid.scatter(df, span).sel(time=days)
+    )
+
+
+def test_grid_cache(tmp_path, cell_ids):
+    reffile = tmp_path / "refdata.nc"
+    cell_ids.rename("cid").to_dataset().to_netcdf(reffile)
+    entry = grid_cache(reffile, "cid")
+    assert entry.parent == tmp_path / "refdata.nc.gridindex"
+    assert GridIndex.load(entry) is None
+
+    grid = _read_grid((str(reffile), "cid"))
+    assert entry.is_dir()
+    cached = _read_grid((str(reffile), "cid"))
+    assert isinstance(cached.ids, np.memmap)
+    for name in ["ids", "ilat", "ilon", "lats", "lons", "mask", "points", "ipoint"]:
+        np.testing.assert_array_equal(getattr(cached, name), getattr(grid, name))
+
+    # changed refdata get a new entry (and the old one is removed)
+    cell_ids.where(cell_ids != 2).rename("cid").to_dataset().to_netcdf(reffile)
+    assert grid_cache(reffile, "cid") != entry
+    assert list(_read_grid((str(reffile), "cid")).ids) == [1, 3]
+    assert [e.name for e in entry.parent.iterdir()] == [grid_cache(reffile, "cid").name]
@@ -0,0 +1,77 @@
+import weakref
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from ldndc2nc.cli import batch_main
+from ldndc2nc.grid import GridIndex
+from ldndc2nc.ldndc2nc import _year_dataset, read_ldndc_txt
+from ldndc2nc.synthetic import generate
+
+pytest.importorskip("dask")
+
+from ldndc2nc import lazy  # noqa: E402 isort:skip
+
+
+@pytest.fixture
+def grid():
+    ids = np.array([[1, 2, np.nan], [3, 4, 5]])
+    cell_ids = xr.DataArray(
+        ids, dims=("lat", "lon"), coords={"lat": [1.5, 0.5], "lon": [10, 11, 12]}
+    )
+    return GridIndex.from_cell_ids(cell_ids)
+
+
+def test_lazy_identical(tmp_path, ldndc_dir, var_data, grid):
+    config = SimpleNamespace(variables=var_data["soilchemistry-daily.txt"])
+    years = range(2000, 2003)
+    _, df = read_ldndc_txt(ldndc_dir, var_data, years)
+    _, yearly = lazy.read_ldndc_txt_lazy(ldndc_dir, var_data, years, tmp_path)
+
+    for yr, df_yr in df.groupby(df.time.dt.year):
+        eager = _year_dataset(yr, df_yr, grid, config)
+        ds = lazy.lazy_year_dataset(yr, yearly[yr], grid, config)
+        assert ds.dN_n2o_emis.chunks is not None
+        xr.testing.assert_identical(ds.compute(scheduler="sync"), eager)
+
+
+@pytest.mark.parametrize("split", [False, True])
+def test_convert_lazy_bounded_memory(tmp_path, monkeypatch, split):
+    refdata, _ = generate(tmp_path / "in", 12, list(range(2000, 2005)), nfiles=2)
+    manifest = tmp_path / "jobs.yml"
+    manifest.write_text("- {indir: in, outdir: out}\n")
+    (tmp_path / "out").mkdir()
+
+    # files parsed and years of the parsed input held in memory whenever a
+    # year is loaded
+    splits, parsed, held = [], [], []
+    split_file, load_year = lazy._split_ldndc_file, lazy._load_year
+
+    def split_file_spy(fname, *args, **kwargs):
+        splits.append(fname)
+        return split_file(fname, *args, **kwargs)
+
+    def load_year_spy(*args, **kwargs):
+        df = load_year(*args, **kwargs)
+        parsed.append(weakref.ref(df))
+        held.append(
+            {
+                int(yr)
+                for ref in parsed
+                if ref() is not None
+                for yr in ref().time.dt.year.unique()
+            }
+        )
+        return df
+
+    monkeypatch.setattr(lazy, "_split_ldndc_file", split_file_spy)
+    monkeypatch.setattr(lazy, "_load_year", load_year_spy)
+    argv = [str(manifest), "-c", str(tmp_path / "in" / "ldndc2nc.conf")]
+    argv += ["-r", f"{refdata},cid", "-y", "2000-2004", "--dask"]
+    assert batch_main(argv + (["-s"] if split else [])) is None
+    files = sorted((tmp_path / "in").glob("GLOBAL_*"))
+    assert sorted(splits) == files
+    assert len(parsed) == 5
+    assert max(len(years) for years in held) == 1
@@ -0,0 +1,75 @@
+import pytest
+import xarray as xr
+
+from ldndc2nc.cli import batch_main, merge_main
+from ldndc2nc.ldndc2nc import _select_files
+from ldndc2nc.merge import find_partials, parse_shard, shard_outfile
+from ldndc2nc.synthetic import generate
+
+
+def test_parse_shard():
+    assert parse_shard("0/4") == (0, 4)
+    assert parse_shard("3/4") == (3, 4)
+    for value in ["4/4", "-1/4", "1", "a/b", "1/2/3"]:
+        with pytest.raises(ValueError):
+            parse_shard(value)
+
+
+def test_select_files_shard(tmp_path):
+    for fileno in range(5):
+        (tmp_path / f"GLOBAL_{fileno:03d}_soilchemistry-daily.txt").touch()
+    shards = [
+        [
+            f.name[7:10]
+            for f in _select_files(tmp_path, "soilchemistry-daily.txt", shard=(i, 2))
+        ]
+        for i in range(2)
+    ]
+    assert shards == [["000", "002", "004"], ["001", "003"]]
+
+
+def test_find_partials(tmp_path):
+    outfile = tmp_path / "outfile.nc"
+    with pytest.raises(FileNotFoundError):
+        find_partials(outfile)
+
+    for i in [0, 2]:
+        shard_outfile(outfile, (i, 3)).touch()
+    (tmp_path / "outfile_shard0of3_monthly.nc").touch()
+    with pytest.raises(FileNotFoundError):
+        find_partials(outfile)
+
+    shard_outfile(outfile, (1, 3)).touch()
+    assert [p.name for p in find_partials(outfile)] == [
+        "outfile_shard0of3.nc",
+        "outfile_shard1of3.nc",
+        "outfile_shard2of3.nc",
+    ]
+
+    shard_outfile(outfile, (0, 2)).touch()
+    with pytest.raises(ValueError):
+        find_partials(outfile)
+
+
+@pytest.mark.parametrize("layout", ["grid", "landpoints"])
+def test_merge_identical(tmp_path, layout):
+    refdata, _ = generate(tmp_path / "in", 12, [2000, 2001], nfiles=3)
+    conf = str(tmp_path / "in" / "ldndc2nc.conf")
+    manifest = tmp_path / "jobs.yml"
+    for outdir in ["out", "ref"]:
+        (tmp_path / outdir).mkdir()
+
+    argv = ["-c", conf, "-r", f"{refdata},cid", "-y", "2000-2001", "--stream"]
+    argv += ["--layout", layout, "--aggregate", "monthly"]
+    manifest.write_text("- {indir: in, outdir: ref}\n")
+    assert batch_main([str(manifest)] + argv) is None
+    manifest.write_text("- {indir: in, outdir: out}\n")
+    for i in range(3):
+        assert batch_main([str(manifest), "--shard", f"{i}/3"] + argv) is None
+
+    merge_main([str(tmp_path / "out"), "-c", conf, "--aggregate", "monthly"])
+
+    for fname in ["outfile.nc", "outfile_monthly.nc"]:
+        with xr.open_dataset(tmp_path / "out" / fname, mask_and_scale=False) as ds:
+            with xr.open_dataset(tmp_path / "ref" / fname, mask_and_scale=False) as ref:
+                assert ds.identical(ref)
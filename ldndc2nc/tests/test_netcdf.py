@@ -0,0 +1,272 @@
+import os
+from types import SimpleNamespace
+
+import netCDF4
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from ldndc2nc.cli import batch_main
+from ldndc2nc.grid import GridIndex
+from ldndc2nc.ldndc2nc import (
+    _append_netcdf,
+    _netcdf_years,
+    _select_years,
+    _write_netcdf,
+    _year_dataset,
+    _years_dataset,
+    _YearWriter,
+    read_ldndc_txt,
+)
+from ldndc2nc.options import output_options
+from ldndc2nc.synthetic import generate
+from ldndc2nc.variable import Variable
+
+config = SimpleNamespace(global_info={"author": "test"}, variables=[])
+
+
+def year_dataset(yr):
+    days = pd.date_range(start=f"1/1/{yr}", end=f"12/31/{yr}")
+    data = np.random.random((len(days), 3, 4))
+    data[:, 0, 0] = np.nan
+    ds = xr.Dataset(
+        {"dN_n2o_emis": (("time", "lat", "lon"), data)},
+        coords={"time": days, "lat": [1.5, 1.0, 0.5], "lon": [0.0, 1.0, 2.0, 3.0]},
+    )
+    ds.dN_n2o_emis.attrs["units"] = "kgNha-1"
+    return ds
+
+
+def test_append_netcdf(tmp_path):
+    years = [year_dataset(yr) for yr in [2000, 2001, 2002]]
+    _write_netcdf(years[0], tmp_path / "stream.nc", config, unlimited=True)
+    for ds in years[1:]:
+        _append_netcdf(ds, tmp_path / "stream.nc")
+    _write_netcdf(xr.concat(years, dim="time"), tmp_path / "full.nc", config)
+
+    with xr.open_dataset(tmp_path / "stream.nc") as stream, xr.open_dataset(
+        tmp_path / "full.nc"
+    ) as full:
+        xr.testing.assert_identical(stream, full)
+
+
+def test_write_netcdf_packed(tmp_path):
+    variables = [
+        Variable.from_config(
+            {"dN_n2o_emis[kgNha-1]": {"dtype": "int16", "scale_factor": 0.001}}
+        )
+    ]
+    packed_config = SimpleNamespace(global_info={}, variables=variables)
+    ds = year_dataset(2000)
+    _write_netcdf(ds, tmp_path / "packed.nc", packed_config, unlimited=True)
+    _append_netcdf(year_dataset(2001), tmp_path / "packed.nc")
+
+    with xr.open_dataset(tmp_path / "packed.nc", mask_and_scale=False) as raw:
+        assert raw.dN_n2o_emis.dtype == "int16"
+        assert raw.dN_n2o_emis.attrs["_FillValue"] == -9999
+    with xr.open_dataset(tmp_path / "packed.nc") as packed:
+        unpacked = packed.dN_n2o_emis.isel(time=slice(0, 366))
+        xr.testing.assert_allclose(unpacked, ds.dN_n2o_emis, atol=0.0005)
+        assert packed.dN_n2o_emis.isnull().sum() == 366 + 365
+
+
+def test_netcdf_years(tmp_path):
+    _write_netcdf(year_dataset(2000), tmp_path / "stream.nc", config, unlimited=True)
+    _append_netcdf(year_dataset(2001), tmp_path / "stream.nc")
+    assert _netcdf_years(tmp_path / "stream.nc") == [2000, 2001]
+
+    _write_netcdf(year_dataset(2000), tmp_path / "fixed.nc", config)
+    with pytest.raises(SystemExit):
+        _netcdf_years(tmp_path / "fixed.nc")
+
+
+def test_append_netcdf_missing_variable(tmp_path):
+    _write_netcdf(year_dataset(2000), tmp_path / "stream.nc", config, unlimited=True)
+    ds = year_dataset(2001).rename({"dN_n2o_emis": "dN_no_emis"})
+    with pytest.raises(ValueError):
+        _append_netcdf(ds, tmp_path / "stream.nc")
+
+
+def append_args(tmp_path, split=False, append=True):
+    return SimpleNamespace(
+        indir=tmp_path,
+        outdir=tmp_path,
+        outfile="outfile.nc",
+        limiter="",
+        shard=None,
+        years=range(1999, 2003),
+        split=split,
+        append=append,
+        format="netcdf",
+    )
+
+
+def test_select_years_append(ldndc_dir, var_data):
+    cfg = SimpleNamespace(section=lambda s: var_data)
+    args = append_args(ldndc_dir)
+    # the input ends in January 2002 (incomplete)
+    assert _select_years(args, cfg) == [1999, 2000, 2001]
+
+    _write_netcdf(year_dataset(2000), ldndc_dir / "outfile.nc", config, unlimited=True)
+    assert _select_years(args, cfg) == [2001]
+    assert _select_years(append_args(ldndc_dir, append=False), cfg) == list(
+        range(1999, 2003)
+    )
+
+
+def test_select_years_append_split(ldndc_dir, var_data):
+    cfg = SimpleNamespace(section=lambda s: var_data)
+    args = append_args(ldndc_dir, split=True)
+    for yr in [2000, 2001]:
+        (ldndc_dir / f"outfile_{yr}.nc").write_text("")
+    assert _select_years(args, cfg) == [1999]
+
+    # yearly files older than the input are converted again
+    os.utime(ldndc_dir / "outfile_2001.nc", (0, 0))
+    assert _select_years(args, cfg) == [1999, 2001]
+
+
+@pytest.mark.parametrize("layout", ["grid", "landpoints"])
+def test_years_dataset_matches_concat(ldndc_dir, var_data, layout):
+    cfg = SimpleNamespace(variables=var_data["soilchemistry-daily.txt"])
+    ids = np.array([[1, 2, np.nan], [3, 4, 5]])
+    grid = GridIndex.from_cell_ids(
+        xr.DataArray(
+            ids, dims=("lat", "lon"), coords={"lat": [1.5, 0.5], "lon": [10, 11, 12]}
+        )
+    )
+    # years with a gap (no data of 2001)
+    _, df = read_ldndc_txt(ldndc_dir, var_data, [2000, 2002])
+
+    expected = xr.concat(
+        [
+            _year_dataset(yr, df_yr, grid, cfg, layout)
+            for yr, df_yr in df.groupby(df.time.dt.year)
+        ],
+        dim="time",
+    )
+    ds = _years_dataset([2000, 2002], df, grid, cfg, layout)
+    xr.testing.assert_identical(ds, expected)
+
+
+@pytest.mark.parametrize(
+    "fmt, output, expected",
+    [
+        (None, None, ("netcdf", True)),
+        (None, {"format": "zarr", "consolidated": False}, ("zarr", False)),
+        ("netcdf", {"format": "zarr"}, ("netcdf", True)),
+    ],
+)
+def test_output_options(fmt, output, expected):
+    args = SimpleNamespace(
+        format=fmt, aggregates=None, layout=None, chunking=None, chunk_size=None
+    )
+    output_options(args, SimpleNamespace(section=lambda s: output, variables=[]))
+    assert (args.format, args.consolidated) == expected
+
+
+@pytest.mark.parametrize(
+    "output",
+    [
+        {"format": "grib"},
+        {"formats": "zarr"},
+        {"chunking": "cube"},
+        {"layout": "sparse"},
+        {"aggregates": ["weekly"]},
+        {"codec": "lzma"},
+        {"codec": "zlib", "level": 12},
+        {"shuffle": "yes"},
+    ],
+)
+def test_output_options_invalid(output):
+    with pytest.raises(ValueError):
+        output_options(
+            SimpleNamespace(
+                format=None,
+                aggregates=None,
+                layout=None,
+                chunking=None,
+                chunk_size=None,
+            ),
+            SimpleNamespace(section=lambda s: output, variables=[]),
+        )
+
+
+@pytest.mark.parametrize("jobs, max_pending", [(2, None), (3, 1)])
+def test_year_writer_identical(tmp_path, jobs, max_pending):
+    years = [year_dataset(yr) for yr in [2000, 2001, 2002]]
+
+    def write(outdir, **kwargs):
+        outdir.mkdir()
+        args = SimpleNamespace(
+            outdir=outdir,
+            outfile="outfile.nc",
+            format="netcdf",
+            chunking="balanced",
+            chunk_size=2 ** 20,
+            codec="zlib",
+            level=5,
+            shuffle=True,
+            aggregates=[],
+            jobs=kwargs.get("jobs", 1),
+        )
+        with _YearWriter(config, args, **kwargs) as writer:
+            for ds in years:
+                writer.write(ds.time.dt.year.values[0], ds)
+            assert len(writer.pending) <= (max_pending or jobs)
+
+    write(tmp_path / "serial")
+    write(tmp_path / "parallel", jobs=jobs, max_pending=max_pending)
+    for yr in [2000, 2001, 2002]:
+        serial = (tmp_path / "serial" / f"outfile_{yr}.nc").read_bytes()
+        assert (tmp_path / "parallel" / f"outfile_{yr}.nc").read_bytes() == serial
+
+
+@pytest.mark.parametrize(
+    "options, unlimited", [([], False), (["--stream"], True), (["--append"], True)]
+)
+def test_output_time_dimension(tmp_path, options, unlimited):
+    refdata, _ = generate(tmp_path / "in", 12, [2000, 2001], nfiles=1)
+    manifest = tmp_path / "jobs.yml"
+    manifest.write_text("- {indir: in, outdir: out}\n")
+    (tmp_path / "out").mkdir()
+    argv = [str(manifest), "-c", str(tmp_path / "in" / "ldndc2nc.conf")]
+    argv += ["-r", f"{refdata},cid", "--aggregate", "monthly"] + options
+
+    assert batch_main(argv + ["-y", "2000"]) is None
+    for fname in ["outfile.nc", "outfile_monthly.nc"]:
+        with netCDF4.Dataset(tmp_path / "out" / fname) as nc:
+            assert nc.dimensions["time"].isunlimited() == unlimited
+
+    if "--append" in options:
+        assert batch_main(argv + ["-y", "2000-2001"]) is None
+        with netCDF4.Dataset(tmp_path / "out" / "outfile_monthly.nc") as nc:
+            assert len(nc.dimensions["time"]) == 24
+        assert _netcdf_years(tmp_path / "out" / "outfile.nc") == [2000, 2001]
+
+
+def test_append_running_simulation(tmp_path):
+    refdata, _ = generate(tmp_path / "in", 12, [2000, 2001], nfiles=2)
+    conf = str(tmp_path / "in" / "ldndc2nc.conf")
+    options = ["-c", conf, "-r", f"{refdata},cid", "-y", "2000-2001"]
+    for outdir in ["out", "ref"]:
+        (tmp_path / f"{outdir}.yml").write_text(f"- {{indir: in, outdir: {outdir}}}\n")
+        (tmp_path / outdir).mkdir()
+
+    # daily files written up to a (cut) line in June 2001
+    complete = {}
+    for fname in (tmp_path / "in").glob("GLOBAL_*-daily.txt"):
+        text = complete[fname] = fname.read_text()
+        fname.write_text(text[: text.index("2001-06-15")] + "2001")
+    assert batch_main([str(tmp_path / "out.yml"), "--append"] + options) is None
+    assert _netcdf_years(tmp_path / "out" / "outfile.nc") == [2000]
+
+    # the incomplete year is appended once the simulation is done
+    for fname, text in complete.items():
+        fname.write_text(text)
+    assert batch_main([str(tmp_path / "out.yml"), "--append"] + options) is None
+    assert batch_main([str(tmp_path / "ref.yml")] + options) is None
+    with xr.open_dataset(tmp_path / "out" / "outfile.nc") as ds:
+        with xr.open_dataset(tmp_path / "ref" / "outfile.nc") as ref:
+            assert ds.identical(ref)
@@ -0,0 +1,72 @@
+import json
+import sys
+
+import pytest
+
+from ldndc2nc import profiler
+from ldndc2nc.ldndc2nc import read_ldndc_txt
+
+
+@pytest.fixture
+def active():
+    yield profiler.enable(hot_stage="parse")
+    profiler.disable()
+
+
+def test_stage_disabled():
+    with profiler.stage("parse") as record:
+        record["rows"] = 1
+    assert profiler.active() is None
+
+
+@pytest.mark.parametrize("resource", [True, False])
+def test_rss_without_procfs(monkeypatch, resource):
+    def no_procfs(fname):
+        raise FileNotFoundError(fname)
+
+    monkeypatch.setattr(profiler, "open", no_procfs, raising=False)
+    if not resource:
+        # Windows
+        monkeypatch.setitem(sys.modules, "resource", None)
+        assert profiler._rss() == 0
+    elif sys.platform != "win32":
+        assert profiler._rss() > 0
+
+
+def test_stage_records(active):
+    with profiler.labels(file_type="soilchemistry-daily.txt"):
+        with profiler.stage("parse", year=2000) as record:
+            record["rows"] = 10
+    with profiler.stage("write"):
+        pass
+
+    parse, write = active.records
+    assert parse["stage"] == "parse"
+    assert parse["file_type"] == "soilchemistry-daily.txt"
+    assert parse["year"] == 2000
+    assert parse["rows"] == 10
+    assert parse["wall"] >= 0 and parse["cpu"] >= 0 and parse["peak_rss_mb"] > 0
+    assert "file_type" not in write
+
+    summary = active.summary("year")
+    assert list(summary) == ["2000"]
+    assert summary["2000"]["parse"]["rows"] == 10
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_profile_read_ldndc_txt(ldndc_dir, var_data, active, tmp_path, jobs):
+    read_ldndc_txt(ldndc_dir, var_data, range(2000, 2002), jobs=jobs)
+
+    summary = active.summary()
+    assert summary["parse"]["count"] == 3
+    # one compressed file
+    assert summary["decompress"]["count"] == 1
+    assert summary["decompress"]["wall"] <= summary["parse"]["wall"]
+    assert summary["sort"]["rows"] == 5 * 31 * 2
+    assert summary["combine"]["count"] == 1
+    assert set(active.summary("file_type")) == {"soilchemistry-daily.txt"}
+
+    active.write(tmp_path / "profile.json")
+    report = json.loads((tmp_path / "profile.json").read_text())
+    assert report["stages"]["parse"]["count"] == 3
+    assert (tmp_path / "profile.prof").is_file()
@@ -0,0 +1,114 @@
+import pandas as pd
+import pytest
+
+import ldndc2nc.ldndc2nc
+from ldndc2nc.engines import iter_table
+from ldndc2nc.ldndc2nc import (
+    _iter_ldndc_file_years,
+    _read_ldndc_file,
+    iter_ldndc_years,
+    read_ldndc_txt,
+)
+
+
+def test_read_ldndc_txt(ldndc_dir, var_data):
+    varnames, df = read_ldndc_txt(ldndc_dir, var_data, range(2001, 2003))
+    assert varnames == ["dC_co2_emis", "dN_n2o_emis"]
+    assert set(df.id) == {1, 2, 3, 4, 5}
+    assert set(df.time.dt.year) == {2001, 2002}
+    assert len(df) == 5 * 31 * 2
+
+
+@pytest.mark.parametrize("jobs", [2, 4])
+def test_read_ldndc_txt_parallel_identical(ldndc_dir, var_data, jobs):
+    serial = read_ldndc_txt(ldndc_dir, var_data, range(2000, 2002))
+    parallel = read_ldndc_txt(ldndc_dir, var_data, range(2000, 2002), jobs=jobs)
+    assert serial[0] == parallel[0]
+    pd.testing.assert_frame_equal(serial[1], parallel[1])
+
+
+def test_iter_ldndc_years(ldndc_dir, var_data):
+    years = range(2000, 2003)
+    _, df = read_ldndc_txt(ldndc_dir, var_data, years)
+    yearly = list(iter_ldndc_years(ldndc_dir, var_data, years))
+    assert [yr for yr, _, _ in yearly] == list(years)
+    for yr, _, df_yr in yearly:
+        expected = df[df.time.dt.year == yr].reset_index(drop=True)
+        pd.testing.assert_frame_equal(df_yr, expected)
+
+
+@pytest.mark.parametrize("chunksize", [1, 7, 1000])
+def test_iter_ldndc_file_years_chunks(ldndc_dir, chunksize):
+    fname = ldndc_dir / "GLOBAL_000_soilchemistry-daily.txt"
+    cols = ["dN_n2o_emis[kgNha-1]"]
+    _, df = _read_ldndc_file(fname, cols, range(2000, 2003))
+    yearly = dict(
+        _iter_ldndc_file_years(fname, cols, [1999, 2001], chunksize=chunksize)
+    )
+    assert len(yearly[1999]) == 0
+    expected = df[df.time.dt.year == 2001]
+    pd.testing.assert_frame_equal(yearly[2001], expected)
+
+
+def test_read_ldndc_file_stops_after_last_year(ldndc_dir, monkeypatch):
+    parsed = []
+
+    def iter_table_spy(fname, datacols, chunksize, dtypes=None, **kwargs):
+        for chunk in iter_table(fname, datacols, 10, dtypes, **kwargs):
+            parsed.append(len(chunk))
+            yield chunk
+
+    monkeypatch.setattr(ldndc2nc.ldndc2nc, "iter_table", iter_table_spy)
+
+    fname = ldndc_dir / "GLOBAL_000_soilchemistry-daily.txt"
+    ids, df = _read_ldndc_file(fname, ["dN_n2o_emis[kgNha-1]"], [2000])
+    assert ids == [1, 3]
+    assert set(df.time.dt.year) == {2000}
+    assert len(df) == 2 * 31
+    assert sum(parsed) == 70  # 3 years in file, stop at first chunk of 2001
+
+
+def test_read_ldndc_txt_dtypes(ldndc_dir, var_data):
+    var_data["soilchemistry-daily.txt"][1].dtype = "float32"
+    _, df = read_ldndc_txt(ldndc_dir, var_data, range(2000, 2001))
+    assert df["dC_co2_emis"].dtype == "float64"
+    assert df["dN_n2o_emis"].dtype == "float32"
+
+
+HEADER = (
+    "datetime\tid\tarea[m2]\tdC_co2_emis_auto[kgCha-1]\t"
+    "dC_co2_emis_hetero[kgCha-1]\tdN_n2o_emis[kgNha-1]\n"
+)
+
+
+@pytest.mark.parametrize("engine", ["pandas", "mmap"])
+def test_iter_ldndc_file_years_header_only(tmp_path, engine):
+    fname = tmp_path / "GLOBAL_000_soilchemistry-daily.txt"
+    fname.write_text(HEADER)
+    cols = ["dN_n2o_emis[kgNha-1]"]
+    yearly = list(_iter_ldndc_file_years(fname, cols, [2000, 2001], engine=engine))
+    assert [yr for yr, _ in yearly] == [2000, 2001]
+    for _, df in yearly:
+        assert len(df) == 0
+        assert list(df.columns) == ["id", "time"] + cols
+
+
+def test_iter_ldndc_years_header_only_file(ldndc_dir, var_data):
+    # output of a simulation that is still running
+    years = range(2000, 2003)
+    expected = list(iter_ldndc_years(ldndc_dir, var_data, years))
+    (ldndc_dir / "GLOBAL_003_soilchemistry-daily.txt").write_text(HEADER)
+    yearly = list(iter_ldndc_years(ldndc_dir, var_data, years))
+    assert [yr for yr, _, _ in yearly] == list(years)
+    for (_, _, df), (_, _, df_expected) in zip(yearly, expected):
+        pd.testing.assert_frame_equal(df, df_expected)
+
+
+@pytest.mark.parametrize("engine", ["pandas", "arrow", "mmap"])
+def test_read_ldndc_file_header_only(tmp_path, engine):
+    if engine == "arrow":
+        pytest.importorskip("pyarrow")
+    fname = tmp_path / "GLOBAL_000_soilchemistry-daily.txt"
+    fname.write_text(HEADER)
+    with pytest.raises(SystemExit):
+        _read_ldndc_file(fname, ["dN_n2o_emis[kgNha-1]"], [2000], engine=engine)
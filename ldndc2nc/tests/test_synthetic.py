@@ -0,0 +1,22 @@
+import numpy as np
+import xarray as xr
+
+from ldndc2nc.ldndc2nc import read_ldndc_txt
+from ldndc2nc.synthetic import REPORT_INTERVAL, generate, variables
+
+
+def test_generate(tmp_path):
+    refdata, nrows = generate(tmp_path, 10, [2000, 2001], nfiles=3, compress=True)
+    assert nrows["soilchemistry-daily.txt"] == 10 * 731
+    assert nrows["report-fertilize.txt"] == 10 * len(range(0, 731, REPORT_INTERVAL))
+    assert len(list(tmp_path.glob("GLOBAL_00?_soilchemistry-daily.txt.gz"))) == 3
+    assert (tmp_path / "ldndc2nc.conf").is_file()
+
+    with xr.open_dataset(refdata) as refnc:
+        cid = refnc.cid.values
+    assert sorted(cid[~np.isnan(cid)]) == list(range(1, 11))
+
+    varnames, df = read_ldndc_txt(tmp_path, variables(), [2001])
+    assert "dC_co2_emis" in varnames
+    assert set(df.id) == set(range(1, 11))
+    assert len(df) == 10 * 365
@@ -101,3 +101,51 @@ def test_variable_text():
 def test_variable_text_full():
     v = Variable("dN_n_emis[kgNha-1]=dN_n2o_emis[kgNha-1]+dN_no_emis[kgNha-1]")
     assert v.text_full == "dN_n_emis[kgNha-1]=dN_n2o_emis[kgNha-1]+dN_no_emis[kgNha-1]"
+
+
+@pytest.mark.parametrize(
+    "entry,dtype,memory_dtype",
+    [
+        ("dN_n2o_emis[kgNha-1]", None, "float64"),
+        ({"dN_n2o_emis[kgNha-1]": {"dtype": "float32"}}, "float32", "float32"),
+        ({"dN_n2o_emis[kgNha-1]": {"dtype": "int16"}}, "int16", "float32"),
+        ({"dN_n2o_emis[kgNha-1]": {"dtype": "int32"}}, "int32", "float64"),
+        ({"dN_n2o_emis[kgNha-1]": {"codec": "zstd", "level": 3}}, None, "float64"),
+    ],
+)
+def test_variable_from_config(entry, dtype, memory_dtype):
+    v = Variable.from_config(entry)
+    assert v.name == "dN_n2o_emis"
+    assert v.dtype == dtype
+    assert v.memory_dtype == memory_dtype
+    assert v.config == entry
+
+
+@pytest.mark.parametrize(
+    "entry",
+    [
+        {"dN_n2o_emis[kgNha-1]": {"dtype": "uint64"}},
+        {"dN_n2o_emis[kgNha-1]": {"dtype": "float32", "scale_factor": 0.1}},
+        {"dN_n2o_emis[kgNha-1]": {"compression": "zlib"}},
+        {"dN_n2o_emis[kgNha-1]": {"codec": "lzma"}},
+        {"dN_n2o_emis[kgNha-1]": {"aggregate": "max"}},
+        {"dN_n2o_emis[kgNha-1]": None, "dN_no_emis[kgNha-1]": None},
+    ],
+)
+def test_variable_from_config_invalid(entry):
+    with pytest.raises(ValueError):
+        Variable.from_config(entry)
+
+
+def test_variable_packing():
+    v = Variable.from_config(
+        {
+            "dN_n_emis[kgNha-1]=dN_n2o_emis[kgNha-1]+dN_no_emis[kgNha-1]": {
+                "dtype": "int16",
+                "scale_factor": 0.01,
+                "add_offset": 0.0,
+            }
+        }
+    )
+    assert v.sources == ["dN_n2o_emis[kgNha-1]", "dN_no_emis[kgNha-1]"]
+    assert v.options == {"dtype": "int16", "scale_factor": 0.01, "add_offset": 0.0}
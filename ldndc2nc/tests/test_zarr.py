@@ -0,0 +1,79 @@
+from types import SimpleNamespace
+
+import pytest
+import xarray as xr
+
+from ldndc2nc.variable import Variable
+
+from .test_netcdf import year_dataset
+
+pytest.importorskip("zarr")
+
+from ldndc2nc.zarr_writer import (  # noqa: E402 isort:skip
+    append_zarr,
+    write_zarr,
+    zarr_years,
+)
+
+config = SimpleNamespace(global_info={"author": "test"}, variables=[])
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_write_zarr(tmp_path, jobs):
+    ds = year_dataset(2000)
+    ds["dC_co2_emis"] = ds.dN_n2o_emis * 2
+    write_zarr(ds, tmp_path / "out.zarr", config, jobs=jobs)
+
+    assert (tmp_path / "out.zarr" / ".zmetadata").is_file()
+    with xr.open_zarr(tmp_path / "out.zarr") as stored:
+        xr.testing.assert_identical(stored.load(), ds.assign_attrs(author="test"))
+        assert stored.dN_n2o_emis.encoding["chunks"] == (366, 3, 4)
+
+
+def test_write_zarr_packed(tmp_path):
+    variables = [
+        Variable.from_config(
+            {"dN_n2o_emis[kgNha-1]": {"dtype": "int16", "scale_factor": 0.001}}
+        )
+    ]
+    packed_config = SimpleNamespace(global_info={}, variables=variables)
+    ds = year_dataset(2000)
+    write_zarr(ds, tmp_path / "out.zarr", packed_config, consolidated=False)
+
+    assert not (tmp_path / "out.zarr" / ".zmetadata").exists()
+    with xr.open_zarr(tmp_path / "out.zarr", consolidated=False) as stored:
+        assert stored.dN_n2o_emis.encoding["dtype"] == "int16"
+        xr.testing.assert_allclose(stored.dN_n2o_emis, ds.dN_n2o_emis, atol=5e-4)
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_append_zarr(tmp_path, jobs):
+    years = [year_dataset(yr) for yr in [2000, 2001, 2002]]
+    for ds in years:
+        ds["dC_co2_emis"] = ds.dN_n2o_emis * 2
+    write_zarr(years[0], tmp_path / "out.zarr", config)
+    for ds in years[1:]:
+        append_zarr(ds, tmp_path / "out.zarr", jobs=jobs)
+
+    assert zarr_years(tmp_path / "out.zarr") == [2000, 2001, 2002]
+    with xr.open_zarr(tmp_path / "out.zarr") as stored:
+        expected = xr.concat(years, dim="time").assign_attrs(author="test")
+        xr.testing.assert_identical(stored.load(), expected)
+
+
+def test_append_zarr_missing_variable(tmp_path):
+    write_zarr(year_dataset(2000), tmp_path / "out.zarr", config)
+    ds = year_dataset(2001).rename({"dN_n2o_emis": "dC_co2_emis"})
+    with pytest.raises(ValueError):
+        append_zarr(ds, tmp_path / "out.zarr")
+
+
+@pytest.mark.parametrize("codec", ["zstd", "blosc-lz4", "none"])
+def test_write_zarr_codec(tmp_path, codec):
+    ds = year_dataset(2000)
+    write_zarr(ds, tmp_path / "out.zarr", config, options={"codec": codec})
+
+    with xr.open_zarr(tmp_path / "out.zarr") as stored:
+        xr.testing.assert_identical(stored.load(), ds.assign_attrs(author="test"))
+        compressor = stored.dN_n2o_emis.encoding["compressor"]
+    assert (compressor is None) == (codec == "none")
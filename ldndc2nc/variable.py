@@ -2,10 +2,34 @@
 """ldndc2nc.extra: extra module within the ldndc2nc package."""
 
 import logging
-from typing import List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple, Union
+
+from .aggregate import METHODS
+from .compression import CODECS
 
 log = logging.getLogger(__name__)
 
+# output dtypes supported by the netCDF4 classic data model and the float
+# dtype used to hold their (unpacked) values in memory
+DTYPES = {
+    "float64": "float64",
+    "float32": "float32",
+    "int32": "float64",
+    "int16": "float32",
+    "int8": "float32",
+}
+
+# options of a variable in the conf file
+OPTIONS = {
+    "dtype",
+    "scale_factor",
+    "add_offset",
+    "codec",
+    "level",
+    "shuffle",
+    "aggregate",
+}
+
 
 def identical(elements: List) -> bool:
     return all([e == elements[0] for e in elements])
@@ -47,7 +71,18 @@ def variables_compatible(s: str, src: List[str]) -> bool:
 
 
 class Variable:
-    def __init__(self, s: str, sources: Optional[str] = None):
+    def __init__(
+        self,
+        s: str,
+        sources: Optional[str] = None,
+        dtype: Optional[str] = None,
+        scale_factor: Optional[float] = None,
+        add_offset: Optional[float] = None,
+        codec: Optional[str] = None,
+        level: Optional[int] = None,
+        shuffle: Optional[bool] = None,
+        aggregate: Optional[str] = None,
+    ):
 
         if s.count("=") == 0:
             pass
@@ -65,6 +100,47 @@ class Variable:
             if not variables_compatible(s, self._sources):
                 raise ValueError("Trying to add incompatible columns")
 
+        if dtype is not None and dtype not in DTYPES:
+            raise ValueError(f"Variable {self.name} has unsupported dtype {dtype}")
+        self.dtype = dtype
+        self.scale_factor = scale_factor
+        self.add_offset = add_offset
+
+        packed = scale_factor is not None or add_offset is not None
+        if packed and not (dtype or "").startswith("int"):
+            raise ValueError(f"Variable {self.name} requires an int dtype for packing")
+
+        if codec is not None and codec not in CODECS:
+            raise ValueError(f"Variable {self.name} has unsupported codec {codec}")
+        self.codec = codec
+        self.level = level
+        self.shuffle = shuffle
+
+        if aggregate is not None and aggregate not in METHODS:
+            raise ValueError(
+                f"Variable {self.name} has unsupported aggregate {aggregate}"
+            )
+        self.aggregate = aggregate
+
+    @classmethod
+    def from_config(cls, entry: Union[str, Dict]) -> "Variable":
+        """ create variable from a conf file entry
+
+            An entry is either a variable line or a mapping of a variable
+            line to its options (dtype, scale_factor, add_offset, codec, level,
+            shuffle, aggregate).
+        """
+        if isinstance(entry, str):
+            return cls(entry)
+        if isinstance(entry, dict) and len(entry) == 1:
+            s, options = next(iter(entry.items()))
+            options = options or {}
+            unknown = set(options) - OPTIONS
+            if unknown:
+                raise ValueError(f"Unknown options for variable {s}: {unknown}")
+            return cls(s, **options)
+        raise ValueError(f"Variable entry is invalid:\n{entry}")
+
     def __repr__(self):
         return f"<var:{self.name}({self.unit})>"
 
@@ -78,6 +154,29 @@ class Variable:
         part2 = "=" + "+".join(self._sources) if self.is_composite else ""
         return part1 + part2
 
+    @property
+    def options(self) -> Dict:
+        options = {
+            "dtype": self.dtype,
+            "scale_factor": self.scale_factor,
+            "add_offset": self.add_offset,
+            "codec": self.codec,
+            "level": self.level,
+            "shuffle": self.shuffle,
+            "aggregate": self.aggregate,
+        }
+        return {k: v for k, v in options.items() if v is not None}
+
+    @property
+    def config(self) -> Union[str, Dict]:
+        """ conf file entry of variable """
+        return {self.text_full: self.options} if self.options else self.text_full
+
+    @property
+    def memory_dtype(self) -> str:
+        """ float dtype of the values while they are processed """
+        return DTYPES[self.dtype or "float64"]
+
     @property
     def sources(self) -> List[str]:
         return self._sources
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""ldndc2nc.zarr_writer: write datasets to zarr stores (variables in parallel)."""
+
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import xarray as xr
+
+from .compression import zarr_compression
+from .ldndc2nc import get_datavar_encodings
+
+log = logging.getLogger(__name__)
+
+try:
+    import zarr
+except ImportError:
+    raise ImportError(log.critical("Output format <zarr> requires zarr"))
+
+
+def zarr_encodings(ds, variables=None, **options):
+    """ zarr encodings of all data variables (same chunks and compression
+        as the netCDF output)
+
+        :param xr.Dataset ds: dataset to write
+        :param list variables: (optional) variables with output dtype and packing
+        :param options: options of get_datavar_encodings (chunking, compression)
+        :return: encoding per data variable
+        :rtype: dict
+    """
+    encodings = get_datavar_encodings(ds, variables, **options)
+    for v, encoding in encodings.items():
+        dtype = np.dtype(encoding.get("dtype", ds[v].dtype))
+        encoding["chunks"] = encoding.pop("chunksizes")
+        compressor, filters = zarr_compression(encoding, dtype.itemsize)
+        encoding["compressor"] = compressor
+        if filters:
+            encoding["filters"] = filters
+    return encodings
+
+
+def _write_variable(store, ds, encoding=None, region=None):
+    mode = "r+" if region else "a"
+    ds.to_zarr(store, mode=mode, encoding=encoding, region=region, consolidated=False)
+
+
+def _write_variables(store, ds, encodings=None, region=None, jobs=1):
+    """ write data variables (each one by a worker process) """
+    encodings = encodings or {}
+    items = [
+        (xr.Dataset({v: ds[v].variable}), {v: encodings[v]} if v in encodings else None)
+        for v in ds.data_vars
+    ]
+    if jobs > 1 and len(items) > 1:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(items))) as executor:
+            futures = [
+                executor.submit(_write_variable, store, *item, region=region)
+                for item in items
+            ]
+            for future in futures:
+                future.result()
+    else:
+        for item in items:
+            _write_variable(store, *item, region=region)
+
+
+def write_zarr(ds, store, config, jobs=1, consolidated=True, options=None):
+    """ write dataset to a new zarr store
+
+        :param xr.Dataset ds: dataset to write
+        :param Path store: zarr store (directory)
+        :param config: conf with global info and variables
+        :param int jobs: number of worker processes writing variables
+        :param bool consolidated: consolidate metadata of the store
+        :param dict options: (optional) options of get_datavar_encodings
+    """
+    store = str(store)
+    encodings = zarr_encodings(ds, config.variables, **(options or {}))
+    ds.drop_vars(list(ds.data_vars)).to_zarr(store, mode="w", consolidated=False)
+    _write_variables(store, ds, encodings, jobs=jobs)
+
+    zarr.open_group(store, mode="r+").attrs.update(config.global_info)
+    if consolidated:
+        zarr.consolidate_metadata(store)
+
+
+def write_zarr_delayed(ds, store, config, consolidated=True, options=None):
+    """ delayed write of a dask-backed dataset to a new zarr store
+
+        The dask chunks are aligned to the zarr chunks, so that no zarr chunk
+        is written by more than one task.
+
+        :return: delayed write
+        :rtype: Delayed
+    """
+    encodings = zarr_encodings(ds, config.variables, **(options or {}))
+    ds = ds.assign(
+        {
+            v: ds[v].chunk(dict(zip(ds[v].dims, encodings[v]["chunks"])))
+            for v in ds.data_vars
+        }
+    )
+    ds.attrs = config.global_info
+    return ds.to_zarr(
+        str(store),
+        mode="w",
+        encoding=encodings,
+        compute=False,
+        consolidated=consolidated,
+    )
+
+
+def append_zarr(ds, store, jobs=1, consolidated=True):
+    """ append dataset along the time dimension of an existing zarr store
+
+        :param xr.Dataset ds: dataset to write (same variables as store)
+        :param Path store: zarr store (directory)
+        :param int jobs: number of worker processes writing variables
+        :param bool consolidated: consolidate metadata of the store
+    """
+    store = str(store)
+    group = zarr.open_group(store, mode="r+")
+    missing = set(ds.data_vars).difference(k for k, _ in group.arrays())
+    if missing:
+        raise ValueError(log.critical(f"Vars {sorted(missing)} not in {store}"))
+
+    # extend all arrays along time, then write the new region
+    start = group["time"].shape[0]
+    for _, array in group.arrays():
+        dims = array.attrs["_ARRAY_DIMENSIONS"]
+        if "time" in dims:
+            shape = list(array.shape)
+            shape[dims.index("time")] += len(ds.time)
+            array.resize(*shape)
+
+    region = {"time": slice(start, start + len(ds.time))}
+    xr.Dataset(coords={"time": ds.time}).to_zarr(
+        store, region=region, consolidated=False
+    )
+    _write_variables(store, ds, region=region, jobs=jobs)
+
+    if consolidated:
+        zarr.consolidate_metadata(store)
+
+
+def zarr_years(store):
+    """ years in the time axis of an existing zarr store """
+    with xr.open_zarr(str(store), consolidated=False) as ds:
+        return sorted(set(ds.time.dt.year.values.tolist()))